@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator
+
+from app.config import settings
+from app.metrics import LLM_ADMISSIONS, LLM_QUEUE_WAIT
+
+# Served instead of a model answer when the service is overloaded.
+BUSY_REPLY = (
+    "We're helping a lot of people right now, so I can't give you a full answer this moment. "
+    "Please try again in a minute—I can still help with questions about our products or "
+    "connect you with the team."
+)
+
+
+class Overloaded(Exception):
+    """No LLM capacity for this call; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"LLM capacity exhausted ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent LLM calls globally and per model.
+
+    Calls beyond the caps wait in a queue of at most ``queue_size`` calls,
+    each for at most ``queue_timeout`` seconds. A full queue or an expired
+    wait raises ``Overloaded`` so the turn can be shed instead of piling
+    up behind the provider's rate limits.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int,
+        model_limits: dict[str, int],
+        queue_size: int,
+        queue_timeout: float,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.model_limits = model_limits
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._models: dict[str, asyncio.Semaphore] = {}
+        # Moving average of how long a call holds its slot.
+        self._avg_hold = 1.0
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore | None:
+        limit = self.model_limits.get(model)
+        if not limit:
+            return None
+        semaphore = self._models.get(model)
+        if semaphore is None:
+            semaphore = self._models[model] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def retry_after(self) -> float:
+        """Rough seconds until the current queue has drained."""
+        return float(max(1, math.ceil(self._avg_hold * (self.waiting + 1) / self.max_concurrency)))
+
+    async def _acquire(self, model_semaphore: asyncio.Semaphore | None) -> None:
+        if model_semaphore is not None:
+            await model_semaphore.acquire()
+        try:
+            await self._global.acquire()
+        except BaseException:
+            if model_semaphore is not None:
+                model_semaphore.release()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, model: str) -> AsyncIterator[None]:
+        model_semaphore = self._model_semaphore(model)
+        contended = self._global.locked() or (model_semaphore is not None and model_semaphore.locked())
+        if contended and self.waiting >= self.queue_size:
+            LLM_ADMISSIONS.inc(model=model, outcome="queue_full")
+            raise Overloaded("queue_full", self.retry_after())
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._acquire(model_semaphore), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            LLM_ADMISSIONS.inc(model=model, outcome="queue_timeout")
+            raise Overloaded("queue_timeout", self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - start, model=model)
+        LLM_ADMISSIONS.inc(model=model, outcome="queued" if contended else "admitted")
+
+        self.active += 1
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.perf_counter() - held)
+            self._global.release()
+            if model_semaphore is not None:
+                model_semaphore.release()
+
+
+class RateLimiter:
+    """Token buckets keyed by client, refilled at ``per_minute`` tokens.
+
+    Each key holds at most ``burst`` tokens. Only the ``max_keys`` most
+    recently seen keys are tracked; a forgotten key starts with a full
+    bucket, which is what an idle client would have anyway.
+    """
+
+    def __init__(self, *, per_minute: float, burst: int, max_keys: int = 100_000) -> None:
+        self.rate = per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, key: str) -> float:
+        """Take a token; returns 0 if allowed, else seconds until one is available."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+@lru_cache(maxsize=1)
+def get_llm_limiter() -> ConcurrencyLimiter:
+    return ConcurrencyLimiter(
+        max_concurrency=settings.llm_max_concurrency,
+        model_limits=settings.llm_model_concurrency,
+        queue_size=settings.llm_queue_size,
+        queue_timeout=settings.llm_queue_timeout_seconds,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(scope: str) -> RateLimiter:
+    """Token buckets for ``scope`` ("session" or "ip")."""
+    return RateLimiter(
+        per_minute=getattr(settings, f"rate_limit_{scope}_per_minute"),
+        burst=getattr(settings, f"rate_limit_{scope}_burst"),
+    )
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException
+
+from app.nodes.router import ROUTE_TRACE
+from app.tenants import SESSION_ID_RE
+
+
+@dataclass
+class BatchTurn:
+    message: str
+    # The assistant reply recorded with the transcript, for side-by-side diffs.
+    recorded_reply: str | None = None
+
+
+@dataclass
+class BatchSession:
+    session_id: str
+    turns: list[BatchTurn] = field(default_factory=list)
+
+
+def parse_batch(text: str, *, max_turns: int) -> list[BatchSession]:
+    """Group JSONL lines into sessions, keeping turn order.
+
+    A line is either one turn, ``{"session_id", "message"}``, or a whole
+    transcript, ``{"session_id", "messages": [...]}`` whose items are user
+    strings or ``{"role", "content"}`` dicts. Only user messages are sent;
+    an assistant message is kept as the recorded reply of the turn before
+    it. Lines with the same ``session_id`` continue one session. Raises
+    ``ValueError`` naming the offending line.
+    """
+    sessions: dict[str, BatchSession] = {}
+    total = 0
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"line {number}: invalid JSON ({exc.msg})") from None
+        if not isinstance(record, dict):
+            raise ValueError(f"line {number}: expected a JSON object")
+        session_id = str(record.get("session_id") or f"line-{number}")
+        if not SESSION_ID_RE.fullmatch(session_id):
+            raise ValueError(f"line {number}: session_id must be 1-256 characters without control characters")
+        session = sessions.setdefault(session_id, BatchSession(session_id))
+
+        items = record["messages"] if "messages" in record else [record.get("message")]
+        if not isinstance(items, list):
+            raise ValueError(f"line {number}: messages must be a list")
+        for item in items:
+            role, content = ("user", item) if not isinstance(item, dict) else (item.get("role"), item.get("content"))
+            if not isinstance(content, str) or not content.strip():
+                raise ValueError(f"line {number}: every message needs non-empty text")
+            if role == "user":
+                session.turns.append(BatchTurn(content))
+                total += 1
+            elif role == "assistant" and session.turns:
+                session.turns[-1].recorded_reply = content
+        if total > max_turns:
+            raise ValueError(f"line {number}: more than {max_turns} turns in one batch")
+    return [session for session in sessions.values() if session.turns]
+
+
+async def _replay_session(
+    session: BatchSession,
+    session_key: str,
+    run_turn: Callable[[str, str], Awaitable[Any]],
+    emit: Callable[[dict[str, Any]], None],
+) -> None:
+    for index, turn in enumerate(session.turns):
+        trace: list[tuple[str, str]] = []
+        token = ROUTE_TRACE.set(trace)
+        start = time.perf_counter()
+        result: dict[str, Any] = {"session_id": session.session_id, "turn": index, "message": turn.message}
+        try:
+            response = await run_turn(session_key, turn.message)
+        except HTTPException as exc:
+            result.update(error=exc.detail, status=exc.status_code)
+        except Exception as exc:
+            result.update(error=str(exc) or type(exc).__name__, status=500)
+        else:
+            result.update(reply=response.reply, lead_status=response.lead_status, degraded=response.degraded)
+        finally:
+            ROUTE_TRACE.reset(token)
+        intent, source = trace[-1] if trace else (None, None)
+        result.update(route=intent, route_source=source, latency_ms=round((time.perf_counter() - start) * 1000, 1))
+        if turn.recorded_reply is not None:
+            result["recorded_reply"] = turn.recorded_reply
+        emit(result)
+
+
+async def replay(
+    sessions: list[BatchSession],
+    run_turn: Callable[[str, str], Awaitable[Any]],
+    *,
+    concurrency: int,
+    namespace: str = "",
+    forget: Callable[[str], Awaitable[None]] | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """Run ``sessions`` and yield one result per turn as turns finish.
+
+    Up to ``concurrency`` sessions run at once; turns within a session run
+    in order, each seeing the replies before it. Sessions are stored under
+    ``namespace`` + their id and passed to ``forget`` once replayed, so a
+    replay never touches live conversations. A failed turn is reported
+    with ``error`` and ``status`` and the session carries on.
+    """
+    results: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+    pending = iter(sessions)
+
+    async def worker() -> None:
+        for session in pending:
+            key = f"{namespace}{session.session_id}"
+            try:
+                await _replay_session(session, key, run_turn, results.put_nowait)
+            finally:
+                if forget is not None:
+                    await forget(key)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(min(concurrency, len(sessions)), 1))]
+    finished = asyncio.gather(*workers)
+    finished.add_done_callback(lambda _: results.put_nowait(None))
+    try:
+        while (result := await results.get()) is not None:
+            yield result
+        await finished
+    finally:
+        for task in workers:
+            task.cancel()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+from app.config import settings
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+# Dimensionality of the hashed character-trigram vectors used for
+# near-duplicate matching.
+VECTOR_DIM = 1024
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return _NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def question_vector(normalized: str) -> dict[int, float]:
+    """Sparse unit vector of hashed character trigrams."""
+    padded = f"  {normalized}  "
+    counts: dict[int, float] = {}
+    for i in range(len(padded) - 2):
+        digest = hashlib.blake2b(padded[i : i + 3].encode("utf-8"), digest_size=4).digest()
+        slot = int.from_bytes(digest, "little") % VECTOR_DIM
+        counts[slot] = counts.get(slot, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {slot: v / norm for slot, v in counts.items()}
+
+
+def _cosine(a: dict[int, float], b: dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(slot, 0.0) for slot, v in a.items())
+
+
+def cache_namespace(knowledge_hash: str, model_name: str, instructions: str = "") -> str:
+    """Entries are only valid for one knowledge version, model and set of tenant instructions."""
+    key = f"{knowledge_hash}:{model_name}" + (f":{instructions}" if instructions else "")
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def context_key(previous_reply: str) -> str:
+    """Answers are shared only between turns that follow the same reply.
+
+    First questions (no previous reply) share one context, which is where
+    nearly all repeat questions come from; follow-ups only hit when they
+    come after an identical answer.
+    """
+    if not previous_reply:
+        return ""
+    return hashlib.sha256(previous_reply.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    similar_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.exact_hits + self.similar_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+
+@dataclass
+class _Entry:
+    answer: str
+    vector: dict[int, float]
+    created: float
+
+
+class ResponseCache:
+    """LRU/TTL cache of QA answers keyed by normalized question text.
+
+    Keys are ``(namespace, context, normalized question)``. When
+    ``similarity`` is above zero, a miss falls back to the closest cached
+    question in the same namespace and context if its cosine similarity is
+    at least that high. With ``db_path`` set, entries are written through
+    to SQLite and survive restarts (exact matches only).
+    """
+
+    # Expired rows are purged from SQLite every this many writes.
+    SWEEP_EVERY = 200
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity: float = 0.0,
+        db_path: str | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.stats = CacheStats()
+        self._entries: OrderedDict[tuple[str, str, str], _Entry] = OrderedDict()
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS qa_cache ("
+                " namespace TEXT NOT NULL, context TEXT NOT NULL, question TEXT NOT NULL,"
+                " answer TEXT NOT NULL, created REAL NOT NULL,"
+                " PRIMARY KEY (namespace, context, question))"
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats_snapshot(self) -> dict[str, float]:
+        return {**asdict(self.stats), "hit_rate": self.stats.hit_rate}
+
+    async def get(self, namespace: str, context: str, question: str) -> str | None:
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        key = (namespace, context, normalized)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.created > self.ttl_seconds:
+            del self._entries[key]
+            self.stats.evictions += 1
+            entry = None
+        if entry is None and self._conn is not None:
+            stored = await asyncio.to_thread(self._load, key, now)
+            if stored is not None:
+                entry = self._remember(key, stored[0], stored[1])
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.stats.exact_hits += 1
+            return entry.answer
+
+        if self.similarity > 0:
+            vector = question_vector(normalized)
+            best, best_score = None, self.similarity
+            for (ns, ctx, _), candidate in self._entries.items():
+                if ns != namespace or ctx != context or now - candidate.created > self.ttl_seconds:
+                    continue
+                score = _cosine(vector, candidate.vector)
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is not None:
+                self.stats.similar_hits += 1
+                return best.answer
+
+        self.stats.misses += 1
+        return None
+
+    async def put(self, namespace: str, context: str, question: str, answer: str) -> None:
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        key = (namespace, context, normalized)
+        now = time.time()
+        self._remember(key, answer, now)
+        if self._conn is not None:
+            await asyncio.to_thread(self._store, key, answer, now)
+
+    def _remember(self, key: tuple[str, str, str], answer: str, created: float) -> _Entry:
+        entry = _Entry(answer=answer, vector=question_vector(key[2]), created=created)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        return entry
+
+    def _load(self, key: tuple[str, str, str], now: float) -> tuple[str, float] | None:
+        assert self._conn is not None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, created FROM qa_cache"
+                " WHERE namespace = ? AND context = ? AND question = ? AND created >= ?",
+                (*key, now - self.ttl_seconds),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _store(self, key: tuple[str, str, str], answer: str, now: float) -> None:
+        assert self._conn is not None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO qa_cache (namespace, context, question, answer, created)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (*key, answer, now),
+            )
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM qa_cache WHERE created < ?", (now - self.ttl_seconds,)
+                )
+
+
+@lru_cache(maxsize=1)
+def get_qa_cache() -> ResponseCache:
+    return ResponseCache(
+        max_entries=settings.qa_cache_max_entries,
+        ttl_seconds=settings.qa_cache_ttl_seconds,
+        similarity=settings.qa_cache_similarity,
+        db_path=settings.qa_cache_db_path or None,
+    )
@@ -1,3 +1,4 @@
+import json
 import os
 
 from dotenv import load_dotenv
@@ -5,28 +6,294 @@ from dotenv import load_dotenv
 # Load variables from a local .env file if present.
 load_dotenv()
 
+# USD per million (prompt, completion, cached prompt) tokens, for cost
+# estimates in /metrics. Override or extend with
+# LLM_PRICES='{"model": [prompt, completion, cached]}'; cached defaults to prompt.
+DEFAULT_LLM_PRICES: dict[str, tuple[float, float, float]] = {
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+}
+
+# Nodes that each get their own model tier.
+MODEL_TIERS = ("router", "qa", "lead", "summary", "fused")
+
 
 class Settings:
     """Simple settings container for environment-based configuration."""
 
     openai_api_key: str
     model_name: str
+    model_tiers: dict[str, str]
+    llm_http2: bool
+    llm_max_connections: int
+    llm_warmup_connections: int
     discord_webhook_url: str | None
+    discord_timeout_seconds: float
+    outbox_db_path: str
+    outbox_batch_size: int
+    outbox_max_attempts: int
+    outbox_retention_seconds: float
+    lead_dedup_window_seconds: float
+    llm_timeout_seconds: float
+    turn_deadline_seconds: float
+    router_deadline_share: float
+    hedge_enabled: bool
+    hedge_percentile: float
+    hedge_min_samples: int
+    hedge_min_delay_seconds: float
+    hedge_max_ratio: float
+    llm_fallback_models: list[str]
+    breaker_failure_threshold: int
+    breaker_reset_seconds: float
+    llm_max_concurrency: int
+    llm_model_concurrency: dict[str, int]
+    llm_queue_size: int
+    llm_queue_timeout_seconds: float
+    degraded_mode: bool
+    rate_limit_session_per_minute: float
+    rate_limit_session_burst: int
+    rate_limit_ip_per_minute: float
+    rate_limit_ip_burst: int
+    trust_forwarded_for: bool
+    workers: int
+    metrics_port: int
+    session_backend: str
+    session_ttl_seconds: float
+    session_max_entries: int
+    session_max_bytes: int
+    session_db_path: str
+    session_log_compact_bytes: int
+    idempotency_ttl_seconds: float
+    idempotency_max_entries: int
+    batch_enabled: bool
+    batch_max_concurrency: int
+    batch_max_turns: int
+    knowledge_dir: str
+    knowledge_index_dir: str
+    knowledge_chunk_chars: int
+    knowledge_embeddings_model: str
+    knowledge_poll_seconds: float
+    retrieval_top_k: int
+    tenants_dir: str
+    tenant_max_loaded: int
+    prerouter_threshold: float
+    speculative_routing: bool
+    speculation_max_waste_ratio: float
+    speculation_window: int
+    fused_routing_share: float
+    history_budget_router: int
+    history_budget_qa: int
+    history_budget_lead: int
+    history_summary_trigger_tokens: int
+    history_keep_tokens: int
+    qa_cache_enabled: bool
+    qa_cache_max_entries: int
+    qa_cache_ttl_seconds: float
+    qa_cache_similarity: float
+    qa_cache_db_path: str
     langsmith_project: str
+    tracing_enabled: bool
+    llm_prices: dict[str, tuple[float, float, float]]
 
     def __init__(self) -> None:
         self.openai_api_key = os.getenv("OPENAI_API_KEY", "")
         self.model_name = os.getenv("MODEL_NAME", "gpt-4.1-mini")
+        # Per-node models (ROUTER_MODEL, QA_MODEL, LEAD_MODEL, SUMMARY_MODEL,
+        # FUSED_MODEL), e.g. a small model for routing. Each defaults to
+        # MODEL_NAME.
+        self.model_tiers = {
+            tier: os.getenv(f"{tier.upper()}_MODEL", self.model_name) for tier in MODEL_TIERS
+        }
+        # All chat models share one keep-alive connection pool. HTTP/2 is
+        # used when the optional h2 package is installed.
+        self.llm_http2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+        self.llm_max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+        # Connections opened to the LLM API at startup, before traffic
+        # arrives; 0 skips it.
+        self.llm_warmup_connections = int(os.getenv("LLM_WARMUP_CONNECTIONS", "4"))
         self.discord_webhook_url = os.getenv("DISCORD_WEBHOOK_URL")
+        self.discord_timeout_seconds = float(os.getenv("DISCORD_TIMEOUT_SECONDS", "10"))
+
+        # Leads are written to a durable outbox and delivered in the background.
+        # A batch size above 1 merges that many leads into one webhook message.
+        self.outbox_db_path = os.getenv("OUTBOX_DB_PATH", "outbox.sqlite3")
+        self.outbox_batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", "1"))
+        self.outbox_max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+        # Delivered leads are deleted from the outbox this long after they were
+        # queued (at least LEAD_DEDUP_WINDOW_SECONDS; 0 keeps them). Dead leads
+        # are kept for manual follow-up.
+        self.outbox_retention_seconds = float(os.getenv("OUTBOX_RETENTION_SECONDS", "604800"))
+        # Leads sharing an email or phone with one seen in the last
+        # LEAD_DEDUP_WINDOW_SECONDS (from any session or worker) are merged
+        # into it instead of posted again; 0 disables.
+        self.lead_dedup_window_seconds = float(os.getenv("LEAD_DEDUP_WINDOW_SECONDS", "86400"))
+
+        # Upper bound for a single LLM round trip; the client is released on timeout.
+        self.llm_timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+        # Every turn must be answered within TURN_DEADLINE_SECONDS (0 disables);
+        # the router may use at most ROUTER_DEADLINE_SHARE of what is left.
+        self.turn_deadline_seconds = float(os.getenv("TURN_DEADLINE_SECONDS", "45"))
+        self.router_deadline_share = float(os.getenv("ROUTER_DEADLINE_SHARE", "0.3"))
+        # Hedging: a call still running after the recent HEDGE_PERCENTILE
+        # latency of its node and model gets a duplicate request, and the
+        # first answer wins. At most HEDGE_MAX_RATIO of calls are hedged.
+        self.hedge_enabled = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+        self.hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+        self.hedge_min_delay_seconds = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.25"))
+        self.hedge_max_ratio = float(os.getenv("HEDGE_MAX_RATIO", "0.05"))
+        # Comma-separated models tried in order when a node's model fails,
+        # times out or has its circuit breaker open. A breaker opens after
+        # BREAKER_FAILURE_THRESHOLD consecutive failures and lets a probe
+        # through after BREAKER_RESET_SECONDS.
+        self.llm_fallback_models = [
+            m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()
+        ]
+        self.breaker_failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+        self.breaker_reset_seconds = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+        # Admission control. At most LLM_MAX_CONCURRENCY model calls run at
+        # once; LLM_MODEL_CONCURRENCY='{"model": n}' also caps single models.
+        # Up to LLM_QUEUE_SIZE further calls wait, each for at most
+        # LLM_QUEUE_TIMEOUT_SECONDS, before the turn is shed.
+        self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+        self.llm_model_concurrency = {
+            model: int(limit)
+            for model, limit in json.loads(os.getenv("LLM_MODEL_CONCURRENCY", "{}")).items()
+        }
+        self.llm_queue_size = int(os.getenv("LLM_QUEUE_SIZE", "256"))
+        self.llm_queue_timeout_seconds = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+        # Shed turns get a cached answer or a static "busy" reply; with
+        # DEGRADED_MODE=false they fail with 503 and Retry-After instead.
+        self.degraded_mode = os.getenv("DEGRADED_MODE", "true").lower() == "true"
+
+        # Token-bucket rate limits per session and per client IP, off by
+        # default (0 disables); e.g. 20/min with a burst of 5 per session and
+        # 120/min with a burst of 30 per IP. X-Forwarded-For is only used for
+        # the IP when TRUST_FORWARDED_FOR=true. Idempotent replays are free.
+        self.rate_limit_session_per_minute = float(os.getenv("RATE_LIMIT_SESSION_PER_MINUTE", "0"))
+        self.rate_limit_session_burst = int(os.getenv("RATE_LIMIT_SESSION_BURST", "5"))
+        self.rate_limit_ip_per_minute = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "0"))
+        self.rate_limit_ip_burst = int(os.getenv("RATE_LIMIT_IP_BURST", "30"))
+        self.trust_forwarded_for = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+        # Worker processes for `python -m app.serve`. The app is loaded once
+        # and the workers are forked from it; more than one worker needs a
+        # session store they all reach (SESSION_BACKEND=sqlite or log).
+        self.workers = int(os.getenv("WORKERS", "1"))
+        # Each worker keeps its own metrics; when set, worker N also serves
+        # only /metrics on METRICS_PORT + N (0 disables).
+        self.metrics_port = int(os.getenv("METRICS_PORT", "0"))
+
+        # Session storage: "memory" (per process), "sqlite" (shared between
+        # workers on one host), "log" (like sqlite, but each turn appends its
+        # changes and a session's log is folded into a snapshot once it
+        # outgrows it and SESSION_LOG_COMPACT_BYTES) or "checkpointer"
+        # (LangGraph checkpointer).
+        self.session_backend = os.getenv("SESSION_BACKEND", "memory")
+        self.session_ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+        self.session_max_entries = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+        self.session_max_bytes = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.session_db_path = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+        self.session_log_compact_bytes = int(os.getenv("SESSION_LOG_COMPACT_BYTES", "16384"))
+
+        # Results of /chat requests sent with an Idempotency-Key header are
+        # kept this long, so client retries replay instead of re-running.
+        self.idempotency_ttl_seconds = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+        self.idempotency_max_entries = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+        # POST /chat/batch replays recorded conversations (off by default; it
+        # bypasses per-client rate limits). At most MAX_CONCURRENCY sessions
+        # run at once and one request may carry at most MAX_TURNS turns.
+        self.batch_enabled = os.getenv("BATCH_ENABLED", "false").lower() == "true"
+        self.batch_max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+        self.batch_max_turns = int(os.getenv("BATCH_MAX_TURNS", "10000"))
+
+        # Knowledge retrieval. Every markdown/text file under KNOWLEDGE_DIR is
+        # chunked and indexed; QA prompts only carry the top-k chunks.
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.knowledge_dir = os.getenv("KNOWLEDGE_DIR", os.path.join(root, "knowledge"))
+        self.knowledge_index_dir = os.getenv(
+            "KNOWLEDGE_INDEX_DIR", os.path.join(root, ".knowledge_index")
+        )
+        self.knowledge_chunk_chars = int(os.getenv("KNOWLEDGE_CHUNK_CHARS", "1200"))
+        # Optional sentence-transformers model name for hybrid retrieval.
+        self.knowledge_embeddings_model = os.getenv("KNOWLEDGE_EMBEDDINGS_MODEL", "")
+        # How often running servers check KNOWLEDGE_DIR for edits; 0 disables
+        # hot reload.
+        self.knowledge_poll_seconds = float(os.getenv("KNOWLEDGE_POLL_SECONDS", "5"))
+        self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+        # Multi-tenant serving. Each folder TENANTS_DIR/<tenant> holds that
+        # site's knowledge/ and an optional tenant.json (models, lead webhook,
+        # prompt instructions); requests pick one with an X-Tenant-ID header
+        # or a /t/<tenant> path prefix. Knowledge bases load on first use and
+        # at most TENANT_MAX_LOADED stay in memory. Requests without a tenant
+        # use the settings above.
+        self.tenants_dir = os.getenv("TENANTS_DIR", "")
+        self.tenant_max_loaded = int(os.getenv("TENANT_MAX_LOADED", "64"))
+
+        # Local intent guesses at or above this confidence skip the router
+        # LLM call. Anything above 1 disables the pre-router. Model guesses
+        # are capped at 0.85 (app.intent.MODEL_MAX_CONFIDENCE), so at the
+        # default only the high-precision rules skip it.
+        self.prerouter_threshold = float(os.getenv("PREROUTER_THRESHOLD", "0.9"))
+
+        # Speculative routing (opt-in): run the likely answer node alongside
+        # the router LLM. Speculation pauses while the predicted node was
+        # wrong for more than MAX_WASTE_RATIO of the recent WINDOW decisions.
+        # /chat/stream then sends each reply as a single token, since a
+        # speculative answer is only known to be kept once the router agrees.
+        self.speculative_routing = os.getenv("SPECULATIVE_ROUTING", "false").lower() == "true"
+        self.speculation_max_waste_ratio = float(os.getenv("SPECULATION_MAX_WASTE_RATIO", "0.25"))
+        self.speculation_window = int(os.getenv("SPECULATION_WINDOW", "200"))
+        # Share of sessions (0-1) answered by the fused graph, where one LLM
+        # call routes and replies. A session's arm is fixed by a hash of its
+        # id, so A/B arms stay stable across turns and workers.
+        self.fused_routing_share = float(os.getenv("FUSED_ROUTING_SHARE", "0"))
+
+        # Conversation memory. Each node sees at most its budget of recent
+        # history tokens; older turns are folded into a rolling summary once
+        # unsummarized history exceeds the trigger, keeping the newest turns.
+        self.history_budget_router = int(os.getenv("HISTORY_BUDGET_ROUTER", "800"))
+        self.history_budget_qa = int(os.getenv("HISTORY_BUDGET_QA", "2000"))
+        self.history_budget_lead = int(os.getenv("HISTORY_BUDGET_LEAD", "1000"))
+        self.history_summary_trigger_tokens = int(
+            os.getenv("HISTORY_SUMMARY_TRIGGER_TOKENS", "3000")
+        )
+        self.history_keep_tokens = int(os.getenv("HISTORY_KEEP_TOKENS", "1500"))
+
+        # QA answer cache, keyed by knowledge hash + model so knowledge edits
+        # invalidate it. A similarity in (0, 1] enables near-duplicate hits;
+        # a DB path makes entries persistent.
+        self.qa_cache_enabled = os.getenv("QA_CACHE_ENABLED", "true").lower() == "true"
+        self.qa_cache_max_entries = int(os.getenv("QA_CACHE_MAX_ENTRIES", "2000"))
+        self.qa_cache_ttl_seconds = float(os.getenv("QA_CACHE_TTL_SECONDS", "86400"))
+        self.qa_cache_similarity = float(os.getenv("QA_CACHE_SIMILARITY", "0"))
+        self.qa_cache_db_path = os.getenv("QA_CACHE_DB_PATH", "")
 
         # LangSmith / LangChain tracing configuration.
         default_project = "website-support-agent"
         self.langsmith_project = os.getenv("LANGCHAIN_PROJECT", default_project)
 
-        # Ensure tracing v2 is enabled and project name is set so
-        # LangGraph and LangChain runs are visible in LangSmith.
-        os.environ.setdefault("LANGCHAIN_TRACING_V2", "true")
+        # Tracing is on by default so LangGraph and LangChain runs are visible
+        # in LangSmith. TRACING_ENABLED=false keeps it off the hot path.
+        self.tracing_enabled = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+        if self.tracing_enabled:
+            os.environ.setdefault("LANGCHAIN_TRACING_V2", "true")
+        else:
+            os.environ["LANGCHAIN_TRACING_V2"] = "false"
+            os.environ["LANGSMITH_TRACING"] = "false"
         os.environ.setdefault("LANGCHAIN_PROJECT", self.langsmith_project)
 
+        self.llm_prices = dict(DEFAULT_LLM_PRICES)
+        for model, prices in json.loads(os.getenv("LLM_PRICES", "{}")).items():
+            prompt, completion, *cached = (float(p) for p in prices)
+            self.llm_prices[model] = (prompt, completion, cached[0] if cached else prompt)
+
 
 settings = Settings()
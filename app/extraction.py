@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[a-z]{2,}", re.I)
+# Candidate phone numbers; the digit count is checked in normalize_phone.
+PHONE_RE = re.compile(r"(?<![\w+])(?:\+|00)?\d[\d\s().-]{5,}\d(?!\w)")
+# A message made only of approval phrases with at least one explicit
+# approval ("yes, send it", "go ahead, thanks"). Acknowledgements alone
+# ("thanks", "ok", "looks good") are not consent to send and go to the LLM.
+_APPROVAL = r"(?:yes|yep|yeah|yup|please do|please send it|go ahead|send it|do it)"
+_ACKNOWLEDGEMENT = (
+    r"(?:please|sure|ok|okay|sounds good|looks good|perfect|correct|that's right|that is right|"
+    r"that's correct|all good|thanks|thank you)"
+)
+CONFIRM_RE = re.compile(
+    rf"(?:{_ACKNOWLEDGEMENT}[\s,.!]*)*{_APPROVAL}[\s,.!]*(?:(?:{_APPROVAL}|{_ACKNOWLEDGEMENT})[\s,.!]*)*",
+    re.I,
+)
+NAME_RE = re.compile(
+    r"\b(?:my name is|my name's|name is)\s+([a-z][a-z'-]+(?:\s+[a-z][a-z'-]+)?)", re.I
+)
+# Weaker lead-ins only count when followed by a capitalized word ("I'm Sam",
+# "call me Alex"); "call me tomorrow" is not a name.
+SELF_INTRO_RE = re.compile(
+    r"\b(?i:i'm|im|call me)\s+([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)?)"
+)
+# "This is Acme Corp" and "I am Sales" name a company or team as often as
+# a person: the name is kept, but the LLM decides.
+TENTATIVE_INTRO_RE = re.compile(
+    r"\b(?i:i am|this is)\s+([A-Z][a-z'-]+(?:\s+[A-Z][a-z'-]+)?)"
+)
+_WORD_RE = re.compile(r"[a-z0-9']+", re.I)
+
+# Words after "I'm" / "this is" that are not names ("I'm interested", ...).
+NAME_STOPWORDS = frozenset(
+    "a an the and or but not just also here from at with in on for to of interested looking "
+    "trying wondering curious happy good fine ok okay sure ready available calling writing "
+    "reaching contacting asking still only really very so my your our their it "
+    "back later tomorrow today tonight now anytime anyway soon asap sometime whenever".split()
+)
+# Glue words that may surround contact details without making a turn ambiguous.
+FILLER_WORDS = frozenset(
+    "hi hello hey sure yes yeah yep ok okay thanks thank you please it it's its is my name "
+    "name's email e-mail mail address phone number mobile cell tel and or you can reach me "
+    "at on via here i'm im i am this call contact best the use".split()
+)
+
+
+@dataclass(frozen=True)
+class ContactExtraction:
+    """Contact details found in one user message without calling the LLM."""
+
+    fields: dict[str, str] = field(default_factory=dict)
+    confirmed: bool = False
+    # Words that none of the patterns accounted for.
+    leftover: tuple[str, ...] = ()
+    question: bool = False
+    # The name came from a lead-in that often introduces something else.
+    tentative: bool = False
+
+    @property
+    def confident(self) -> bool:
+        """True when the whole message was explained by the patterns."""
+        return (
+            (bool(self.fields) or self.confirmed)
+            and not self.leftover
+            and not self.question
+            and not self.tentative
+        )
+
+
+def normalize_phone(raw: str) -> str | None:
+    """Digits only, keeping an international ``+`` prefix; None if implausible."""
+    raw = raw.strip()
+    digits = re.sub(r"\D", "", raw)
+    international = raw.startswith("+") or raw.startswith("00")
+    if raw.startswith("00"):
+        digits = digits[2:]
+    if not 7 <= len(digits) <= 15:
+        return None
+    return f"+{digits}" if international else digits
+
+
+def is_valid_email(value: str) -> bool:
+    return EMAIL_RE.fullmatch(value.strip()) is not None
+
+
+def _clean_name(raw: str) -> str | None:
+    words: list[str] = []
+    for word in raw.split():
+        if word.lower() in NAME_STOPWORDS:
+            break
+        words.append(word)
+    if not words:
+        return None
+    return " ".join(w if any(c.isupper() for c in w) else w.capitalize() for w in words)
+
+
+def extract_contact(text: str) -> ContactExtraction:
+    """Pull email, phone and name from ``text`` and detect bare confirmations."""
+    text = text.strip()
+    if not text:
+        return ContactExtraction()
+    if CONFIRM_RE.fullmatch(text):
+        return ContactExtraction(confirmed=True)
+
+    fields: dict[str, str] = {}
+    rest = text
+    email = EMAIL_RE.search(rest)
+    if email:
+        fields["email"] = email.group(0).lower()
+        rest = rest[: email.start()] + " " + rest[email.end() :]
+
+    for match in PHONE_RE.finditer(rest):
+        phone = normalize_phone(match.group(0))
+        if phone:
+            fields["phone"] = phone
+            rest = rest[: match.start()] + " " + rest[match.end() :]
+            break
+
+    tentative = False
+    name = NAME_RE.search(rest) or SELF_INTRO_RE.search(rest)
+    if name is None:
+        name = TENTATIVE_INTRO_RE.search(rest)
+        tentative = name is not None
+    if name:
+        cleaned = _clean_name(name.group(1))
+        if cleaned:
+            fields["name"] = cleaned
+            consumed = name.start(1) + len(cleaned)
+            rest = rest[: name.start()] + " " + rest[consumed:]
+
+    leftover = tuple(w for w in _WORD_RE.findall(rest) if w.lower() not in FILLER_WORDS)
+    return ContactExtraction(fields=fields, leftover=leftover, question="?" in rest, tentative=tentative)
@@ -1,24 +1,51 @@
 from __future__ import annotations
 
+import zlib
+from functools import lru_cache
+
 from langgraph.graph import END, START, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 
+from app.config import settings
+from app.metrics import instrument_node
+from app.nodes.fused import fused_node
 from app.nodes.lead_capture import lead_capture_node
 from app.nodes.off_topic import off_topic_node
 from app.nodes.qa import qa_node
 from app.nodes.router import route
+from app.nodes.speculative import speculative_node
 from app.state import ChatState
 
 
-def build_graph() -> StateGraph:
+def build_graph(speculative: bool | None = None, fused: bool = False) -> StateGraph:
+    """Build the chat graph.
+
+    With ``speculative`` (default: ``SPECULATIVE_ROUTING``) routing and
+    answering happen in one node that overlaps the router LLM call with the
+    most likely answer node. With ``fused`` they happen in one node that
+    makes a single LLM call for both.
+    """
     graph = StateGraph(ChatState)
 
-    graph.add_node("qa", qa_node)
-    graph.add_node("lead_capture", lead_capture_node)
-    graph.add_node("off_topic", off_topic_node)
+    if fused:
+        graph.add_node("fused", instrument_node("fused", fused_node))
+        graph.add_edge(START, "fused")
+        graph.add_edge("fused", END)
+        return graph
+
+    if settings.speculative_routing if speculative is None else speculative:
+        graph.add_node("speculative", instrument_node("speculative", speculative_node))
+        graph.add_edge(START, "speculative")
+        graph.add_edge("speculative", END)
+        return graph
+
+    graph.add_node("qa", instrument_node("qa", qa_node))
+    graph.add_node("lead_capture", instrument_node("lead_capture", lead_capture_node))
+    graph.add_node("off_topic", instrument_node("off_topic", off_topic_node))
 
     graph.add_conditional_edges(
         START,
-        route,
+        instrument_node("router", route),
         {
             "qa": "qa",
             "lead_capture": "lead_capture",
@@ -33,4 +60,19 @@ def build_graph() -> StateGraph:
     return graph
 
 
-app = build_graph().compile()
+def uses_fused_graph(session_id: str) -> bool:
+    """Whether ``session_id`` falls in the ``FUSED_ROUTING_SHARE`` A/B arm."""
+    share = settings.fused_routing_share
+    if share <= 0:
+        return False
+    return share >= 1 or zlib.crc32(session_id.encode("utf-8")) / 2**32 < share
+
+
+@lru_cache(maxsize=2)
+def get_graph(fused: bool, /) -> CompiledStateGraph:
+    """The compiled chat graph, or the fused one, built on first use.
+
+    One instance serves every session and tenant; the tenant arrives in
+    the run config.
+    """
+    return build_graph(fused=fused).compile()
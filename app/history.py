@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import sys
+from itertools import islice
+from typing import Iterable, Iterator, Sequence, overload
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+_MESSAGE_CLASSES: dict[str, type[BaseMessage]] = {
+    "human": HumanMessage,
+    "ai": AIMessage,
+    "system": SystemMessage,
+}
+
+
+class Message:
+    """One history entry: its role (``type``, as in LangChain) and text.
+
+    Unlike ``BaseMessage`` it carries no ids, metadata or tool-call
+    payloads, and roles are interned so every entry shares the same
+    string objects.
+    """
+
+    __slots__ = ("type", "content")
+
+    def __init__(self, type: str, content: str) -> None:
+        self.type = sys.intern(type)
+        self.content = content
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Message):
+            return NotImplemented
+        return self.type == other.type and self.content == other.content
+
+    def __repr__(self) -> str:
+        return f"Message({self.type!r}, {self.content!r})"
+
+
+def to_record(message: BaseMessage | Message) -> Message:
+    if isinstance(message, Message):
+        return message
+    content = message.content
+    return Message(message.type, content if isinstance(content, str) else str(content))
+
+
+def to_langchain(messages: Iterable[Message]) -> list[BaseMessage]:
+    """Turn history entries into LangChain messages for a model call."""
+    return [_MESSAGE_CLASSES[m.type](content=m.content) for m in messages]
+
+
+class History(Sequence[Message]):
+    """Conversation history whose appends share storage.
+
+    ``appended`` returns a new ``History``. When this one is the newest view
+    of its backing list, the entries are added to that list in place, so a
+    turn does not copy the whole conversation; older views keep seeing only
+    their own prefix. Appending to an older view copies once and forks.
+    """
+
+    __slots__ = ("_items", "_length")
+
+    def __init__(self, messages: Iterable[BaseMessage | Message] = ()) -> None:
+        self._items = [to_record(m) for m in messages]
+        self._length = len(self._items)
+
+    @classmethod
+    def _view(cls, items: list[Message], length: int) -> History:
+        history = cls.__new__(cls)
+        history._items = items
+        history._length = length
+        return history
+
+    def appended(self, messages: Iterable[BaseMessage | Message]) -> History:
+        items = self._items
+        if len(items) != self._length:
+            items = items[: self._length]
+        items.extend(to_record(m) for m in messages)
+        return History._view(items, len(items))
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> Message: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Message]: ...
+
+    def __getitem__(self, index: int | slice) -> Message | list[Message]:
+        if isinstance(index, slice):
+            return self._items[slice(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("history index out of range")
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[Message]:
+        return islice(self._items, self._length)
+
+    def __reversed__(self) -> Iterator[Message]:
+        items = self._items
+        for index in range(self._length - 1, -1, -1):
+            yield items[index]
+
+    def __repr__(self) -> str:
+        return f"History({list(self)!r})"
+
+
+def append_messages(
+    left: History | None, right: History | Sequence[BaseMessage | Message] | BaseMessage
+) -> History:
+    """State reducer for ``messages``: node output is appended to the history.
+
+    Nodes keep returning LangChain messages (the streaming API picks replies
+    up from node output); they are stored as compact ``Message`` entries.
+    """
+    if isinstance(right, History):
+        return right if not left else left.appended(right)
+    if isinstance(right, BaseMessage):
+        right = [right]
+    if left is None:
+        return History(right)
+    return left.appended(right)
+
+
+def last_message(messages: Sequence[Message], type: str) -> Message | None:
+    """Newest entry with role ``type``, scanning back from the end."""
+    for message in reversed(messages):
+        if message.type == type:
+            return message
+    return None
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Literal, TypeVar
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.metrics import IDEMPOTENT_REPLAYS
+from app.sessions import SHARED_SESSION_BACKENDS
+
+T = TypeVar("T")
+
+
+def request_fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Entry(Generic[T]):
+    __slots__ = ("fingerprint", "task", "waiters", "finished")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task[T]) -> None:
+        self.fingerprint = fingerprint
+        self.task = task
+        self.waiters = 0
+        self.finished = 0.0
+
+
+Claim = Literal["run", "wait", "done", "conflict"]
+
+# How often a request polls for a run that another worker holds.
+SHARED_POLL_SECONDS = 0.1
+# Claims are taken over after this long when turns have no deadline.
+STALE_CLAIM_SECONDS = 300.0
+
+
+class SQLiteIdempotencyRecords:
+    """Idempotency records in the shared session database.
+
+    Lets worker processes on one host share keys: a worker claims a key
+    before running it and stores the encoded result when it is done, so a
+    retry that lands on another worker replays the result or waits for the
+    run instead of starting a second one. A claim older than
+    ``stale_seconds`` belongs to a worker that died mid-run and is taken
+    over. Each process connects on its first call.
+    """
+
+    # Expired and surplus rows are swept every this many claims.
+    SWEEP_EVERY = 100
+    SCHEMA: tuple[str, ...] = (
+        "CREATE TABLE IF NOT EXISTS idempotency ("
+        " key TEXT PRIMARY KEY,"
+        " fingerprint TEXT NOT NULL,"
+        " result TEXT,"
+        " claimed REAL NOT NULL,"
+        " finished REAL)",
+        "CREATE INDEX IF NOT EXISTS idempotency_finished ON idempotency (finished)",
+    )
+
+    def __init__(self, path: str, *, ttl_seconds: float, max_entries: int, stale_seconds: float) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._claims = 0
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so a pre-forking parent never hands its
+        # workers a shared connection. Call with _lock held.
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    async def claim(self, key: str, fingerprint: str) -> tuple[Claim, str | None]:
+        """Claim ``key`` for this worker, or report who already has it.
+
+        Returns ``("done", result)`` for a stored result, ``("wait", None)``
+        while another worker runs the key, ``("conflict", None)`` when the
+        key belongs to a different request, and ``("run", None)`` once the
+        caller holds the claim.
+        """
+        return await asyncio.to_thread(self._claim, key, fingerprint)
+
+    async def finish(self, key: str, result: str) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE idempotency SET result = ?, finished = ? WHERE key = ?",
+            (result, time.time(), key),
+        )
+
+    async def release(self, key: str) -> None:
+        """Drop an unfinished claim so a retry runs again."""
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM idempotency WHERE key = ? AND finished IS NULL", (key,)
+        )
+
+    def _execute(self, sql: str, params: tuple[Any, ...] = ()) -> None:
+        with self._lock:
+            self._db().execute(sql, params)
+
+    def _claim(self, key: str, fingerprint: str) -> tuple[Claim, str | None]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT fingerprint, result, claimed, finished FROM idempotency WHERE key = ?", (key,)
+                ).fetchone()
+                outcome: tuple[Claim, str | None] = ("run", None)
+                if row is not None:
+                    stored, result, claimed, finished = row
+                    if finished is not None and now - finished <= self.ttl_seconds:
+                        outcome = ("done", result) if stored == fingerprint else ("conflict", None)
+                    elif finished is None and now - claimed <= self.stale_seconds:
+                        outcome = ("wait", None) if stored == fingerprint else ("conflict", None)
+                if outcome[0] == "run":
+                    db.execute(
+                        "INSERT OR REPLACE INTO idempotency (key, fingerprint, result, claimed, finished)"
+                        " VALUES (?, ?, NULL, ?, NULL)",
+                        (key, fingerprint, now),
+                    )
+                    self._claims += 1
+                    if self._claims % self.SWEEP_EVERY == 0:
+                        self._sweep(db, now)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return outcome
+
+    def _sweep(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM idempotency WHERE finished < ?", (now - self.ttl_seconds,))
+        db.execute("DELETE FROM idempotency WHERE finished IS NULL AND claimed < ?", (now - self.stale_seconds,))
+        db.execute(
+            "DELETE FROM idempotency WHERE key IN ("
+            " SELECT key FROM idempotency WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+class IdempotencyStore(Generic[T]):
+    """Runs each idempotency key once and shares the result.
+
+    A request whose key is in flight waits for the original run; one whose
+    key already finished gets the stored result. Only successful results
+    that pass ``keep_result`` are kept, so a retry after a failure runs
+    again. The run is cancelled once every request waiting on it has gone
+    away, matching how a plain request is cancelled when its client
+    disconnects.
+
+    With ``shared`` records, keys also hold across worker processes;
+    ``encode`` and ``decode`` turn a result into the text stored there.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        keep_result: Callable[[T], bool] | None = None,
+        shared: SQLiteIdempotencyRecords | None = None,
+        encode: Callable[[T], str] = str,
+        decode: Callable[[str], T] | None = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.keep_result = keep_result
+        self.shared = shared
+        self.encode = encode
+        self.decode = decode
+        self._entries: OrderedDict[str, _Entry[T]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def run(self, key: str, fingerprint: str, work: Callable[[], Awaitable[T]]) -> T:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None and entry.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422, detail="Idempotency key was already used for a different request."
+            )
+        if entry is None:
+            entry = _Entry(fingerprint, asyncio.ensure_future(self._run_shared(key, fingerprint, work)))
+            entry.task.add_done_callback(lambda task, key=key: self._settle(key, task))
+            self._entries[key] = entry
+            self._evict()
+        else:
+            IDEMPOTENT_REPLAYS.inc(outcome="cached" if entry.task.done() else "in_flight")
+
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if not entry.waiters and not entry.task.done():
+                entry.task.cancel()
+
+    async def _run_shared(self, key: str, fingerprint: str, work: Callable[[], Awaitable[T]]) -> T:
+        shared = self.shared
+        if shared is None or self.decode is None:
+            return await work()
+        waited = False
+        while True:
+            outcome, result = await shared.claim(key, fingerprint)
+            if outcome == "run":
+                break
+            if outcome == "conflict":
+                raise HTTPException(
+                    status_code=422, detail="Idempotency key was already used for a different request."
+                )
+            if outcome == "done" and result is not None:
+                IDEMPOTENT_REPLAYS.inc(outcome="cached")
+                return self.decode(result)
+            if not waited:
+                IDEMPOTENT_REPLAYS.inc(outcome="in_flight")
+                waited = True
+            await asyncio.sleep(SHARED_POLL_SECONDS)
+
+        try:
+            value = await work()
+        except BaseException:
+            await asyncio.shield(shared.release(key))
+            raise
+        if self.keep_result is None or self.keep_result(value):
+            await asyncio.shield(shared.finish(key, self.encode(value)))
+        else:
+            await asyncio.shield(shared.release(key))
+        return value
+
+    def _settle(self, key: str, task: asyncio.Task[Any]) -> None:
+        entry = self._entries.get(key)
+        if entry is None or entry.task is not task:
+            return
+        if (
+            task.cancelled()
+            or task.exception() is not None
+            or (self.keep_result is not None and not self.keep_result(task.result()))
+        ):
+            del self._entries[key]
+        else:
+            entry.finished = time.monotonic()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not entry.finished or entry.finished > cutoff:
+                break
+            del self._entries[key]
+
+    def _evict(self) -> None:
+        # Never drop a run that requests are still waiting on.
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if self._entries[key].task.done():
+                del self._entries[key]
+
+
+def build_idempotency_store(
+    keep_result: Callable[[Any], bool] | None = None,
+    *,
+    encode: Callable[[Any], str] = str,
+    decode: Callable[[str], Any] | None = None,
+) -> IdempotencyStore[Any]:
+    """Create the store for ``Idempotency-Key`` requests.
+
+    With a session backend shared between workers (and a ``decode``), the
+    records are kept in its database too, so every worker sees every key.
+    """
+    limits = {
+        "ttl_seconds": settings.idempotency_ttl_seconds,
+        "max_entries": settings.idempotency_max_entries,
+    }
+    shared = None
+    if decode is not None and settings.session_backend in SHARED_SESSION_BACKENDS:
+        # A turn may first queue behind others on its session lock.
+        stale = 2 * settings.turn_deadline_seconds or STALE_CLAIM_SECONDS
+        shared = SQLiteIdempotencyRecords(settings.session_db_path, stale_seconds=stale, **limits)
+    return IdempotencyStore(keep_result=keep_result, shared=shared, encode=encode, decode=decode, **limits)
@@ -1,38 +1,77 @@
 from __future__ import annotations
 
-from typing import Mapping
+from typing import Mapping, Sequence
 
 import httpx
 
 from app.config import settings
 
+# Discord rejects message content longer than this.
+DISCORD_CONTENT_LIMIT = 2000
+# Longest value kept for the short fields of a lead; the message gets
+# whatever room is left under DISCORD_CONTENT_LIMIT.
+FIELD_LIMIT = 200
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client shared by every webhook delivery."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=settings.discord_timeout_seconds,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _clip(value: str, limit: int) -> str:
+    return value if len(value) <= limit else value[: max(limit - 1, 0)] + "…"
 
-async def send_lead_to_discord(lead: Mapping[str, str]) -> bool:
-    """Send a captured lead to the configured Discord webhook channel."""
-    webhook_url = settings.discord_webhook_url
-    if not webhook_url:
-        # Treat missing webhook as a soft failure.
-        return False
+
+def format_lead(lead: Mapping[str, str]) -> str:
+    """One lead as a Discord message, clipped to fit DISCORD_CONTENT_LIMIT."""
+
+    def short(name: str) -> str:
+        return _clip(str(lead.get(name, "")), FIELD_LIMIT)
 
     content_lines = [
-        "**New webchat lead**",
-        f"**Name:** {lead.get('name', '')}",
-        f"**Email:** {lead.get('email', '')}",
-        f"**Phone:** {lead.get('phone', '')}",
-        f"**Company:** {lead.get('company', '')}",
-        f"**Message:** {lead.get('message', '')}",
-        f"**Source:** {lead.get('source', '')}",
-        f"**Created at:** {lead.get('created_at', '')}",
+        # Set on a repeat submission that changed an already posted lead.
+        "**Webchat lead update**" if lead.get("update") else "**New webchat lead**",
+        f"**Name:** {short('name')}",
+        f"**Email:** {short('email')}",
+        f"**Phone:** {short('phone')}",
+        f"**Company:** {short('company')}",
+        "**Message:** ",
+        f"**Source:** {short('source')}",
+        f"**Created at:** {short('created_at')}",
     ]
+    room = DISCORD_CONTENT_LIMIT - len("\n".join(content_lines))
+    content_lines[5] += _clip(str(lead.get("message", "")), room)
+    return "\n".join(content_lines)
+
+
+def format_leads(leads: Sequence[Mapping[str, str]]) -> str:
+    """One webhook message for one or more leads."""
+    if len(leads) == 1:
+        return format_lead(leads[0])
+    return "\n\n".join(format_lead(lead) for lead in leads)
+
+
+async def post_to_discord(
+    content: str, client: httpx.AsyncClient | None = None, *, webhook_url: str | None = None
+) -> httpx.Response:
+    """POST a message to ``webhook_url`` (default: the configured one) and return the raw response."""
+    webhook_url = webhook_url or settings.discord_webhook_url
+    if not webhook_url:
+        raise RuntimeError("DISCORD_WEBHOOK_URL is not configured.")
+    return await (client or get_http_client()).post(webhook_url, json={"content": content})
 
-    payload = {
-        "content": "\n".join(content_lines),
-    }
-
-    async with httpx.AsyncClient(timeout=10) as client:
-        try:
-            response = await client.post(webhook_url, json=payload)
-            return response.status_code // 100 == 2
-        except Exception as e:
-            print(e)
-            return False
@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Mapping
+
+import httpx
+
+from app.config import settings
+from app.integrations.discord import DISCORD_CONTENT_LIMIT, format_leads, post_to_discord
+from app.metrics import LEAD_DEDUP, LEAD_DELIVERIES
+
+# How long a claimed row is hidden from other workers while it is delivered.
+CLAIM_LEASE_SECONDS = 60.0
+# Retry backoff for failed deliveries: BASE * 2**attempts, capped, with jitter.
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+# Lead index entries older than the dedup window are pruned every this many enqueues.
+PRUNE_EVERY = 1000
+# Delivered rows past their retention are deleted at most this often.
+SWEEP_INTERVAL_SECONDS = 3600.0
+# Contact fields a repeat submission may fill in or correct.
+CONTACT_FIELDS = ("name", "email", "phone", "company")
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def normalize_phone(phone: str) -> str:
+    """Digits only, and at most the last ten, so "+1 (555) 010-2030" matches "555 010 2030"."""
+    digits = re.sub(r"\D", "", phone)
+    return digits[-10:] if len(digits) >= 7 else ""
+
+
+def lead_keys(lead: Mapping[str, str], webhook_url: str | None = None) -> list[int]:
+    """Index keys of a lead: one per normalized email and phone, per webhook.
+
+    Keys are 64-bit hashes, so the index is a rowid table and a lookup reads
+    the same few pages whether it holds a thousand leads or millions.
+    """
+    email = normalize_email(lead.get("email") or "")
+    phone = normalize_phone(lead.get("phone") or "")
+    values = [f"email:{email}" if email else "", f"phone:{phone}" if phone else ""]
+    return [
+        int.from_bytes(
+            hashlib.blake2b(f"{webhook_url or ''}\0{value}".encode(), digest_size=8).digest(), "big", signed=True
+        )
+        for value in values
+        if value
+    ]
+
+
+def _comparable(field: str, value: str) -> str:
+    if field == "email":
+        return normalize_email(value)
+    if field == "phone":
+        return normalize_phone(value)
+    return value.strip()
+
+
+def merge_leads(previous: Mapping[str, str], lead: Mapping[str, str]) -> dict[str, str]:
+    """``previous`` enriched by a repeat submission.
+
+    Newer contact details win unless they only differ in formatting; a new
+    message goes below the earlier ones.
+    """
+    merged = dict(previous)
+    for field in CONTACT_FIELDS:
+        value = (lead.get(field) or "").strip()
+        if value and _comparable(field, value) != _comparable(field, previous.get(field) or ""):
+            merged[field] = value
+    message = (lead.get("message") or "").strip()
+    if message and message not in (previous.get("message") or ""):
+        merged["message"] = f"{previous['message']}\n{message}" if previous.get("message") else message
+    return merged
+
+
+@dataclass
+class OutboxItem:
+    id: int
+    lead: dict[str, str]
+    attempts: int
+    # The lead's own webhook (e.g. its tenant's); None means DISCORD_WEBHOOK_URL.
+    webhook_url: str | None = None
+
+
+class LeadOutbox:
+    """Durable SQLite queue of leads waiting for webhook delivery.
+
+    Rows are claimed with a short lease, so several worker processes can
+    drain the same file without posting a lead twice under normal operation.
+    Rows that exhaust their attempts stay in the table as ``dead`` for
+    manual follow-up. Delivered rows are deleted ``retention_seconds``
+    after they were queued (never with 0), but not before the dedup
+    window has passed, as repeats are folded into them until then.
+
+    With a ``dedup_window_seconds``, leads sharing an email or phone (and
+    webhook) with one seen within the window are coalesced, across sessions
+    and processes: a lead not yet delivered (queued or waiting to retry) is
+    enriched in place, one already posted or being posted gets a single
+    "update" lead if the repeat adds anything, and an identical repeat is
+    suppressed.
+    """
+
+    def __init__(self, path: str, *, dedup_window_seconds: float = 0.0, retention_seconds: float = 0.0) -> None:
+        self.path = path
+        self.dedup_window_seconds = dedup_window_seconds
+        self.retention_seconds = max(retention_seconds, dedup_window_seconds) if retention_seconds > 0 else 0.0
+        self._enqueued = 0
+        self._swept = time.time()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_error TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "webhook_url" not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN webhook_url TEXT")
+        # When the lease of the worker delivering a row runs out; 0 when unclaimed.
+        if "claimed_until" not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN claimed_until REAL NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)"
+        )
+        # Hash of a normalized email or phone -> the latest outbox row for it.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lead_index ("
+            " key INTEGER PRIMARY KEY,"
+            " outbox_id INTEGER NOT NULL,"
+            " seen REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lead_index_seen ON lead_index (seen)")
+        # Set by enqueue so a worker in this process wakes up immediately.
+        self.wakeup = asyncio.Event()
+
+    async def enqueue(self, lead: Mapping[str, str], webhook_url: str | None = None) -> int:
+        """Queue ``lead`` (or fold it into a recent one); returns its outbox row id."""
+        row_id = await asyncio.to_thread(self._enqueue, dict(lead), webhook_url)
+        self.wakeup.set()
+        return row_id
+
+    async def claim_due(self, limit: int, *, include_default: bool = True) -> list[OutboxItem]:
+        """Claim up to ``limit`` due leads.
+
+        Without ``include_default`` only leads with their own webhook are claimed.
+        """
+        return await asyncio.to_thread(self._claim_due, limit, include_default)
+
+    async def mark_delivered(self, ids: list[int]) -> None:
+        await asyncio.to_thread(self._deliver, ids)
+
+    async def mark_retry(
+        self,
+        items: list[OutboxItem],
+        delay: float,
+        error: str,
+        max_attempts: int,
+        count_attempt: bool = True,
+    ) -> None:
+        await asyncio.to_thread(self._retry, items, delay, error, max_attempts, count_attempt)
+
+    async def counts(self) -> dict[str, int]:
+        return await asyncio.to_thread(self._counts)
+
+    def _enqueue(self, lead: dict[str, str], webhook_url: str | None) -> int:
+        now = time.time()
+        keys = lead_keys(lead, webhook_url) if self.dedup_window_seconds > 0 else []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row_id = self._coalesce(lead, keys, now) if keys else None
+                if row_id is None:
+                    row_id = self._insert(lead, webhook_url, now)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO lead_index (key, outbox_id, seen) VALUES (?, ?, ?)",
+                    [(key, row_id, now) for key in keys],
+                )
+                self._enqueued += 1
+                if keys and self._enqueued % PRUNE_EVERY == 0:
+                    self._conn.execute(
+                        "DELETE FROM lead_index WHERE seen < ?", (now - self.dedup_window_seconds,)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row_id
+
+    def _insert(self, lead: Mapping[str, str], webhook_url: str | None, now: float) -> int:
+        cursor = self._conn.execute(
+            "INSERT INTO outbox (payload, webhook_url, next_attempt, created) VALUES (?, ?, ?, ?)",
+            (json.dumps(dict(lead)), webhook_url, now, now),
+        )
+        return int(cursor.lastrowid or 0)
+
+    def _coalesce(self, lead: dict[str, str], keys: list[int], now: float) -> int | None:
+        """Fold ``lead`` into the latest lead with the same keys; None if there is none."""
+        # Primary key lookups only; the window is applied here, not in SQL,
+        # so the planner never reaches for the ``seen`` index instead.
+        rows = self._conn.execute(
+            f"SELECT outbox_id, seen FROM lead_index WHERE key IN ({', '.join('?' * len(keys))})", keys
+        ).fetchall()
+        recent = [outbox_id for outbox_id, seen in rows if seen >= now - self.dedup_window_seconds]
+        row = None
+        if recent:
+            row = self._conn.execute(
+                "SELECT id, payload, status, claimed_until, webhook_url FROM outbox WHERE id = ?", (max(recent),)
+            ).fetchone()
+        # A lead that was never delivered is retried as a new one.
+        if row is None or row[2] == "dead":
+            return None
+        row_id, payload, status, claimed_until, webhook_url = row
+        previous = json.loads(payload)
+        merged = merge_leads(previous, lead)
+        if status == "pending" and claimed_until <= now:
+            # Queued or waiting to retry, and no worker is posting it right
+            # now: enrich the lead in place, so it is posted once.
+            if merged != previous:
+                self._conn.execute("UPDATE outbox SET payload = ? WHERE id = ?", (json.dumps(merged), row_id))
+            LEAD_DEDUP.inc(outcome="merged")
+            return row_id
+        if merged == previous:
+            LEAD_DEDUP.inc(outcome="suppressed")
+            return row_id
+        # Already posted (or being posted): send what changed as one update.
+        LEAD_DEDUP.inc(outcome="update")
+        return self._insert({**merged, "update": "true"}, webhook_url, now)
+
+    def _claim_due(self, limit: int, include_default: bool) -> list[OutboxItem]:
+        now = time.time()
+        destination = "" if include_default else " AND webhook_url IS NOT NULL"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload, attempts, webhook_url FROM outbox"
+                    f" WHERE status = 'pending' AND next_attempt <= ?{destination}"
+                    " ORDER BY next_attempt LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET next_attempt = ?, claimed_until = ? WHERE id = ?",
+                    [(now + CLAIM_LEASE_SECONDS, now + CLAIM_LEASE_SECONDS, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            OutboxItem(id=row[0], lead=json.loads(row[1]), attempts=row[2], webhook_url=row[3]) for row in rows
+        ]
+
+    def _deliver(self, ids: list[int]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = 'delivered', claimed_until = 0 WHERE id = ?", [(i,) for i in ids]
+            )
+            if self.retention_seconds and now - self._swept >= SWEEP_INTERVAL_SECONDS:
+                self._swept = now
+                self._sweep(now)
+
+    def _sweep(self, now: float) -> int:
+        """Delete delivered rows past retention; call with ``_lock`` held."""
+        return self._conn.execute(
+            "DELETE FROM outbox WHERE status = 'delivered' AND created < ?", (now - self.retention_seconds,)
+        ).rowcount
+
+    def _retry(
+        self,
+        items: list[OutboxItem],
+        delay: float,
+        error: str,
+        max_attempts: int,
+        count_attempt: bool,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            for item in items:
+                attempts = item.attempts + int(count_attempt)
+                status = "dead" if attempts >= max_attempts else "pending"
+                self._conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?,"
+                    " claimed_until = 0 WHERE id = ?",
+                    (status, attempts, now + delay, error[:500], item.id),
+                )
+
+    def _counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def _retry_after(response: httpx.Response) -> float:
+    """Seconds to wait after a 429, from the header or Discord's JSON body."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        return float(response.json().get("retry_after", 1.0))
+    except Exception:
+        return 1.0
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * 2**attempts, BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _batches(items: list[OutboxItem]) -> list[list[OutboxItem]]:
+    """Group leads by webhook so each message stays under Discord's size limit."""
+    batches: list[list[OutboxItem]] = []
+    for item in sorted(items, key=lambda i: i.webhook_url or ""):
+        if (
+            batches
+            and batches[-1][0].webhook_url == item.webhook_url
+            and len(format_leads([i.lead for i in batches[-1] + [item]])) <= DISCORD_CONTENT_LIMIT
+        ):
+            batches[-1].append(item)
+        else:
+            batches.append([item])
+    return batches
+
+
+class OutboxWorker:
+    """Background task that drains the outbox into the Discord webhook.
+
+    429 responses pause the whole worker for the advertised ``retry_after``;
+    other failures back off per lead. Up to ``batch_size`` leads are merged
+    into one webhook message.
+    """
+
+    def __init__(
+        self,
+        outbox: LeadOutbox,
+        *,
+        client: httpx.AsyncClient | None = None,
+        batch_size: int = 1,
+        max_attempts: int = 8,
+        poll_seconds: float = 5.0,
+    ) -> None:
+        self.outbox = outbox
+        self.client = client
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            # Cleared before claiming so a lead queued mid-delivery is not missed.
+            self.outbox.wakeup.clear()
+            try:
+                pause = await self.deliver_once()
+            except Exception as e:
+                print(f"Lead outbox delivery failed: {e}")
+                pause = self.poll_seconds
+            if pause is None:
+                # Queue drained; sleep until a new lead arrives or the next poll.
+                try:
+                    await asyncio.wait_for(self.outbox.wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            elif pause > 0:
+                await asyncio.sleep(pause)
+
+    async def deliver_once(self) -> float | None:
+        """Deliver one claim of due leads.
+
+        Returns ``None`` when nothing was due, otherwise how long to pause
+        before the next claim (non-zero only after a rate limit).
+        """
+        # Leads without their own webhook wait until DISCORD_WEBHOOK_URL is set.
+        include_default = bool(settings.discord_webhook_url)
+        items = await self.outbox.claim_due(self.batch_size, include_default=include_default)
+        if not items:
+            return None
+
+        batches = _batches(items)
+        for index, batch in enumerate(batches):
+            try:
+                content = format_leads([i.lead for i in batch])
+                response = await post_to_discord(content, self.client, webhook_url=batch[0].webhook_url)
+            except httpx.HTTPError as e:
+                LEAD_DELIVERIES.inc(len(batch), outcome="network_error")
+                await self.outbox.mark_retry(batch, _backoff(batch[0].attempts), repr(e), self.max_attempts)
+                continue
+
+            if response.status_code // 100 == 2:
+                LEAD_DELIVERIES.inc(len(batch), outcome="delivered")
+                await self.outbox.mark_delivered([i.id for i in batch])
+            elif response.status_code == 429:
+                LEAD_DELIVERIES.inc(outcome="rate_limited")
+                # Everything not yet posted waits out the rate limit together.
+                delay = _retry_after(response)
+                remaining = [i for b in batches[index:] for i in b]
+                await self.outbox.mark_retry(
+                    remaining, delay, "rate limited", self.max_attempts, count_attempt=False
+                )
+                return delay
+            else:
+                LEAD_DELIVERIES.inc(len(batch), outcome="http_error")
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                await self.outbox.mark_retry(batch, _backoff(batch[0].attempts), error, self.max_attempts)
+        return 0.0
+
+
+@lru_cache(maxsize=1)
+def get_outbox() -> LeadOutbox:
+    return LeadOutbox(
+        settings.outbox_db_path,
+        dedup_window_seconds=settings.lead_dedup_window_seconds,
+        retention_seconds=settings.outbox_retention_seconds,
+    )
+
+
+def build_outbox_worker(**overrides: Any) -> OutboxWorker:
+    options: dict[str, Any] = {
+        "batch_size": settings.outbox_batch_size,
+        "max_attempts": settings.outbox_max_attempts,
+    }
+    options.update(overrides)
+    return OutboxWorker(get_outbox(), **options)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass
+from typing import Iterable, Literal
+
+Intent = Literal["qa", "lead_capture", "off_topic"]
+INTENTS: tuple[Intent, ...] = ("qa", "lead_capture", "off_topic")
+
+
+@dataclass(frozen=True)
+class IntentGuess:
+    intent: Intent
+    confidence: float
+    source: str
+
+
+# High-precision rules; the first match wins. Rules at or above
+# PREROUTER_THRESHOLD skip the router LLM, so they only fire on a visitor
+# asking for sales contact or handing over their details; words such as
+# "call", "meeting" or "how much" alone also appear in product questions.
+RULES: list[tuple[re.Pattern[str], Intent, float]] = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "lead_capture", 0.97),
+    (
+        re.compile(
+            r"\b((my|our) (phone|number|cell|mobile)|(call|text|reach) (me|us))\b"
+            r"\D{0,20}(?:\+?\d[\s().-]{0,2}){7,}",
+            re.I,
+        ),
+        "lead_capture",
+        0.93,
+    ),
+    (
+        re.compile(
+            r"\b(i|we)('d| would)? (like|love|want|need) (to (book|see|get|schedule|request|set up) )?(a|an) "
+            r"(\w+ ){0,2}(demo|quote|proposal|sales call)\b"
+            r"|\b(book|schedule|set up|arrange|request)\b(?:\s+\w+){0,2}\s+(demo|sales call)\b"
+            r"|\b(send|give|get) (me|us) (a|an) (quote|proposal|price list)\b",
+            re.I,
+        ),
+        "lead_capture",
+        0.95,
+    ),
+    (
+        re.compile(
+            r"\b(please|someone|sales|your team|a rep|a representative|you)\b.{0,25}"
+            r"\b(contact|call|email|reach out to|get in touch with) (me|us)\b(?! (a|an|the|my|our|when|if|whenever)\b)"
+            r"|\b(someone|sales|your team|a rep|a representative)\b.{0,25}\b(reach out|get in touch)\b",
+            re.I,
+        ),
+        "lead_capture",
+        0.95,
+    ),
+    (re.compile(r"\b(talk|speak|chat) (to|with) (sales|someone|a human|a person|your team)\b", re.I), "lead_capture", 0.95),
+    # Often a plain product question ("how much storage do I get?"); the
+    # router LLM decides.
+    (re.compile(r"\b(demo|quote|pricing|price list|how much)\b", re.I), "lead_capture", 0.6),
+]
+
+# Seed examples for the bag-of-words fallback model.
+SEED_EXAMPLES: list[tuple[str, Intent]] = [
+    ("what does your product do", "qa"),
+    ("how does the integration with slack work", "qa"),
+    ("do you support single sign on", "qa"),
+    ("which languages are supported", "qa"),
+    ("is there an api", "qa"),
+    ("where is my data stored", "qa"),
+    ("how do i reset my password", "qa"),
+    ("what features are included", "qa"),
+    ("can i export my reports", "qa"),
+    ("do you have a mobile app", "qa"),
+    ("tell me about your company", "qa"),
+    ("is it secure and compliant", "qa"),
+    ("i want to buy this for my team", "lead_capture"),
+    ("can someone from sales contact me", "lead_capture"),
+    ("i would like a demo", "lead_capture"),
+    ("please send me a quote", "lead_capture"),
+    ("my name is alex and i work at acme", "lead_capture"),
+    ("here is my email", "lead_capture"),
+    ("we are interested in a partnership", "lead_capture"),
+    ("sign me up for a trial call", "lead_capture"),
+    ("i want to talk to your team", "lead_capture"),
+    ("what is the weather today", "off_topic"),
+    ("tell me a joke", "off_topic"),
+    ("write me a poem about cats", "off_topic"),
+    ("who won the game last night", "off_topic"),
+    ("what is the capital of france", "off_topic"),
+    ("give me a recipe for pasta", "off_topic"),
+    ("help me with my homework", "off_topic"),
+    ("what is the meaning of life", "off_topic"),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class NaiveBayesIntentModel:
+    """Multinomial naive Bayes over word unigrams and bigrams.
+
+    Tiny and dependency-free: trained at import from a few dozen examples,
+    it only needs to be sure about the easy cases; everything else falls
+    through to the LLM router.
+    """
+
+    def __init__(self, examples: Iterable[tuple[str, Intent]], alpha: float = 0.5) -> None:
+        self.alpha = alpha
+        self._counts: dict[Intent, dict[str, int]] = {intent: {} for intent in INTENTS}
+        self._totals: dict[Intent, int] = {intent: 0 for intent in INTENTS}
+        self._docs: dict[Intent, int] = {intent: 0 for intent in INTENTS}
+        vocab: set[str] = set()
+        for text, intent in examples:
+            self._docs[intent] += 1
+            for feature in self._features(text):
+                vocab.add(feature)
+                self._counts[intent][feature] = self._counts[intent].get(feature, 0) + 1
+                self._totals[intent] += 1
+        self._vocab_size = max(len(vocab), 1)
+        self._n_docs = max(sum(self._docs.values()), 1)
+
+    @staticmethod
+    def _features(text: str) -> list[str]:
+        words = _tokens(text)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def predict(self, text: str) -> tuple[Intent, float]:
+        log_scores: dict[Intent, float] = {}
+        features = self._features(text)
+        for intent in INTENTS:
+            denominator = self._totals[intent] + self.alpha * self._vocab_size
+            score = math.log((self._docs[intent] + 1) / (self._n_docs + len(INTENTS)))
+            for feature in features:
+                score += math.log((self._counts[intent].get(feature, 0) + self.alpha) / denominator)
+            log_scores[intent] = score
+        # Naive Bayes is famously overconfident on long inputs because the
+        # independence assumption multiplies evidence; temper by length.
+        temper = math.sqrt(max(len(features), 1))
+        best = max(log_scores, key=log_scores.__getitem__)
+        peak = log_scores[best]
+        total = sum(math.exp((s - peak) / temper) for s in log_scores.values())
+        return best, 1.0 / total
+
+
+_MODEL = NaiveBayesIntentModel(SEED_EXAMPLES)
+# The model only knows a few dozen examples, so product questions that share
+# words with an off-topic one ("what is the meaning of this error") can come
+# back near-certain. Its guesses stay below the default PREROUTER_THRESHOLD,
+# so only RULES skip the router LLM.
+MODEL_MAX_CONFIDENCE = 0.85
+
+
+def classify_intent(text: str) -> IntentGuess:
+    """Cheap local intent guess for a single user message."""
+    for pattern, intent, confidence in RULES:
+        if pattern.search(text):
+            return IntentGuess(intent=intent, confidence=confidence, source="rule")
+    if not _tokens(text):
+        return IntentGuess(intent="qa", confidence=0.0, source="empty")
+    intent, confidence = _MODEL.predict(text)
+    return IntentGuess(intent=intent, confidence=min(confidence, MODEL_MAX_CONFIDENCE), source="model")
@@ -1,18 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from functools import lru_cache
 from pathlib import Path
 
+from app.config import settings
+from app.metrics import KNOWLEDGE_RELOAD_SECONDS, KNOWLEDGE_RELOADS
+from app.retrieval import KNOWLEDGE_SUFFIXES, Chunk, KnowledgeIndex, build_index, load_embedder
+
+# (path, mtime_ns, size) of every knowledge file, sorted.
+Signature = tuple[tuple[str, int, int], ...]
+
+
+class KnowledgeManager:
+    """Serves the current knowledge index and reloads it when docs change.
+
+    ``watch`` polls the knowledge folder's file sizes and mtimes every
+    ``poll_seconds``. On a change the index is rebuilt in a worker thread,
+    re-analysing only the edited files, and swapped in with a single
+    assignment. A request reads ``index`` once and keeps using that version
+    until it finishes.
+    """
+
+    def __init__(
+        self,
+        docs_dir: Path,
+        index_dir: Path,
+        *,
+        chunk_chars: int,
+        embedder_name: str = "",
+        poll_seconds: float = 5.0,
+    ) -> None:
+        self.docs_dir = docs_dir
+        self.index_dir = index_dir
+        self.chunk_chars = chunk_chars
+        self.embedder_name = embedder_name
+        self.poll_seconds = poll_seconds
+        self._embedder = load_embedder(embedder_name)
+        # Analysed files from the last build, so reloads skip unchanged ones.
+        self._memo: dict[str, dict] = {}
+        self._signature = self._scan()
+        self.index: KnowledgeIndex = self._build()
+        self.loaded_at = time.time()
+        self._task: asyncio.Task[None] | None = None
+
+    def _scan(self) -> Signature:
+        if not self.docs_dir.is_dir():
+            return ()
+        entries = []
+        for path in self.docs_dir.rglob("*"):
+            if path.suffix.lower() in KNOWLEDGE_SUFFIXES and path.is_file():
+                stat = path.stat()
+                entries.append((path.as_posix(), stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def _build(self) -> KnowledgeIndex:
+        return build_index(
+            self.docs_dir,
+            self.index_dir,
+            chunk_chars=self.chunk_chars,
+            embedder=self._embedder,
+            embedder_name=self.embedder_name,
+            memo=self._memo,
+        )
 
-def load_company_knowledge() -> str:
-    """Load static company/product information from the knowledge folder.
+    def describe(self) -> dict[str, object]:
+        index = self.index
+        return {
+            "version": index.version,
+            "content_hash": index.content_hash,
+            "chunks": len(index),
+            "loaded_at": self.loaded_at,
+        }
 
-    For now this is a single small blob that is always injected
-    into the QA node prompt. When the knowledge base grows, this
-    can be replaced with a real retrieval layer.
+    async def refresh(self) -> bool:
+        """Rebuild and swap in the index if the docs changed; True if its content did."""
+        signature = await asyncio.to_thread(self._scan)
+        if signature == self._signature:
+            return False
+        start = time.perf_counter()
+        # Recorded first so a broken file is retried only once it changes again.
+        self._signature = signature
+        try:
+            index = await asyncio.to_thread(self._build)
+        except Exception:
+            KNOWLEDGE_RELOADS.inc(outcome="error")
+            raise
+        KNOWLEDGE_RELOAD_SECONDS.observe(time.perf_counter() - start)
+        changed = index.content_hash != self.index.content_hash
+        self.index = index
+        self.loaded_at = time.time()
+        KNOWLEDGE_RELOADS.inc(outcome="reloaded" if changed else "unchanged")
+        return changed
+
+    def start(self) -> None:
+        if self.poll_seconds > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                if await self.refresh():
+                    print(f"Reloaded knowledge version {self.index.version} ({len(self.index)} chunks)")
+            except Exception as e:
+                print(f"Knowledge reload failed: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_knowledge() -> KnowledgeManager:
+    """Index every markdown/text file in the knowledge folder, on first use.
+
+    The index is persisted next to the app and only files whose content
+    hash changed since the last build are re-chunked.
     """
-    root = Path(__file__).resolve().parent.parent
-    docs_path = root / "knowledge" / "company.md"
-    if docs_path.is_file():
-        return docs_path.read_text(encoding="utf-8")
-    return ""
+    return KnowledgeManager(
+        Path(settings.knowledge_dir),
+        Path(settings.knowledge_index_dir),
+        chunk_chars=settings.knowledge_chunk_chars,
+        embedder_name=settings.knowledge_embeddings_model,
+        poll_seconds=settings.knowledge_poll_seconds,
+    )
+
 
+def retrieve_knowledge(query: str, k: int | None = None, index: KnowledgeIndex | None = None) -> list[Chunk]:
+    """Return the knowledge chunks most relevant to ``query``.
+
+    Pass ``index`` to search a version already read from ``get_knowledge()``.
+    """
+    top_k = settings.retrieval_top_k if k is None else k
+    index = get_knowledge().index if index is None else index
+    return [hit.chunk for hit in index.search(query, top_k)]
 
-COMPANY_KNOWLEDGE = load_company_knowledge()
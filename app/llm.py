@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Sequence
+
+import httpx
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable
+
+from app.admission import Overloaded, get_llm_limiter
+from app.config import settings
+from app.metrics import (
+    LLM_CACHED_SHARE,
+    LLM_COST,
+    LLM_ERRORS,
+    LLM_HEDGES,
+    LLM_LATENCY,
+    LLM_MODEL_FALLBACKS,
+    LLM_TOKENS,
+)
+from app.resilience import CircuitOpen, get_breaker, get_hedger, remaining_budget
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_llm_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client shared by every chat model."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=settings.llm_http2 and _http2_available(),
+            timeout=httpx.Timeout(settings.llm_timeout_seconds, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_connections,
+            ),
+        )
+    return _http_client
+
+
+async def open_llm_connections(model: Runnable[Any, BaseMessage], connections: int) -> None:
+    """Open pooled connections to ``model``'s API host before the first call.
+
+    Any response will do; what the first real call would otherwise wait for
+    is the TCP and TLS handshake.
+    """
+    base_url = getattr(model, "openai_api_base", None) or "https://api.openai.com/v1"
+    client = get_llm_http_client()
+    results = await asyncio.gather(
+        *(client.head(base_url, timeout=5.0) for _ in range(connections)), return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        print(f"Could not pre-open LLM connections to {base_url}: {errors[0]!r}")
+
+
+async def close_llm_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def build_chat_model(tier: str, **kwargs: Any) -> ChatOpenAI:
+    """Chat model for a node's tier (see ``MODEL_TIERS``) on the shared pool.
+
+    ``langchain_openai`` is imported here rather than at module level; it is
+    the slowest import in the app and only needed once a model is built.
+    """
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=settings.model_tiers[tier],
+        http_async_client=get_llm_http_client(),
+        # Keeps token counts available when /chat/stream streams the reply.
+        stream_usage=True,
+        **kwargs,
+    )
+
+
+def model_name_of(model: Runnable[Any, BaseMessage]) -> str:
+    """Best-effort model name of a chat model or a tool-bound wrapper."""
+    for candidate in (model, getattr(model, "bound", None)):
+        name = getattr(candidate, "model_name", None)
+        if name:
+            return str(name)
+    return "unknown"
+
+
+def record_usage(node: str, model: str, response: BaseMessage) -> None:
+    """Export token counts and estimated cost from a response's usage metadata.
+
+    Prompt tokens read from the provider's prefix cache are reported
+    separately and priced at the cached rate.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt = int(usage.get("input_tokens") or 0)
+    completion = int(usage.get("output_tokens") or 0)
+    if not (prompt or completion):
+        return
+    cached = int((usage.get("input_token_details") or {}).get("cache_read") or 0)
+    LLM_TOKENS.inc(prompt, node=node, model=model, kind="prompt")
+    LLM_TOKENS.inc(cached, node=node, model=model, kind="cached_prompt")
+    LLM_TOKENS.inc(completion, node=node, model=model, kind="completion")
+    if prompt:
+        LLM_CACHED_SHARE.observe(cached / prompt, node=node, model=model)
+    price = settings.llm_prices.get(model)
+    if price is not None:
+        cost = (prompt - cached) * price[0] + completion * price[1] + cached * price[2]
+        LLM_COST.inc(cost / 1_000_000, node=node, model=model)
+
+
+_variants: dict[tuple[int, str], tuple[Runnable[Any, BaseMessage], Runnable[Any, BaseMessage]]] = {}
+
+
+def with_model(model: Runnable[Any, BaseMessage], model_name: str) -> Runnable[Any, BaseMessage]:
+    """``model``, or the chat model inside its tool binding, re-targeted at ``model_name``.
+
+    The copy keeps the bound tools, parameters and shared HTTP clients.
+    """
+    key = (id(model), model_name)
+    cached = _variants.get(key)
+    if cached is not None and cached[0] is model:
+        return cached[1]
+    bound = getattr(model, "bound", None)
+    if bound is not None and hasattr(bound, "model_name"):
+        variant = model.model_copy(update={"bound": bound.model_copy(update={"model_name": model_name})})
+    else:
+        variant = model.model_copy(update={"model_name": model_name})
+    _variants[key] = (model, variant)
+    return variant
+
+
+def fallback_chain(model: Runnable[Any, BaseMessage]) -> list[tuple[str, Runnable[Any, BaseMessage]]]:
+    """The node's own model followed by ``LLM_FALLBACK_MODELS``."""
+    chain = [(model_name_of(model), model)]
+    for name in settings.llm_fallback_models:
+        if all(name != known for known, _ in chain):
+            chain.append((name, with_model(model, name)))
+    return chain
+
+
+def _consume_result(task: asyncio.Future[Any]) -> None:
+    # Losing attempts may fail after the call returned; don't log them as unhandled.
+    if not task.cancelled():
+        task.exception()
+
+
+async def _attempt(
+    model: Runnable[Any, BaseMessage],
+    messages: Sequence[BaseMessage],
+    *,
+    name: str,
+    model_name: str,
+    config: dict[str, Any] | None = None,
+) -> BaseMessage:
+    """One request: take a concurrency slot, call the model, record metrics."""
+    async with get_llm_limiter().slot(model_name):
+        start = time.perf_counter()
+        # Cancelled calls (hedge losers, abandoned turns) are labelled apart
+        # so they do not pass for completed round trips.
+        outcome = "cancelled"
+        try:
+            response = await model.ainvoke(list(messages), config=config)
+            outcome = "ok"
+        except Exception:
+            outcome = "error"
+            LLM_ERRORS.inc(node=name, model=model_name, reason="error")
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            LLM_LATENCY.observe(elapsed, node=name, model=model_name, outcome=outcome)
+    hedger = get_hedger()
+    if hedger is not None:
+        hedger.observe(name, model_name, elapsed)
+    record_usage(name, model_name, response)
+    return response
+
+
+async def _hedged_call(
+    model: Runnable[Any, BaseMessage],
+    messages: Sequence[BaseMessage],
+    *,
+    name: str,
+    model_name: str,
+    budget: float,
+) -> BaseMessage:
+    """Call ``model`` within ``budget`` seconds, hedging if it is slow.
+
+    Once the primary request outlives the recent p95 latency, an identical
+    request is sent and whichever succeeds first is used; the other is
+    cancelled. Raises ``asyncio.TimeoutError`` when the budget runs out.
+    """
+    end = time.monotonic() + budget
+    hedger = get_hedger()
+    delay = hedger.delay(name, model_name) if hedger is not None else None
+
+    primary = asyncio.ensure_future(_attempt(model, messages, name=name, model_name=model_name))
+    primary.add_done_callback(_consume_result)
+    pending: set[asyncio.Future[BaseMessage]] = {primary}
+    hedge: asyncio.Future[BaseMessage] | None = None
+    errors: list[BaseException] = []
+    try:
+        if hedger is not None and delay is not None and delay < budget:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                if hedger.budget_left():
+                    # The duplicate runs without callbacks, so it neither
+                    # streams tokens nor shows up twice in traces.
+                    hedge = asyncio.ensure_future(
+                        _attempt(model, messages, name=name, model_name=model_name, config={"callbacks": []})
+                    )
+                    hedge.add_done_callback(_consume_result)
+                    pending.add(hedge)
+                    LLM_HEDGES.inc(node=name, model=model_name, outcome="launched")
+                else:
+                    LLM_HEDGES.inc(node=name, model=model_name, outcome="over_budget")
+            hedger.record_call(hedge is not None)
+
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(end - time.monotonic(), 0.0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                LLM_ERRORS.inc(node=name, model=model_name, reason="timeout")
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    if hedge is not None:
+                        LLM_HEDGES.inc(node=name, model=model_name, outcome="won" if task is hedge else "lost")
+                    return task.result()
+                errors.append(task.exception())  # type: ignore[arg-type]
+        raise errors[0]
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def ainvoke_llm(
+    model: Runnable[Any, BaseMessage],
+    messages: Sequence[BaseMessage],
+    *,
+    name: str,
+    timeout: float | None = None,
+) -> BaseMessage:
+    """Call a chat model on the async path with deadlines, hedging and fallbacks.
+
+    ``name`` labels the call site in metrics. The models in the fallback
+    chain are tried in order, skipping those whose circuit breaker is open.
+    The time left (the per-call timeout, capped by the turn deadline) is
+    split evenly over the models still to try, and slow requests are
+    hedged.
+
+    Raises ``app.admission.Overloaded`` if no concurrency slot frees up in
+    time, ``CircuitOpen`` (also an ``Overloaded``) if every breaker is open,
+    and the last model's error, e.g. ``asyncio.TimeoutError``, if all
+    fail. Cancelling the awaiting task also cancels in-flight requests.
+    """
+    limit = settings.llm_timeout_seconds if timeout is None else timeout
+    budget = remaining_budget(name)
+    end = time.monotonic() + (limit if budget is None else min(limit, budget))
+    chain = fallback_chain(model)
+    error: BaseException | None = None
+    retry_after = float("inf")
+
+    for index, (model_name, candidate) in enumerate(chain):
+        breaker = get_breaker(model_name)
+        if not breaker.allow():
+            retry_after = min(retry_after, breaker.retry_after())
+            if index + 1 < len(chain):
+                LLM_MODEL_FALLBACKS.inc(node=name, model=model_name, reason="circuit_open")
+            continue
+
+        later = sum(1 for other, _ in chain[index + 1 :] if get_breaker(other).state != "open")
+        attempt_budget = (end - time.monotonic()) / (1 + later)
+        if attempt_budget <= 0:
+            breaker.abandon()
+            LLM_ERRORS.inc(node=name, model=model_name, reason="deadline")
+            raise asyncio.TimeoutError()
+
+        try:
+            response = await _hedged_call(
+                candidate, messages, name=name, model_name=model_name, budget=attempt_budget
+            )
+        except Overloaded:
+            breaker.abandon()
+            raise
+        except Exception as exc:
+            breaker.record_failure()
+            error = exc
+            if index + 1 < len(chain):
+                reason = "timeout" if isinstance(exc, asyncio.TimeoutError) else "error"
+                LLM_MODEL_FALLBACKS.inc(node=name, model=model_name, reason=reason)
+            continue
+        except BaseException:
+            breaker.abandon()
+            raise
+        breaker.record_success()
+        return response
+
+    if error is not None:
+        raise error
+    raise CircuitOpen(retry_after)
@@ -1,68 +1,595 @@
 from __future__ import annotations
 
-from typing import Dict
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, TypeVar
 
-from fastapi import FastAPI, HTTPException
-from langchain_core.messages import HumanMessage
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, Field, ValidationError
+from starlette.requests import HTTPConnection
 
-from app.graph import app as graph_app
+from app.admission import BUSY_REPLY, Overloaded, get_llm_limiter, get_rate_limiter
+from app.batch import parse_batch, replay
+from app.cache import get_qa_cache
+from app.config import settings
+from app.graph import get_graph, uses_fused_graph
+from app.history import History, Message, last_message
+from app.integrations.discord import close_http_client
+from app.idempotency import IdempotencyStore, build_idempotency_store, request_fingerprint
+from app.integrations.outbox import build_outbox_worker
+from app.knowledge import get_knowledge
+from app.llm import close_llm_http_client, open_llm_connections
+from app.metrics import (
+    CONTENT_TYPE,
+    DEGRADED_REPLIES,
+    RATE_LIMITED,
+    REGISTRY,
+    TIME_TO_FIRST_TOKEN,
+    TURN_LATENCY,
+)
+from app.nodes.fused import get_fused_llm
+from app.nodes.lead_capture import get_reply_llm
+from app.nodes.memory import compact_memory, fold_due, get_summary_llm
+from app.nodes.qa import cached_answer, get_llm
+from app.nodes.router import get_router_llm
+from app.resilience import breaker_states, hedging_disabled, turn_deadline
+from app.sessions import SessionLocks, SessionStore, build_session_store
 from app.state import ChatState
+from app.tenants import (
+    SESSION_ID_PATTERN,
+    Tenant,
+    TenantPathMiddleware,
+    default_tenant,
+    get_tenants,
+    run_config,
+)
 
 
-app = FastAPI(title="Product Support Chatbot")
+def preload() -> None:
+    """Build the knowledge index, chat models and compiled graphs.
+
+    Opens no connections and starts no tasks, so ``app.serve`` can run it
+    once in the parent and fork workers that share the result.
+    """
+    get_knowledge()
+    get_router_llm()
+    get_llm()
+    get_reply_llm()
+    get_summary_llm()
+    get_graph(False)
+    if settings.fused_routing_share > 0:
+        get_fused_llm()
+        get_graph(True)
+
+
+async def warm_up() -> None:
+    """Build what the first request would otherwise wait for.
+
+    Importing the app builds nothing; the knowledge index, chat models,
+    compiled graph and LLM connections are set up here, before the server
+    accepts traffic. In a forked worker only the connections are new.
+    """
+    start = time.perf_counter()
+    await asyncio.to_thread(preload)
+    if settings.llm_warmup_connections > 0:
+        await open_llm_connections(get_llm(), settings.llm_warmup_connections)
+    print(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    await warm_up()
+    # Deliver queued leads in the background for the lifetime of the server.
+    worker = build_outbox_worker()
+    worker.start()
+    # Pick up edits to the knowledge folder without a restart.
+    get_knowledge().start()
+    try:
+        yield
+    finally:
+        await get_knowledge().stop()
+        await cancel_folds()
+        await get_tenants().close()
+        await worker.stop()
+        await close_http_client()
+        await close_llm_http_client()
+
+
+app = FastAPI(title="Product Support Chatbot", lifespan=lifespan)
+app.add_middleware(TenantPathMiddleware)
+
+T = TypeVar("T")
+
+# How often a running turn checks whether the client is still connected.
+DISCONNECT_POLL_SECONDS = 0.25
+
+# Graph nodes whose model output is user-facing and worth streaming. The
+# speculative node is left out: its answer may be discarded once the router
+# decides, so with SPECULATIVE_ROUTING the reply arrives as one token.
+STREAMED_NODES = frozenset({"qa", "lead_capture", "off_topic", "fused"})
 
 
 class ChatRequest(BaseModel):
-    session_id: str
+    session_id: str = Field(pattern=SESSION_ID_PATTERN)
     message: str
 
 
 class ChatResponse(BaseModel):
     reply: str
     lead_status: str | None = None
+    # True when the service was overloaded and the reply is a fallback.
+    degraded: bool = False
 
 
-# Simple in-memory session store for now.
-SESSIONS: Dict[str, ChatState] = {}
+SESSIONS: SessionStore = build_session_store()
+# Turns of one session run strictly one after another.
+SESSION_LOCKS = SessionLocks()
+# Degraded replies are not replayed, so a retry gets a real answer.
+IDEMPOTENCY: IdempotencyStore[ChatResponse] = build_idempotency_store(
+    keep_result=lambda response: not response.degraded,
+    encode=lambda response: response.model_dump_json(),
+    decode=ChatResponse.model_validate_json,
+)
+
+REGISTRY.gauge_callback(
+    "chatbot_session_store_events",
+    "Session store hits, misses and evictions since start.",
+    lambda: [({"event": k}, v) for k, v in SESSIONS.stats_snapshot().items()],
+)
+REGISTRY.gauge_callback(
+    "chatbot_qa_cache_events",
+    "QA cache hits, misses, evictions and hit rate since start.",
+    lambda: [({"event": k}, v) for k, v in get_qa_cache().stats_snapshot().items()],
+)
+REGISTRY.gauge_callback(
+    "chatbot_llm_slots",
+    "LLM calls holding or waiting for a concurrency slot.",
+    lambda: [
+        ({"state": "active"}, get_llm_limiter().active),
+        ({"state": "waiting"}, get_llm_limiter().waiting),
+    ],
+)
+REGISTRY.gauge_callback(
+    "chatbot_tenants_loaded",
+    "Tenant knowledge bases currently held in memory.",
+    lambda: [({}, float(get_tenants().loaded))],
+)
+REGISTRY.gauge_callback(
+    "chatbot_llm_breaker_open",
+    "1 for each model whose circuit breaker is open or half-open.",
+    lambda: [({"model": model}, float(state != "closed")) for model, state in breaker_states().items()],
+)
 
 
 def get_initial_state() -> ChatState:
     return {
-        "messages": [],
+        "messages": History(),
         "user_profile": {},
         "lead_status": "none",
     }
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse:
-    if not request.message.strip():
+async def run_until_disconnect(http_request: Request, work: Awaitable[T]) -> T:
+    """Await ``work`` but cancel it as soon as the client goes away.
+
+    Cancellation propagates into the graph run, so any in-flight LLM
+    request is aborted instead of finishing for nobody.
+    """
+    task: asyncio.Future[Any] = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                # 499 mirrors nginx's "client closed request"; nobody reads it.
+                raise HTTPException(status_code=499, detail="Client disconnected.")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def resolve_tenant(connection: HTTPConnection) -> Tenant:
+    """The tenant named by the X-Tenant-ID header or /t/<tenant> prefix.
+
+    404 if unknown; 503 if its ``tenant.json`` cannot be read, until it is fixed.
+    """
+    tenant_id = connection.headers.get("x-tenant-id")
+    try:
+        return get_tenants().get(tenant_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown tenant.")
+    except (OSError, ValueError) as e:
+        print(f"Tenant {tenant_id!r} is misconfigured: {e}")
+        raise HTTPException(status_code=503, detail="This site's assistant is misconfigured.")
+
+
+def check_message(message: str) -> None:
+    if not message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty.")
 
-    state = SESSIONS.get(request.session_id) or get_initial_state()
 
-    # Append the latest user message.
-    state["messages"] = (state.get("messages") or []) + [
-        HumanMessage(content=request.message)
-    ]
+def client_ip(connection: HTTPConnection) -> str:
+    if settings.trust_forwarded_for:
+        forwarded = connection.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return connection.client.host if connection.client else "unknown"
+
+
+def check_rate_limits(session_id: str, connection: HTTPConnection) -> None:
+    """Raise 429 with Retry-After when the session or client IP is over its rate."""
+    for scope, key in (("session", session_id), ("ip", client_ip(connection))):
+        wait = get_rate_limiter(scope).acquire(key)
+        if wait > 0:
+            RATE_LIMITED.inc(scope=scope)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many messages; please slow down.",
+                headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+            )
+
 
-    # Run one step of the LangGraph app.
-    new_state: ChatState = await graph_app.ainvoke(state)
+async def degraded_response(state: ChatState, exc: Overloaded, config: RunnableConfig) -> ChatResponse:
+    """Answer an overloaded turn from the QA cache or with a static reply.
 
+    The session is left untouched, so the user can simply ask again. With
+    degraded mode off the turn fails with 503 and Retry-After.
+    """
+    if not settings.degraded_mode:
+        raise HTTPException(
+            status_code=503,
+            detail="The assistant is busy; please retry shortly.",
+            headers={"Retry-After": str(int(exc.retry_after))},
+        )
+    configurable = config["configurable"]
+    reply = await cached_answer(state, configurable["tenant"], configurable["knowledge"].index)
+    DEGRADED_REPLIES.inc(source="static" if reply is None else "cache", reason=exc.reason)
+    return ChatResponse(reply=reply or BUSY_REPLY, lead_status=state.get("lead_status"), degraded=True)
+
+
+async def begin_turn(session_id: str, message: str) -> ChatState:
+    """Build the graph input for one turn of a session.
+
+    Callers hold the session's lock from here until ``finish_turn``.
+    """
+    check_message(message)
+
+    stored = await SESSIONS.get(session_id) or get_initial_state()
+
+    # Append the latest user message without touching the stored state, so a
+    # cancelled turn leaves the session exactly as it was.
+    return {
+        **stored,
+        "messages": (stored.get("messages") or History()).appended([Message("human", message)]),
+    }
+
+
+async def finish_turn(session_id: str, new_state: ChatState, tenant: Tenant) -> ChatResponse:
+    """Persist the graph output and extract this turn's reply."""
     # Persist merged state back to the session store.
-    SESSIONS[request.session_id] = new_state
+    await SESSIONS.set(session_id, new_state)
+    schedule_fold(session_id, new_state, tenant)
 
-    messages = new_state.get("messages") or []
     # Find the last assistant message for this turn.
-    reply_text = ""
-    for msg in reversed(messages):
-        if msg.type == "ai":
-            reply_text = str(msg.content)
-            break
+    reply = last_message(new_state.get("messages") or [], "ai")
+    reply_text = reply.content if reply is not None else ""
 
     if not reply_text:
         raise HTTPException(status_code=500, detail="No reply generated.")
 
     lead_status = new_state.get("lead_status")
     return ChatResponse(reply=reply_text, lead_status=lead_status)
+
+
+# Summary folds running in the background, one per session at most.
+FOLDS: dict[str, asyncio.Task[None]] = {}
+
+
+def schedule_fold(session_id: str, state: ChatState, tenant: Tenant) -> None:
+    """Fold old turns of ``state`` into its summary without holding up the reply.
+
+    The summary call runs after the turn is saved; its result is written
+    into the session under the session lock, on top of any turns that
+    arrived meanwhile. Until it lands, prompts are bounded by the history
+    windows alone.
+    """
+    if session_id in FOLDS:
+        return
+    folded, upto = fold_due(state)
+    if not folded:
+        return
+    task = asyncio.create_task(fold_memory(session_id, state, folded, upto, tenant))
+    FOLDS[session_id] = task
+    task.add_done_callback(lambda _: FOLDS.pop(session_id, None))
+
+
+async def fold_memory(
+    session_id: str, state: ChatState, folded: list[Message], upto: int, tenant: Tenant
+) -> None:
+    update = await compact_memory(state, folded, upto, tenant)
+    if not update:
+        return
+    async with SESSION_LOCKS.hold(session_id):
+        current = await SESSIONS.get(session_id)
+        # Skip if the session was reset, expired or already folded past here.
+        if current is None or current.get("summarized_upto", 0) != state.get("summarized_upto", 0):
+            return
+        if len(current.get("messages") or ()) < upto:
+            return
+        await SESSIONS.set(session_id, {**current, **update})
+
+
+async def cancel_folds() -> None:
+    """Drop unfinished folds on shutdown; the next turn schedules them again."""
+    tasks = list(FOLDS.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _arm(fused: bool) -> str:
+    return "fused" if fused else "routed"
+
+
+async def tenant_run_config(tenant: Tenant) -> RunnableConfig:
+    """Run config for one of ``tenant``'s turns, loading its knowledge if needed."""
+    return run_config(tenant, await get_tenants().knowledge(tenant))
+
+
+async def run_turn(session_id: str, message: str, tenant: Tenant | None = None) -> ChatResponse:
+    tenant = tenant or default_tenant()
+    session_key = tenant.session_key(session_id)
+    async with SESSION_LOCKS.hold(session_key):
+        state = await begin_turn(session_key, message)
+        config = await tenant_run_config(tenant)
+
+        # Run one step of the LangGraph app.
+        fused = uses_fused_graph(session_key)
+        try:
+            with (
+                TURN_LATENCY.time(endpoint="chat", arm=_arm(fused)),
+                turn_deadline(settings.turn_deadline_seconds),
+            ):
+                new_state: ChatState = await get_graph(fused).ainvoke(state, config)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Model timed out.")
+        except Overloaded as exc:
+            return await degraded_response(state, exc, config)
+
+        return await finish_turn(session_key, new_state, tenant)
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    idempotency_key: str | None = Header(default=None),
+) -> ChatResponse:
+    """Run one turn of a session.
+
+    Retries that repeat the ``Idempotency-Key`` header get the original
+    turn's reply instead of running it again, without spending a
+    rate-limit token.
+    """
+    tenant = resolve_tenant(http_request)
+    session_key = tenant.session_key(request.session_id)
+    check_message(request.message)
+    if not idempotency_key:
+        check_rate_limits(session_key, http_request)
+        return await run_until_disconnect(http_request, run_turn(request.session_id, request.message, tenant))
+
+    async def charged_turn() -> ChatResponse:
+        # Only a run of the turn is charged; replays of its result are not.
+        check_rate_limits(session_key, http_request)
+        return await run_turn(request.session_id, request.message, tenant)
+
+    return await run_until_disconnect(
+        http_request,
+        IDEMPOTENCY.run(
+            # Neither session ids nor header values may hold NUL.
+            f"{session_key}\0{idempotency_key}",
+            request_fingerprint(session_key, request.message),
+            charged_turn,
+        ),
+    )
+
+
+async def stream_turn(
+    session_id: str, message: str, tenant: Tenant | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    """Run one turn and yield ``token`` events followed by a ``done`` event.
+
+    Tokens come from LangGraph's ``messages`` stream. Nodes that produce
+    their reply in one piece (lead capture answers through a tool call)
+    show up as a single token, as does every reply with
+    ``SPECULATIVE_ROUTING``. ``done`` carries the full reply, the new
+    ``lead_status`` and time-to-first-token in milliseconds.
+    """
+    tenant = tenant or default_tenant()
+    session_key = tenant.session_key(session_id)
+    async with SESSION_LOCKS.hold(session_key):
+        state = await begin_turn(session_key, message)
+        config = await tenant_run_config(tenant)
+        async for event in _stream_graph(session_key, state, config):
+            yield event
+
+
+async def _stream_graph(
+    session_key: str, state: ChatState, config: RunnableConfig
+) -> AsyncIterator[dict[str, Any]]:
+    start = time.perf_counter()
+    first_token_ms: float | None = None
+    new_state: ChatState | None = None
+    fused = uses_fused_graph(session_key)
+
+    try:
+        # Hedged duplicates would interleave their tokens with the primary's.
+        with turn_deadline(settings.turn_deadline_seconds), hedging_disabled():
+            async for mode, chunk in get_graph(fused).astream(
+                state, config, stream_mode=["messages", "values"]
+            ):
+                if mode == "values":
+                    new_state = chunk
+                    continue
+                message, metadata = chunk
+                if metadata.get("langgraph_node") not in STREAMED_NODES:
+                    continue
+                if not isinstance(message, (AIMessage, AIMessageChunk)) or not message.content:
+                    continue
+                # Skip the assembled message when its tokens were already sent.
+                if not isinstance(message, AIMessageChunk) and first_token_ms is not None:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                    TIME_TO_FIRST_TOKEN.observe(first_token_ms / 1000)
+                yield {"event": "token", "data": {"text": str(message.content)}}
+    except asyncio.TimeoutError:
+        yield {"event": "error", "data": {"detail": "Model timed out."}}
+        return
+    except Overloaded as exc:
+        try:
+            response = await degraded_response(state, exc, config)
+        except HTTPException as busy:
+            yield {"event": "error", "data": {"detail": busy.detail, "retry_after": exc.retry_after}}
+            return
+        yield {"event": "token", "data": {"text": response.reply}}
+        yield {"event": "done", "data": response.model_dump()}
+        return
+
+    try:
+        if new_state is None:
+            raise HTTPException(status_code=500, detail="No reply generated.")
+        response = await finish_turn(session_key, new_state, config["configurable"]["tenant"])
+    except HTTPException as exc:
+        yield {"event": "error", "data": {"detail": exc.detail}}
+        return
+
+    if first_token_ms is None:
+        first_token_ms = (time.perf_counter() - start) * 1000
+        TIME_TO_FIRST_TOKEN.observe(first_token_ms / 1000)
+        yield {"event": "token", "data": {"text": response.reply}}
+
+    TURN_LATENCY.observe(time.perf_counter() - start, endpoint="stream", arm=_arm(fused))
+
+    yield {
+        "event": "done",
+        "data": {
+            **response.model_dump(),
+            "ttft_ms": round(first_token_ms, 1),
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        },
+    }
+
+
+def _sse(event: dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request) -> StreamingResponse:
+    """Server-Sent Events variant of ``/chat``.
+
+    Starlette cancels the generator when the client disconnects, which
+    aborts the graph run before the session is saved.
+    """
+    tenant = resolve_tenant(http_request)
+    check_message(request.message)
+    check_rate_limits(tenant.session_key(request.session_id), http_request)
+
+    async def body() -> AsyncIterator[str]:
+        async for event in stream_turn(request.session_id, request.message, tenant):
+            yield _sse(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request, concurrency: int | None = None) -> StreamingResponse:
+    """Replay many sessions from a JSONL body; results stream back as JSONL.
+
+    See ``app.batch.parse_batch`` for the input format. Each output line is
+    one turn with its reply, route and latency. Enabled with BATCH_ENABLED.
+    """
+    if not settings.batch_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    tenant = resolve_tenant(request)
+    try:
+        sessions = parse_batch((await request.body()).decode("utf-8"), max_turns=settings.batch_max_turns)
+    except (UnicodeDecodeError, ValueError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    limit = min(concurrency or settings.batch_max_concurrency, settings.batch_max_concurrency)
+
+    async def run(session_id: str, message: str) -> ChatResponse:
+        return await run_turn(session_id, message, tenant)
+
+    async def forget(session_id: str) -> None:
+        await SESSIONS.delete(tenant.session_key(session_id))
+
+    async def body() -> AsyncIterator[str]:
+        async for result in replay(
+            sessions,
+            run,
+            concurrency=limit,
+            # Control characters never occur in client session ids.
+            namespace=f"batch\x1f{uuid.uuid4().hex[:12]}\x1f",
+            forget=forget,
+        ):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket) -> None:
+    """WebSocket variant of ``/chat/stream``; one JSON request per turn."""
+    try:
+        tenant = resolve_tenant(websocket)
+    except HTTPException as exc:
+        # 4000 + the HTTP status, as close codes 4000-4999 are free for applications.
+        await websocket.close(code=4000 + exc.status_code, reason=exc.detail)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                request = ChatRequest.model_validate(await websocket.receive_json())
+                check_message(request.message)
+                check_rate_limits(tenant.session_key(request.session_id), websocket)
+            except (ValidationError, ValueError) as exc:
+                await websocket.send_json({"event": "error", "detail": str(exc)})
+                continue
+            except HTTPException as exc:
+                error = {"event": "error", "detail": exc.detail}
+                if exc.headers and "Retry-After" in exc.headers:
+                    error["retry_after"] = float(exc.headers["Retry-After"])
+                await websocket.send_json(error)
+                continue
+
+            async for event in stream_turn(request.session_id, request.message, tenant):
+                await websocket.send_json({"event": event["event"], **event["data"]})
+    except WebSocketDisconnect:
+        return
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus text exposition of the in-process metrics."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/knowledge")
+async def knowledge(request: Request) -> dict[str, object]:
+    """Version and content hash of the tenant's knowledge index currently served."""
+    tenant = resolve_tenant(request)
+    return {"tenant": tenant.id, **(await get_tenants().knowledge(tenant)).describe()}
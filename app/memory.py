@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Callable, Sequence
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from app.history import Message, to_langchain
+from app.state import ChatState
+
+# Rough per-message overhead of the chat format (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _encoder() -> Callable[[str], list[int]] | None:
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base").encode
+    except Exception:
+        # tiktoken missing or its BPE file not cached locally.
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally; falls back to ~4 chars/token without tiktoken."""
+    encode = _encoder()
+    if encode is None:
+        return len(text) // 4 + 1
+    return len(encode(text))
+
+
+def message_tokens(message: Message) -> int:
+    return count_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def window_messages(messages: Sequence[Message], budget: int) -> list[Message]:
+    """Return the newest messages that fit in ``budget`` tokens.
+
+    The latest message is always kept. Work is proportional to the window,
+    not to the length of the conversation.
+    """
+    window: list[Message] = []
+    used = 0
+    for message in reversed(messages):
+        cost = message_tokens(message)
+        if window and used + cost > budget:
+            break
+        window.append(message)
+        used += cost
+    window.reverse()
+    return window
+
+
+def recent_history(state: ChatState, budget: int) -> list[BaseMessage]:
+    """Unsummarized messages from ``state``, trimmed to a node's token budget.
+
+    Returned as LangChain messages, ready to go into a prompt.
+    """
+    messages = state.get("messages") or []
+    return to_langchain(window_messages(messages[state.get("summarized_upto", 0) :], budget))
+
+
+def summary_messages(state: ChatState) -> list[BaseMessage]:
+    """System message carrying the rolling summary of older turns, if any.
+
+    Goes after a node's static instructions so the prompt prefix that
+    providers cache stays identical between turns.
+    """
+    summary = state.get("summary")
+    if not summary:
+        return []
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")]
+
+
+def split_for_summary(state: ChatState, trigger: int, keep: int) -> tuple[list[Message], int]:
+    """Pick the messages to fold into the summary on this turn.
+
+    Nothing is folded until the unsummarized history exceeds ``trigger``
+    tokens; then everything but the newest ``keep`` tokens is folded.
+    Returns the messages to fold and the new ``summarized_upto`` index.
+    """
+    messages = state.get("messages") or []
+    start = state.get("summarized_upto", 0)
+    pending = messages[start:]
+    if sum(message_tokens(m) for m in pending) <= trigger:
+        return [], start
+    kept = window_messages(pending, keep)
+    end = len(messages) - len(kept)
+    return messages[start:end], end
@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Latency buckets in seconds, tuned for LLM round trips.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(values: dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in values.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_labels(labels), 0.0)
+
+    def total(self, **labels: str) -> float:
+        """Sum over every series whose labels include ``labels``."""
+        wanted = set(_labels(labels))
+        return sum(value for key, value in self._values.items() if wanted <= set(key))
+
+    def render(self, const: Labels = ()) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(labels, const)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (non-cumulative), sum, count.
+        self._series: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+        counts, totals = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def count(self, **labels: str) -> int:
+        """Observations over every series whose labels include ``labels``."""
+        wanted = set(_labels(labels))
+        return int(sum(totals[1] for key, (_, totals) in self._series.items() if wanted <= set(key)))
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, const: Labels = ()) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, totals) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                yield f"{self.name}_bucket{_format_labels(labels + const, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels, const)} {_format_value(totals[0])}"
+            yield f"{self.name}_count{_format_labels(labels, const)} {_format_value(totals[1])}"
+
+
+class GaugeCallback:
+    """Gauge whose samples are read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Iterable[tuple[dict[str, str], float]]]) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self, const: Labels = ()) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.collect():
+            yield f"{self.name}{_format_labels(_labels(labels), const)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | GaugeCallback] = {}
+        self._const: Labels = ()
+
+    def label_all(self, **labels: str) -> None:
+        """Add ``labels`` to every rendered sample, e.g. the worker process."""
+        self._const = _labels(labels)
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def gauge_callback(
+        self, name: str, help: str, collect: Callable[[], Iterable[tuple[dict[str, str], float]]]
+    ) -> GaugeCallback:
+        return self._register(GaugeCallback(name, help, collect))
+
+    def _register(self, metric):  # type: ignore[no-untyped-def]
+        # Re-registering returns the existing metric so module reloads are safe.
+        return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render(self._const))
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Exposition format version served at /metrics.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+NODE_LATENCY = REGISTRY.histogram(
+    "chatbot_node_duration_seconds", "Wall time of each graph node."
+)
+NODE_ERRORS = REGISTRY.counter("chatbot_node_errors_total", "Graph node runs that raised.")
+TURN_LATENCY = REGISTRY.histogram(
+    "chatbot_turn_duration_seconds", "End-to-end graph run per chat turn, by endpoint and graph arm."
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "chatbot_time_to_first_token_seconds", "Time to first streamed token on /chat/stream."
+)
+SESSION_LOCK_WAIT = REGISTRY.histogram(
+    "chatbot_session_lock_wait_seconds", "Time a turn waited for an earlier turn of its session."
+)
+SESSION_WRITE_BYTES = REGISTRY.counter(
+    "chatbot_session_write_bytes_total",
+    "Session data written to disk, by kind: whole states, turn log records or compacted snapshots.",
+)
+IDEMPOTENT_REPLAYS = REGISTRY.counter(
+    "chatbot_idempotent_replays_total", "Requests answered from an earlier request with the same key."
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "chatbot_llm_duration_seconds", "Latency of individual LLM calls, by outcome (ok, error, cancelled)."
+)
+LLM_TOKENS = REGISTRY.counter(
+    "chatbot_llm_tokens_total",
+    "LLM tokens by node, model and kind (prompt/completion; cached_prompt is part of prompt).",
+)
+LLM_CACHED_SHARE = REGISTRY.histogram(
+    "chatbot_llm_cached_prompt_ratio",
+    "Per call, the share of prompt tokens served from the provider's prefix cache.",
+    buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0),
+)
+LLM_COST = REGISTRY.counter("chatbot_llm_cost_usd_total", "Estimated LLM spend in USD.")
+LLM_ERRORS = REGISTRY.counter(
+    "chatbot_llm_errors_total", "Failed LLM calls by node and reason (timeout/error)."
+)
+LLM_ADMISSIONS = REGISTRY.counter(
+    "chatbot_llm_admissions_total", "LLM call admission outcomes (admitted/queued/queue_full/queue_timeout)."
+)
+LLM_QUEUE_WAIT = REGISTRY.histogram(
+    "chatbot_llm_queue_wait_seconds", "Time LLM calls waited for a concurrency slot."
+)
+RATE_LIMITED = REGISTRY.counter(
+    "chatbot_rate_limited_total", "Requests rejected by the per-session or per-IP rate limit."
+)
+DEGRADED_REPLIES = REGISTRY.counter(
+    "chatbot_degraded_replies_total", "Overloaded turns answered from the cache or a static reply."
+)
+LLM_HEDGES = REGISTRY.counter(
+    "chatbot_llm_hedges_total", "Hedged LLM requests by outcome (launched/won/lost/over_budget)."
+)
+LLM_MODEL_FALLBACKS = REGISTRY.counter(
+    "chatbot_llm_model_fallbacks_total", "LLM calls moved to the next model in the fallback chain."
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    "chatbot_circuit_breaker_transitions_total", "Circuit breaker state changes per model."
+)
+FALLBACKS = REGISTRY.counter(
+    "chatbot_fallbacks_total", "Degraded paths taken instead of the normal flow."
+)
+ROUTING_DECISIONS = REGISTRY.counter(
+    "chatbot_routing_decisions_total", "Router outcomes by intent and decision source."
+)
+LEAD_DELIVERIES = REGISTRY.counter(
+    "chatbot_lead_deliveries_total", "Lead outbox delivery outcomes."
+)
+LEAD_DEDUP = REGISTRY.counter(
+    "chatbot_lead_dedup_total",
+    "Repeat leads within the dedup window: merged into a queued lead, sent as an update, or suppressed.",
+)
+LEAD_TURNS = REGISTRY.counter(
+    "chatbot_lead_turns_total", "Lead capture turns by path (local = no LLM call, proposed = from the fused call)."
+)
+
+
+def _lead_llm_free_ratio() -> Iterable[tuple[dict[str, str], float]]:
+    local = LEAD_TURNS.value(path="local")
+    total = local + LEAD_TURNS.value(path="llm")
+    yield {}, local / total if total else 0.0
+
+
+LEAD_LLM_FREE_RATIO = REGISTRY.gauge_callback(
+    "chatbot_lead_llm_free_ratio", "Share of lead capture turns handled without an LLM call.", _lead_llm_free_ratio
+)
+SPECULATION = REGISTRY.counter(
+    "chatbot_speculation_total", "Speculative routing outcomes (hit/miss/skipped)."
+)
+SPECULATION_SAVED = REGISTRY.histogram(
+    "chatbot_speculation_saved_seconds", "Latency saved by committed speculative answers."
+)
+KNOWLEDGE_RELOADS = REGISTRY.counter(
+    "chatbot_knowledge_reloads_total", "Knowledge folder changes picked up (reloaded/unchanged/error)."
+)
+KNOWLEDGE_RELOAD_SECONDS = REGISTRY.histogram(
+    "chatbot_knowledge_reload_seconds", "Time to rebuild and swap in the knowledge index."
+)
+TENANT_LOADS = REGISTRY.counter(
+    "chatbot_tenant_knowledge_total", "Tenant knowledge bases loaded, evicted or failed to load."
+)
+TENANT_LOAD_SECONDS = REGISTRY.histogram(
+    "chatbot_tenant_knowledge_load_seconds", "Time to open a tenant's knowledge base on first use."
+)
+
+
+def instrument_node(name: str, fn: Callable[[Any], Awaitable[T]]) -> Callable[[Any], Awaitable[T]]:
+    """Wrap an async graph node or router to record its latency and errors."""
+
+    @functools.wraps(fn)
+    async def wrapper(state: Any) -> T:
+        start = time.perf_counter()
+        try:
+            return await fn(state)
+        except Exception:
+            NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            NODE_LATENCY.observe(time.perf_counter() - start, node=name)
+
+    return wrapper
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from typing import Any
+
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable
+
+from app.admission import Overloaded
+from app.config import settings
+from app.llm import ainvoke_llm, build_chat_model
+from app.memory import recent_history, summary_messages
+from app.metrics import FALLBACKS
+from app.nodes.lead_capture import LEAD_FLOW_TOOL, lead_capture_node, lead_context, parse_lead_flow
+from app.nodes.off_topic import off_topic_node
+from app.nodes.qa import knowledge_message, qa_node
+from app.nodes.router import ROUTER_TOOL, decide_locally, record_route
+from app.state import ChatState
+from app.tenants import current_knowledge, tenant_instructions, tenant_model
+
+_ROUTE_ARGS = ROUTER_TOOL[0]["function"]["parameters"]["properties"]
+_LEAD_ARGS = LEAD_FLOW_TOOL[0]["function"]["parameters"]["properties"]
+
+# The router's intent enum, a QA answer and the lead_flow reply and fields
+# in one schema, so a single call both routes and replies.
+FUSED_TOOL = [
+    {
+        "type": "function",
+        "function": {
+            "name": "respond",
+            "description": "Choose the intent and write the reply for it.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "intent": _ROUTE_ARGS["intent"],
+                    "reason": _ROUTE_ARGS["reason"],
+                    "answer": {
+                        "type": "string",
+                        "description": "For qa: the answer, using only the company information provided.",
+                    },
+                    "reply": {
+                        **_LEAD_ARGS["reply"],
+                        "description": "For lead_capture: the assistant's natural, human reply to send.",
+                    },
+                    "lead_intent": _LEAD_ARGS["intent"],
+                    "fields": _LEAD_ARGS["fields"],
+                    "advance_to_review": _LEAD_ARGS["advance_to_review"],
+                    "advance_to_send": _LEAD_ARGS["advance_to_send"],
+                },
+                "required": ["intent", "reason"],
+            },
+        },
+    }
+]
+
+# Built on first use (see get_fused_llm); benches assign a fake here.
+fused_llm: Runnable[Any, BaseMessage] | None = None
+
+
+def get_fused_llm() -> Runnable[Any, BaseMessage]:
+    global fused_llm
+    if fused_llm is None:
+        fused_llm = build_chat_model("fused", temperature=0.2).bind_tools(FUSED_TOOL, tool_choice="respond")
+    return fused_llm
+
+
+# Static, so it forms a cacheable prompt prefix together with the tool schema.
+FUSED_INSTRUCTIONS = SystemMessage(
+    content=(
+        "You are the assistant of a company's support chatbot. For every user message, call the respond tool "
+        "with exactly one intent and the reply for that intent:\n"
+        "- qa: product/company/support questions. Put the answer in 'answer', using ONLY the company and "
+        "product information in the next message; if it is not there, say you are not sure.\n"
+        "- lead_capture: the user wants sales, a demo, pricing, a quote, or shares contact details. Put a warm, "
+        "brief (1-2 sentences, no bullets) reply in 'reply' that acknowledges them and gently asks for contact "
+        "details; name and email matter most. Put any details they give in 'fields'. Set lead_intent to gather, "
+        "or review once you have name and email, and advance_to_review when ready to confirm.\n"
+        "- off_topic: unrelated, chit-chat, or outside company/product scope. No reply text is needed.\n"
+        "When unsure, choose qa. The current lead status follows the conversation."
+    )
+)
+
+
+async def _respond(state: ChatState) -> dict[str, Any]:
+    """Make the single routing-and-reply call; returns the tool arguments."""
+    user_profile = dict(state.get("user_profile") or {})
+    lead_step = state.get("lead_step") or "intro"
+    stage = lead_step if lead_step in ("review", "send", "done") else "gather"
+    # Volatile values go last so the cacheable prefix stays stable.
+    status = SystemMessage(
+        content=(
+            f"Current lead_status: {state.get('lead_status')}. Lead stage: {stage}. "
+            f"{lead_context(user_profile, state.get('lead_message', ''))}"
+        )
+    )
+    history = recent_history(state, settings.history_budget_qa)
+    prompt = [
+        FUSED_INSTRUCTIONS,
+        *tenant_instructions(),
+        # One knowledge version for the whole turn, even if a reload lands mid-way.
+        knowledge_message(state, current_knowledge().index),
+        *summary_messages(state),
+        *history,
+        status,
+    ]
+    result = await ainvoke_llm(tenant_model(get_fused_llm(), "fused"), prompt, name="fused")
+    for call in getattr(result, "tool_calls", None) or []:
+        if call.get("name") == "respond":
+            return call.get("args", {}) or {}
+    return {}
+
+
+async def fused_node(state: ChatState) -> ChatState:
+    """Route and reply with one LLM call instead of router plus answer node.
+
+    Guardrails and the pre-router run first, exactly as in the routed
+    graph, and their turns go to the usual nodes. Otherwise one call picks
+    the intent and writes the reply: a QA answer is returned as is, and a
+    lead capture proposal goes through ``lead_capture_node`` so its local
+    extraction and state transitions still apply. An empty QA answer falls
+    back to ``qa_node``.
+    """
+    local = decide_locally(state)
+    if local is not None:
+        intent, source = local
+        record_route(intent, source)
+        if intent == "lead_capture":
+            return await lead_capture_node(state)
+        return await (qa_node if intent == "qa" else off_topic_node)(state)
+
+    try:
+        args = await _respond(state)
+    except Overloaded:
+        # QA can still answer from its cache; otherwise the turn degrades.
+        FALLBACKS.inc(node="fused", reason="overloaded")
+        record_route("qa", "overload")
+        return await qa_node(state)
+    except Exception:
+        FALLBACKS.inc(node="fused", reason="llm_error")
+        record_route("qa", "fallback")
+        return await qa_node(state)
+
+    intent = args.get("intent")
+    if intent not in ("qa", "lead_capture", "off_topic"):
+        intent = "qa"
+    record_route(intent, "fused")
+
+    if intent == "off_topic":
+        return await off_topic_node(state)
+    if intent == "lead_capture":
+        proposal = parse_lead_flow({**args, "intent": args.get("lead_intent")})
+        return await lead_capture_node(state, proposal=proposal)
+
+    answer = args.get("answer")
+    if not isinstance(answer, str) or not answer.strip():
+        FALLBACKS.inc(node="fused", reason="empty_answer")
+        return await qa_node(state)
+    return {"messages": [AIMessage(content=answer)]}
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
-from typing import cast
+from typing import Any, cast
 
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable
 
+from app.admission import Overloaded
 from app.config import settings
-from app.integrations.discord import send_lead_to_discord
+from app.extraction import extract_contact, is_valid_email, normalize_phone
+from app.history import last_message
+from app.integrations.outbox import get_outbox
+from app.llm import ainvoke_llm, build_chat_model
+from app.memory import recent_history, summary_messages
+from app.metrics import FALLBACKS, LEAD_DELIVERIES, LEAD_TURNS
 from app.state import ChatState, LeadStatus, new_lead
+from app.tenants import current_tenant, tenant_instructions, tenant_model
 
 
 LEAD_FLOW_TOOL = [
@@ -53,43 +60,43 @@ LEAD_FLOW_TOOL = [
     }
 ]
 
-reply_llm = ChatOpenAI(model=settings.model_name, temperature=0.6).bind_tools(
-    LEAD_FLOW_TOOL, tool_choice="lead_flow"
-    )
-
-
-def _get_last_human_message(state: ChatState) -> HumanMessage | None:
-    messages = state.get("messages") or []
-    for msg in reversed(messages):
-        if isinstance(msg, HumanMessage):
-            return msg
-    return None
+# Built on first use (see get_reply_llm); benches assign a fake here.
+reply_llm: Runnable[Any, BaseMessage] | None = None
 
 
-def _looks_like_email(value: str) -> bool:
-    return "@" in value and "." in value and " " not in value
-
+def get_reply_llm() -> Runnable[Any, BaseMessage]:
+    global reply_llm
+    if reply_llm is None:
+        reply_llm = build_chat_model("lead", temperature=0.6).bind_tools(
+            LEAD_FLOW_TOOL, tool_choice="lead_flow"
+        )
+    return reply_llm
 
-def _looks_like_phone(value: str) -> bool:
-    digits = [c for c in value if c.isdigit()]
-    return len(digits) >= 7
 
+# Static, so it forms a cacheable prompt prefix together with the tool schema.
+LEAD_INSTRUCTIONS = SystemMessage(
+    content=(
+        "You are a warm, concise teammate in a webchat. Tone: brief (1-2 sentences), human, no bullets. "
+        "Goals: (1) acknowledge/answer the user, (2) gently gather helpful contact details without sounding like a form. "
+        "Soft priorities: name and email; phone/company/message are nice-to-have. "
+        "If enough info is present, offer to share with the team and ask if they want tweaks; if they confirm, advance to send. "
+        "If they hesitate, allow partial info. Return a tool call with your reply and state updates.\n"
+        "Respond naturally in 'reply'. "
+        "If the user provides or corrects details, place them in fields. "
+        "If you have name+email or the user asks to send, set advance_to_review=true. "
+        "If they clearly approve sending, set advance_to_send=true. "
+        "Intent: choose gather while collecting, review to summarize/confirm, send when ready to dispatch."
+        " If the user already said they only want to share some details, respect that and avoid re-asking unless they invite it."
+    )
+)
 
-async def lead_capture_node(state: ChatState) -> ChatState:
-    """Guide the user through sharing contact details with a natural, LLM-led flow."""
-    last_human = _get_last_human_message(state)
-    text = last_human.content.strip() if last_human else ""
 
-    user_profile = dict(state.get("user_profile") or {})
-    lead_status = cast(LeadStatus, state.get("lead_status", "none"))
-    lead_step = state.get("lead_step") or "intro"
-    lead_message = state.get("lead_message", "")
-    messages = state.get("messages") or []
+# (reply, intent, fields, advance_to_review, advance_to_send) proposed by a model.
+LeadProposal = tuple[str | None, str, dict[str, str], bool, bool]
 
-    if lead_status != "collecting":
-        lead_status = cast(LeadStatus, "collecting")
 
-    # Build context summary.
+def lead_context(user_profile: dict[str, str], lead_message: str) -> str:
+    """What the flow already knows and still misses, for the model prompt."""
     known = {k: v for k, v in user_profile.items() if v}
     missing_fields: list[str] = []
     if not user_profile.get("email"):
@@ -103,66 +110,145 @@ async def lead_capture_node(state: ChatState) -> ChatState:
     if not lead_message:
         missing_fields.append("message")
 
-    stage = lead_step if lead_step in ("review", "send", "done") else "gather"
+    known_str = "; ".join(f"{k}: {v}" for k, v in known.items()) if known else "none yet"
+    missing_str = ", ".join(missing_fields) if missing_fields else "none"
+    return f"Known: {known_str}. Missing: {missing_str}."
+
+
+def parse_lead_flow(args: dict[str, Any]) -> LeadProposal:
+    """Read ``lead_flow`` tool arguments, defaulting what the model left out."""
+    return (
+        args.get("reply") or None,
+        args.get("intent") or "gather",
+        args.get("fields") or {},
+        bool(args.get("advance_to_review", False)),
+        bool(args.get("advance_to_send", False)),
+    )
+
 
+async def _llm_turn(
+    state: ChatState,
+    text: str,
+    user_profile: dict[str, str],
+    lead_message: str,
+    stage: str,
+) -> LeadProposal:
+    """Ask the lead flow model for a reply and proposed state updates."""
     # Recent conversation for continuity.
     recent_lines: list[str] = []
-    for msg in (messages or [])[-8:]:
+    for msg in recent_history(state, settings.history_budget_lead):
         role = "User" if msg.type == "human" else "Assistant"
         recent_lines.append(f"{role}: {msg.content}")
     recent_context = "\n".join(recent_lines) if recent_lines else "None"
 
-    known_str = "; ".join(f"{k}: {v}" for k, v in known.items()) if known else "none yet"
-    missing_str = ", ".join(missing_fields) if missing_fields else "none"
-
-    system = SystemMessage(
-        content=(
-            "You are a warm, concise teammate in a webchat. Tone: brief (1-2 sentences), human, no bullets. "
-            "Goals: (1) acknowledge/answer the user, (2) gently gather helpful contact details without sounding like a form. "
-            "Soft priorities: name and email; phone/company/message are nice-to-have. "
-            "If enough info is present, offer to share with the team and ask if they want tweaks; if they confirm, advance to send. "
-            "If they hesitate, allow partial info. Return a tool call with your reply and state updates."
-        )
+    # Everything specific to this turn comes after the static instructions.
+    prompt = (
+        f"{lead_context(user_profile, lead_message)} Stage: {stage}. "
+        f"Recent conversation:\n{recent_context}\nUser said: {text!r}."
     )
 
-    prompt = (
-        f"Known: {known_str}. Missing: {missing_str}. Stage: {stage}. "
-        f"Recent conversation:\n{recent_context}\nUser said: {text!r}. Respond naturally in 'reply'. "
-        "If the user provides or corrects details, place them in fields. "
-        "If you have name+email or the user asks to send, set advance_to_review=true. "
-        "If they clearly approve sending, set advance_to_send=true. "
-        "Intent: choose gather while collecting, review to summarize/confirm, send when ready to dispatch."
-        " If the user already said they only want to share some details, respect that and avoid re-asking unless they invite it."
+    result = await ainvoke_llm(
+        tenant_model(get_reply_llm(), "lead"),
+        [LEAD_INSTRUCTIONS, *tenant_instructions(), *summary_messages(state), HumanMessage(content=prompt)],
+        name="lead_capture",
     )
 
-    try:
-        result = reply_llm.invoke([system, HumanMessage(content=prompt)])
-    except Exception:
-        return {
-            "messages": [
-                AIMessage(content="Sorry, I hit a snag. Could you share the best email to reach you?")
-            ],
-            "user_profile": user_profile,
-            "lead_status": lead_status,
-            "lead_step": "gather",
-            "lead_message": lead_message,
-        }
-
-    tool_calls = getattr(result, "tool_calls", None) or []
-    reply_text = None
-    intent = "gather"
-    advance_to_review = False
-    advance_to_send = False
-    fields: dict[str, str] = {}
-    for call in tool_calls:
+    for call in getattr(result, "tool_calls", None) or []:
         if call.get("name") == "lead_flow":
-            args = call.get("args", {}) or {}
-            reply_text = args.get("reply") or reply_text
-            intent = args.get("intent", intent) or intent
-            fields = args.get("fields") or {}
-            advance_to_review = bool(args.get("advance_to_review", advance_to_review))
-            advance_to_send = bool(args.get("advance_to_send", advance_to_send))
-            break
+            return parse_lead_flow(call.get("args", {}) or {})
+    return None, "gather", {}, False, False
+
+
+def _looks_like_email(value: str) -> bool:
+    return is_valid_email(value)
+
+
+def _looks_like_phone(value: str) -> bool:
+    return normalize_phone(value) is not None
+
+
+def _summarize_profile(user_profile: dict[str, str]) -> str:
+    parts = [user_profile[k] for k in ("name", "email", "phone", "company") if user_profile.get(k)]
+    return ", ".join(parts)
+
+
+def _local_turn(text: str, user_profile: dict[str, str], stage: str) -> tuple[str, str, dict[str, str], bool] | None:
+    """Handle turns the extraction patterns fully explain, without the LLM.
+
+    Returns ``(reply, intent, fields, advance_to_send)`` or None when the
+    turn is ambiguous and needs the model.
+    """
+    extraction = extract_contact(text)
+    if not extraction.confident:
+        return None
+
+    if not extraction.fields:
+        # A bare "yes" only means something once we've asked to send.
+        if stage != "review":
+            return None
+        return "", "send", {}, True
+
+    profile = {**user_profile, **extraction.fields}
+    name = profile.get("name")
+    if name and profile.get("email"):
+        reply = f"Thanks, {name}! I have {_summarize_profile(profile)}. Shall I pass this along to the team?"
+        return reply, "review", extraction.fields, False
+    if name:
+        reply = f"Nice to meet you, {name}! What's the best email to reach you?"
+    elif profile.get("email"):
+        reply = "Thanks! And what name should I pass along to the team?"
+    else:
+        reply = "Got it, thanks. What's the best email to reach you as well?"
+    return reply, "gather", extraction.fields, False
+
+
+async def lead_capture_node(state: ChatState, *, proposal: LeadProposal | None = None) -> ChatState:
+    """Guide the user through sharing contact details with a natural, LLM-led flow.
+
+    Turns that only carry contact details or a confirmation are handled by
+    the local extraction patterns; the LLM is called for everything else,
+    unless the caller already has the model's ``proposal`` for this turn.
+    """
+    last_human = last_message(state.get("messages") or [], "human")
+    text = last_human.content.strip() if last_human else ""
+
+    user_profile = dict(state.get("user_profile") or {})
+    lead_status = cast(LeadStatus, state.get("lead_status", "none"))
+    lead_step = state.get("lead_step") or "intro"
+    lead_message = state.get("lead_message", "")
+
+    if lead_status != "collecting":
+        lead_status = cast(LeadStatus, "collecting")
+
+    stage = lead_step if lead_step in ("review", "send", "done") else "gather"
+
+    advance_to_review = False
+    local = _local_turn(text, user_profile, stage)
+    if local is not None:
+        LEAD_TURNS.inc(path="local")
+        reply_text, intent, fields, advance_to_send = local
+    elif proposal is not None:
+        LEAD_TURNS.inc(path="proposed")
+        reply_text, intent, fields, advance_to_review, advance_to_send = proposal
+    else:
+        LEAD_TURNS.inc(path="llm")
+        try:
+            result = await _llm_turn(state, text, user_profile, lead_message, stage)
+        except Overloaded:
+            # Shed the whole turn so the caller can degrade it.
+            raise
+        except Exception:
+            FALLBACKS.inc(node="lead_capture", reason="llm_error")
+            return {
+                "messages": [
+                    AIMessage(content="Sorry, I hit a snag. Could you share the best email to reach you?")
+                ],
+                "user_profile": user_profile,
+                "lead_status": lead_status,
+                "lead_step": "gather",
+                "lead_message": lead_message,
+            }
+        reply_text, intent, fields, advance_to_review, advance_to_send = result
 
     if fields:
         for key in ("name", "email", "phone", "company"):
@@ -181,7 +267,9 @@ async def lead_capture_node(state: ChatState) -> ChatState:
         intent = "review"
 
     if intent == "send":
-        lead = new_lead(user_profile, message=lead_message or "", source="webchat")
+        tenant = current_tenant()
+        source = "webchat" if tenant.is_default else f"webchat:{tenant.id}"
+        lead = new_lead(user_profile, message=lead_message or "", source=source)
         # Minimal sanity check on email/phone; if clearly bad, fall back to review.
         email_ok = bool(user_profile.get("email") and _looks_like_email(user_profile["email"]))
         phone_ok = True
@@ -192,11 +280,15 @@ async def lead_capture_node(state: ChatState) -> ChatState:
         elif not phone_ok:
             intent = "review"
         else:
-            success = await send_lead_to_discord(lead)
-            if success:
+            # Delivery happens in the background; the lead is safe once queued.
+            try:
+                await get_outbox().enqueue(lead, webhook_url=tenant.lead_webhook_url)
+                LEAD_DELIVERIES.inc(outcome="queued")
                 reply_text = "Thanks—I've shared your details with the team. They'll be in touch soon."
                 new_status: LeadStatus = "sent"
-            else:
+            except Exception as e:
+                print(e)
+                FALLBACKS.inc(node="lead_capture", reason="enqueue_error")
                 reply_text = "Thanks for the details. I couldn't auto-share them, but I've noted everything for the team."
                 new_status = "failed"
             return {
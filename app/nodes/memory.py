@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from typing import Any, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import Runnable
+
+from app.admission import Overloaded
+from app.config import settings
+from app.history import Message
+from app.llm import ainvoke_llm, build_chat_model
+from app.memory import split_for_summary
+from app.metrics import FALLBACKS
+from app.state import ChatState
+from app.tenants import Tenant, tenant_model
+
+
+# Built on first use (see get_summary_llm); benches assign a fake here.
+summary_llm: Runnable[Any, BaseMessage] | None = None
+
+
+def get_summary_llm() -> Runnable[Any, BaseMessage]:
+    global summary_llm
+    if summary_llm is None:
+        summary_llm = build_chat_model("summary", temperature=0)
+    return summary_llm
+
+
+def fold_due(state: ChatState) -> tuple[list[Message], int]:
+    """Messages to fold into the summary after this turn, and the new ``summarized_upto``."""
+    return split_for_summary(
+        state,
+        trigger=settings.history_summary_trigger_tokens,
+        keep=settings.history_keep_tokens,
+    )
+
+
+async def compact_memory(
+    state: ChatState, folded: Sequence[Message], upto: int, tenant: Tenant | None = None
+) -> ChatState:
+    """Fold turns that fell out of the prompt window into the rolling summary.
+
+    Runs in the background after the turn is saved (see
+    ``app.main.schedule_fold``), so no reply waits for it. The previous
+    summary is extended with only the newly folded turns, so the cost per
+    fold stays constant. Returns the state update, empty if the call failed.
+    """
+    transcript = "\n".join(
+        f"{'User' if m.type == 'human' else 'Assistant'}: {m.content}" for m in folded
+    )
+    system = SystemMessage(
+        content=(
+            "You maintain a running summary of a support chat. Merge the new turns into the "
+            "existing summary. Keep facts the assistant may need later: the user's goals, "
+            "questions already answered, contact details and commitments. "
+            "At most 120 words, plain prose."
+        )
+    )
+    prompt = (
+        f"Existing summary:\n{state.get('summary') or 'None'}\n\n"
+        f"New turns:\n{transcript}\n\nUpdated summary:"
+    )
+
+    try:
+        result = await ainvoke_llm(
+            tenant_model(get_summary_llm(), "summary", tenant),
+            [system, HumanMessage(content=prompt)],
+            name="compact_memory",
+        )
+    except Overloaded:
+        FALLBACKS.inc(node="compact_memory", reason="overloaded")
+        return {}
+    except Exception:
+        FALLBACKS.inc(node="compact_memory", reason="llm_error")
+        # Prompts stay bounded by windowing; try folding again next turn.
+        return {}
+
+    return {"summary": str(result.content).strip(), "summarized_upto": upto}
@@ -5,7 +5,7 @@ from langchain_core.messages import AIMessage
 from app.state import ChatState
 
 
-def off_topic_node(state: ChatState) -> ChatState:
+async def off_topic_node(state: ChatState) -> ChatState:
     """Handle messages that are outside supported topics."""
     reply = AIMessage(
         content=(
@@ -1,32 +1,103 @@
 from __future__ import annotations
 
-from langchain_core.messages import AIMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from itertools import islice
+from typing import Any
 
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable
+
+from app.cache import cache_namespace, context_key, get_qa_cache
 from app.config import settings
-from app.knowledge import COMPANY_KNOWLEDGE
+from app.history import last_message
+from app.knowledge import retrieve_knowledge
+from app.llm import ainvoke_llm, build_chat_model, model_name_of
+from app.memory import recent_history, summary_messages
+from app.retrieval import KnowledgeIndex
 from app.state import ChatState
+from app.tenants import Tenant, current_knowledge, current_tenant, tenant_instructions, tenant_model
 
 
-llm = ChatOpenAI(model=settings.model_name, temperature=0.2)
+# Built on first use (see get_llm); benches assign a fake here.
+llm: Runnable[Any, BaseMessage] | None = None
 
 
-def qa_node(state: ChatState) -> ChatState:
-    """Answer product/company questions using the static company knowledge."""
-    messages = state.get("messages") or []
+def get_llm() -> Runnable[Any, BaseMessage]:
+    global llm
+    if llm is None:
+        llm = build_chat_model("qa", temperature=0.2)
+    return llm
 
-    system_content = (
+
+# Static, so every QA prompt starts with the same cacheable prefix.
+QA_INSTRUCTIONS = SystemMessage(
+    content=(
         "You are a helpful AI assistant for a company. "
-        "Use ONLY the following company and product information as the source of truth. "
-        "If the answer is not in this information, say you are not sure.\n\n"
-        f"{COMPANY_KNOWLEDGE}"
+        "Use ONLY the company and product information in the next message as the source of truth. "
+        "If the answer is not in this information, say you are not sure."
     )
+)
+
+
+def _retrieval_query(state: ChatState) -> str:
+    # The previous question helps with follow-ups like "and how much is it?".
+    human = islice((m for m in reversed(state.get("messages") or []) if m.type == "human"), 2)
+    return " ".join(reversed([m.content for m in human]))
+
+
+def knowledge_message(state: ChatState, index: KnowledgeIndex) -> SystemMessage:
+    """The company information retrieved for this turn's question."""
+    chunks = retrieve_knowledge(_retrieval_query(state), index=index)
+    knowledge = "\n\n---\n\n".join(f"[{c.source}]\n{c.text}" for c in chunks)
+    return SystemMessage(content=knowledge or "No matching company information was found.")
+
+
+def _cache_key(state: ChatState, tenant: Tenant, index: KnowledgeIndex) -> tuple[str, str, str] | None:
+    """(namespace, context, question) for this turn, or None if not cacheable."""
+    messages = state.get("messages") or []
+    if not messages or messages[-1].type != "human":
+        return None
+    previous = last_message(messages, "ai")
+    previous_reply = previous.content if previous is not None else ""
+    model_name = model_name_of(tenant_model(get_llm(), "qa", tenant))
+    namespace = cache_namespace(index.content_hash, model_name, tenant.instructions)
+    return namespace, context_key(previous_reply), str(messages[-1].content)
+
+
+async def cached_answer(state: ChatState, tenant: Tenant, index: KnowledgeIndex) -> str | None:
+    """The cached answer to this turn's question for ``tenant``, if there is one."""
+    cache_key = _cache_key(state, tenant, index) if settings.qa_cache_enabled else None
+    if cache_key is None:
+        return None
+    return await get_qa_cache().get(*cache_key)
 
-    full_messages = [SystemMessage(content=system_content)] + messages
-    response = llm.invoke(full_messages)
+
+async def qa_node(state: ChatState) -> ChatState:
+    """Answer product/company questions using retrieved company knowledge."""
+    # One knowledge version for the whole turn, even if a reload lands mid-way.
+    tenant = current_tenant()
+    index = current_knowledge().index
+    cache_key = _cache_key(state, tenant, index) if settings.qa_cache_enabled else None
+    if cache_key is not None:
+        cached = await get_qa_cache().get(*cache_key)
+        if cached is not None:
+            return {"messages": [AIMessage(content=cached)]}
+
+    history = recent_history(state, settings.history_budget_qa)
+
+    full_messages = [
+        QA_INSTRUCTIONS,
+        *tenant_instructions(),
+        knowledge_message(state, index),
+        *summary_messages(state),
+        *history,
+    ]
+    response = await ainvoke_llm(tenant_model(get_llm(), "qa", tenant), full_messages, name="qa")
 
     if not isinstance(response, AIMessage):
         response = AIMessage(content=str(response.content))
 
+    if cache_key is not None:
+        await get_qa_cache().put(*cache_key, str(response.content))
+
     # LangGraph will append this to the existing message list.
     return {"messages": [response]}
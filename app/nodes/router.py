@@ -1,13 +1,23 @@
 from __future__ import annotations
 
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from contextvars import ContextVar
+from typing import Any
 
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable
+
+from app.admission import Overloaded
 from app.config import settings
+from app.history import last_message
+from app.intent import classify_intent
+from app.llm import ainvoke_llm, build_chat_model
+from app.memory import recent_history, summary_messages
+from app.metrics import FALLBACKS, ROUTING_DECISIONS
 from app.state import ChatState
+from app.tenants import tenant_model
 
-# Tool-constrained classifier to stabilize routing decisions.
-router_llm = ChatOpenAI(model=settings.model_name, temperature=0)
+# Set by callers that want each turn's (intent, source) decisions, e.g. batch replay.
+ROUTE_TRACE: ContextVar[list[tuple[str, str]] | None] = ContextVar("route_trace", default=None)
 
 ROUTER_TOOL = [
     {
@@ -38,45 +48,90 @@ ROUTER_TOOL = [
     }
 ]
 
-router_llm = router_llm.bind_tools(ROUTER_TOOL, tool_choice="route_intent")
+# Built on first use (see get_router_llm); benches assign a fake here.
+router_llm: Runnable[Any, BaseMessage] | None = None
 
 
-def _get_last_human_message(state: ChatState) -> HumanMessage | None:
-    messages = state.get("messages") or []
-    for msg in reversed(messages):
-        if isinstance(msg, HumanMessage):
-            return msg
-    return None
+def get_router_llm() -> Runnable[Any, BaseMessage]:
+    global router_llm
+    if router_llm is None:
+        # Tool-constrained classifier to stabilize routing decisions.
+        router_llm = build_chat_model("router", temperature=0).bind_tools(
+            ROUTER_TOOL, tool_choice="route_intent"
+        )
+    return router_llm
+
+
+# Static, so it forms a cacheable prompt prefix together with the tool schema.
+ROUTER_INSTRUCTIONS = SystemMessage(
+    content=(
+        "You are an intent classifier for a support chatbot. "
+        "Select exactly one intent via the route_intent tool:\n"
+        "- qa: answer product/company/support questions.\n"
+        "- lead_capture: user wants to speak with sales, book a demo, pricing, quote, or share contact details.\n"
+        "- off_topic: unrelated, chit-chat, or requests outside company/product scope.\n"
+        "When unsure, choose qa. If lead_status is 'collecting', do not switch away from lead_capture. "
+        "The current lead status follows the conversation."
+    )
+)
 
 
 async def route(state: ChatState) -> str:
     """LLM-based intent router with guardrails and off-topic handling."""
+    intent, source = decide_locally(state) or await decide_with_llm(state)
+    record_route(intent, source)
+    return intent
+
+
+def record_route(intent: str, source: str) -> None:
+    ROUTING_DECISIONS.inc(intent=intent, source=source)
+    trace = ROUTE_TRACE.get()
+    if trace is not None:
+        trace.append((intent, source))
+
+
+def decide_locally(state: ChatState) -> tuple[str, str] | None:
+    """Guardrails and the pre-router; ``None`` means the LLM must decide.
+
+    Returns the intent and which stage decided it.
+    """
     lead_status = state.get("lead_status")
 
     # Hard guardrail: stay in lead capture while collecting details.
     if lead_status == "collecting":
-        return "lead_capture"
+        return "lead_capture", "guardrail"
 
-    last_human = _get_last_human_message(state)
+    last_human = last_message(state.get("messages") or [], "human")
     if last_human is None:
-        return "qa"
-
-    system = SystemMessage(
-        content=(
-            "You are an intent classifier for a support chatbot. "
-            "Select exactly one intent via the route_intent tool:\n"
-            "- qa: answer product/company/support questions.\n"
-            "- lead_capture: user wants to speak with sales, book a demo, pricing, quote, or share contact details.\n"
-            "- off_topic: unrelated, chit-chat, or requests outside company/product scope.\n"
-            "When unsure, choose qa. If lead_status is 'collecting', do not switch away from lead_capture. "
-            f"Current lead_status: {lead_status}. Prior lead_step: {state.get('lead_step')}."
-        )
+        return "qa", "default"
+
+    # Obvious intents are settled locally without an LLM round trip.
+    guess = classify_intent(str(last_human.content))
+    if guess.confidence >= settings.prerouter_threshold:
+        return guess.intent, "prerouter"
+    return None
+
+
+async def decide_with_llm(state: ChatState) -> tuple[str, str]:
+    """Ask the router LLM; falls back to qa if the call fails."""
+    lead_status = state.get("lead_status")
+
+    # Volatile values go last so the cacheable prefix stays stable.
+    status = SystemMessage(
+        content=f"Current lead_status: {lead_status}. Prior lead_step: {state.get('lead_step')}."
     )
 
     try:
-        result = router_llm.invoke([system] + (state.get("messages") or []))
+        history = recent_history(state, settings.history_budget_router)
+        prompt = [ROUTER_INSTRUCTIONS, *summary_messages(state), *history, status]
+        result = await ainvoke_llm(tenant_model(get_router_llm(), "router"), prompt, name="router")
+    except Overloaded:
+        # QA can still answer from its cache; otherwise the turn degrades.
+        FALLBACKS.inc(node="router", reason="overloaded")
+        return "qa", "overload"
     except Exception:
-        return "qa"
+        FALLBACKS.inc(node="router", reason="llm_error")
+        return "qa", "fallback"
 
     intent = "qa"
     tool_calls = getattr(result, "tool_calls", None) or []
@@ -90,6 +145,6 @@ async def route(state: ChatState) -> str:
 
     # Final guardrail in case the model ignored constraints.
     if lead_status == "collecting":
-        return "lead_capture"
+        return "lead_capture", "guardrail"
 
-    return intent
+    return intent, "llm"
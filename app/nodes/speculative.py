@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable
+
+from app.config import settings
+from app.metrics import SPECULATION, SPECULATION_SAVED
+from app.nodes.lead_capture import lead_capture_node
+from app.nodes.off_topic import off_topic_node
+from app.nodes.qa import qa_node
+from app.nodes.router import decide_locally, decide_with_llm, record_route
+from app.state import ChatState
+
+ANSWER_NODES: dict[str, Callable[[ChatState], Awaitable[ChatState]]] = {
+    "qa": qa_node,
+    "lead_capture": lead_capture_node,
+    "off_topic": off_topic_node,
+}
+
+# Only nodes without side effects may run before the router has agreed;
+# lead capture can queue a lead, so it is never speculated.
+SPECULATABLE = frozenset({"qa", "off_topic"})
+
+
+class SpeculationPolicy:
+    """Decides whether, and on which node, to speculate.
+
+    Keeps a rolling window of router LLM decisions. The most frequent
+    intent is the prediction, and speculation only happens while its share
+    keeps the expected waste under ``max_waste_ratio``, which caps the
+    extra LLM spend on discarded answers.
+    """
+
+    def __init__(self, window: int, max_waste_ratio: float) -> None:
+        self.max_waste_ratio = max_waste_ratio
+        self._recent: deque[str] = deque(maxlen=window)
+
+    def record(self, intent: str) -> None:
+        self._recent.append(intent)
+
+    def prediction(self) -> str | None:
+        if not self._recent:
+            return "qa"
+        intent, count = Counter(self._recent).most_common(1)[0]
+        if intent not in SPECULATABLE:
+            return None
+        if 1 - count / len(self._recent) > self.max_waste_ratio:
+            return None
+        return intent
+
+
+POLICY = SpeculationPolicy(
+    window=settings.speculation_window,
+    max_waste_ratio=settings.speculation_max_waste_ratio,
+)
+
+
+async def speculative_node(state: ChatState) -> ChatState:
+    """Route and answer, overlapping the router call with the likely node.
+
+    A speculative answer is computed from the same input state and only
+    returned if the router picks that node, so a miss never reaches the
+    session. On a miss the speculative call is cancelled and the chosen
+    node runs as usual.
+    """
+    local = decide_locally(state)
+    if local is not None:
+        intent, source = local
+        record_route(intent, source)
+        return await ANSWER_NODES[intent](state)
+
+    predicted = POLICY.prediction()
+    if predicted is None:
+        SPECULATION.inc(outcome="skipped")
+        intent, source = await decide_with_llm(state)
+        POLICY.record(intent)
+        record_route(intent, source)
+        return await ANSWER_NODES[intent](state)
+
+    start = time.perf_counter()
+    answered_after = 0.0
+
+    async def speculate() -> ChatState:
+        nonlocal answered_after
+        result = await ANSWER_NODES[predicted](state)
+        answered_after = time.perf_counter() - start
+        return result
+
+    speculation = asyncio.create_task(speculate())
+    try:
+        intent, source = await decide_with_llm(state)
+    except BaseException:
+        speculation.cancel()
+        raise
+    routed_after = time.perf_counter() - start
+    POLICY.record(intent)
+    record_route(intent, source)
+
+    if intent == predicted:
+        result = await speculation
+        SPECULATION.inc(outcome="hit")
+        # Both calls started at ``start``, so they overlapped for
+        # min(router, node): what running them one after another would
+        # have added.
+        SPECULATION_SAVED.observe(min(routed_after, answered_after))
+        return result
+
+    speculation.cancel()
+    try:
+        await speculation
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        # The discarded answer's failure is irrelevant to this turn.
+        pass
+    SPECULATION.inc(outcome="miss")
+    return await ANSWER_NODES[intent](state)
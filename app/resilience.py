@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterator
+
+from app.admission import Overloaded
+from app.config import settings
+from app.metrics import BREAKER_TRANSITIONS
+
+# Absolute time.monotonic() by which the current turn must be answered.
+_deadline: ContextVar[float | None] = ContextVar("turn_deadline", default=None)
+# Cleared while a turn streams tokens; hedged duplicates would interleave them.
+_hedging_allowed: ContextVar[bool] = ContextVar("hedging_allowed", default=True)
+
+
+@contextmanager
+def turn_deadline(seconds: float) -> Iterator[None]:
+    """Give every LLM call made in this context a shared end-to-end deadline.
+
+    The deadline travels with the context into the graph's node tasks.
+    A non-positive ``seconds`` leaves calls bounded only by their timeout.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget(node: str) -> float | None:
+    """Seconds a call from ``node`` may still take, or None without a deadline.
+
+    The router gets only ``ROUTER_DEADLINE_SHARE`` of what is left, so the
+    answer node that follows it keeps most of the turn's time.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    remaining = max(deadline - time.monotonic(), 0.0)
+    if node == "router":
+        remaining *= settings.router_deadline_share
+    return remaining
+
+
+@contextmanager
+def hedging_disabled() -> Iterator[None]:
+    token = _hedging_allowed.set(False)
+    try:
+        yield
+    finally:
+        _hedging_allowed.reset(token)
+
+
+class CircuitOpen(Overloaded):
+    """Every model in the fallback chain has its circuit breaker open."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("circuit_open", retry_after)
+
+
+class CircuitBreaker:
+    """Stops calling a model after repeated failures.
+
+    ``failure_threshold`` consecutive failures open the breaker; after
+    ``reset_seconds`` one probe call is let through (half-open) and its
+    outcome closes or re-opens it.
+    """
+
+    def __init__(self, model: str, *, failure_threshold: int, reset_seconds: float) -> None:
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _move(self, state: str) -> None:
+        if state != self.state:
+            BREAKER_TRANSITIONS.inc(model=self.model, state=state)
+            self.state = state
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._move("half_open")
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == "closed"
+
+    def retry_after(self) -> float:
+        if self.state != "open":
+            return 1.0
+        return max(self.reset_seconds - (time.monotonic() - self._opened_at), 1.0)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._move("closed")
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._move("open")
+
+    def abandon(self) -> None:
+        """Forget a probe whose call was cancelled before it finished."""
+        self._probing = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = _breakers[model] = CircuitBreaker(
+            model,
+            failure_threshold=settings.breaker_failure_threshold,
+            reset_seconds=settings.breaker_reset_seconds,
+        )
+    return breaker
+
+
+def breaker_states() -> dict[str, str]:
+    return {model: breaker.state for model, breaker in _breakers.items()}
+
+
+class Hedger:
+    """Decides when to send a hedged duplicate of a slow LLM call.
+
+    Keeps the latest ``window`` successful latencies per (node, model) and
+    hedges once a call outlives their ``percentile``. At most
+    ``max_ratio`` of recent calls may be hedged, so a provider-wide
+    slowdown cannot double the load.
+    """
+
+    def __init__(
+        self,
+        *,
+        percentile: float,
+        min_samples: int,
+        min_delay: float,
+        max_ratio: float,
+        window: int = 200,
+    ) -> None:
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.window = window
+        self._latencies: dict[tuple[str, str], deque[float]] = {}
+        self._hedged: deque[bool] = deque(maxlen=window)
+
+    def observe(self, node: str, model: str, seconds: float) -> None:
+        samples = self._latencies.get((node, model))
+        if samples is None:
+            samples = self._latencies[(node, model)] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def delay(self, node: str, model: str) -> float | None:
+        """How long to wait before hedging, or None to not hedge this call."""
+        samples = self._latencies.get((node, model))
+        if not _hedging_allowed.get() or samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    def record_call(self, hedged: bool) -> None:
+        self._hedged.append(hedged)
+
+    def budget_left(self) -> bool:
+        if not self._hedged:
+            return True
+        return sum(self._hedged) / len(self._hedged) < self.max_ratio
+
+
+@lru_cache(maxsize=1)
+def get_hedger() -> Hedger | None:
+    if not settings.hedge_enabled:
+        return None
+    return Hedger(
+        percentile=settings.hedge_percentile,
+        min_samples=settings.hedge_min_samples,
+        min_delay=settings.hedge_min_delay_seconds,
+        max_ratio=settings.hedge_max_ratio,
+    )
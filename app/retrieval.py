@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+# Document types picked up from the knowledge folder.
+KNOWLEDGE_SUFFIXES = (".md", ".markdown", ".txt")
+
+# BM25 parameters; the usual defaults work well for short support docs.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+INDEX_FORMAT = 1
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "our so that the this to we what when where which who why will with you your".split()
+)
+
+# Turns a batch of texts into unit-length vectors.
+Embedder = Callable[[Sequence[str]], Sequence[Sequence[float]]]
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_text(text: str, max_chars: int) -> list[str]:
+    """Split a markdown/text document into paragraph-aligned chunks.
+
+    Paragraphs are packed up to ``max_chars``; each chunk is prefixed with
+    the heading it falls under so it still makes sense on its own.
+    """
+    chunks: list[str] = []
+    heading = ""
+    current: list[str] = []
+    size = 0
+
+    def flush() -> None:
+        nonlocal current, size
+        if current:
+            body = "\n\n".join(current)
+            if heading and not body.startswith(heading):
+                body = f"{heading}\n\n{body}"
+            chunks.append(body)
+        current, size = [], 0
+
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith("#"):
+            flush()
+            heading = block.splitlines()[0]
+        if current and size + len(block) > max_chars:
+            flush()
+        # Oversized paragraphs are cut into fixed windows.
+        while len(block) > max_chars:
+            current.append(block[:max_chars])
+            flush()
+            block = block[max_chars:]
+        current.append(block)
+        size += len(block)
+    flush()
+    return chunks
+
+
+@dataclass(frozen=True)
+class Chunk:
+    source: str
+    text: str
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    chunk: Chunk
+    score: float
+
+
+def _read_array(path: Path, typecode: str) -> memoryview | array:
+    """Map a packed array file read-only; empty files map to an empty array."""
+    if not path.is_file() or path.stat().st_size == 0:
+        return array(typecode)
+    with path.open("rb") as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+def _write_array(path: Path, values: array) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("wb") as fh:
+        values.tofile(fh)
+    os.replace(tmp, path)
+
+
+class KnowledgeIndex:
+    """BM25 index over knowledge chunks, optionally blended with embeddings.
+
+    Postings, document lengths and embeddings live in flat binary files that
+    are memory-mapped, so opening an index is cheap and the pages can be
+    shared between worker processes.
+    """
+
+    def __init__(self, index_dir: Path, embedder: Embedder | None = None) -> None:
+        manifest = json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))
+        self.content_hash: str = manifest["content_hash"]
+        # Bumped on every rebuild of this index directory.
+        self.version: int = manifest.get("version", 0)
+        self.chunks = [Chunk(source=c["source"], text=c["text"]) for c in manifest["chunks"]]
+        self._vocab: dict[str, list[int]] = manifest["vocab"]
+        self._avg_len: float = manifest["avg_len"]
+        self._dim: int = manifest["dim"]
+        self._doc_ids = _read_array(index_dir / "postings_ids.i32", "i")
+        self._doc_tfs = _read_array(index_dir / "postings_tf.i32", "i")
+        self._doc_lens = _read_array(index_dir / "doc_lens.i32", "i")
+        self._embeddings = _read_array(index_dir / "embeddings.f32", "f")
+        self._embedder = embedder if self._dim else None
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, k: int) -> list[SearchHit]:
+        """Return the ``k`` best chunks for ``query``, best first."""
+        n = len(self.chunks)
+        if not n or k <= 0:
+            return []
+
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self._vocab.get(term)
+            if entry is None:
+                continue
+            offset, count = entry
+            idf = math.log(1 + (n - count + 0.5) / (count + 0.5))
+            for i in range(offset, offset + count):
+                doc = self._doc_ids[i]
+                tf = self._doc_tfs[i]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lens[doc] / self._avg_len)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        if self._embedder is not None:
+            top = max(scores.values(), default=0.0) or 1.0
+            scores = {doc: score / top for doc, score in scores.items()}
+            vector = self._embedder([query])[0]
+            dim = self._dim
+            for doc in range(n):
+                row = self._embeddings[doc * dim : (doc + 1) * dim]
+                cosine = sum(a * b for a, b in zip(vector, row))
+                scores[doc] = scores.get(doc, 0.0) + cosine
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [SearchHit(chunk=self.chunks[doc], score=score) for doc, score in best if score > 0]
+
+
+def _file_hash(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@contextmanager
+def _build_lock(index_dir: Path) -> Iterator[None]:
+    """Hold an exclusive lock on ``index_dir`` across processes.
+
+    Every worker may rebuild the shared index; the lock keeps one from
+    opening the files while another is rewriting them.
+    """
+    with (index_dir / ".lock").open("a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _analyse_file(path: Path, source: str, chunk_chars: int) -> dict:
+    text = path.read_text(encoding="utf-8")
+    chunks = []
+    for body in chunk_text(text, chunk_chars):
+        counts: dict[str, int] = {}
+        for term in tokenize(body):
+            counts[term] = counts.get(term, 0) + 1
+        chunks.append({"source": source, "text": body, "terms": counts})
+    return {"chunks": chunks}
+
+
+def build_index(
+    docs_dir: Path,
+    index_dir: Path,
+    *,
+    chunk_chars: int,
+    embedder: Embedder | None = None,
+    embedder_name: str = "",
+    memo: dict[str, dict] | None = None,
+) -> KnowledgeIndex:
+    """Bring the on-disk index for ``docs_dir`` up to date and open it.
+
+    Chunking, tokenizing and embedding results are cached per file under
+    its content hash, so only new or edited files are re-analysed; the
+    postings are then reassembled from the cached term counts. Files whose
+    size and mtime match the last build are not even re-read for hashing.
+    A long-lived caller can pass the same ``memo`` dict to every call to
+    keep analysed files in memory between builds.
+    """
+    cache_dir = index_dir / "files"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with _build_lock(index_dir):
+        return _build_index(docs_dir, index_dir, cache_dir, chunk_chars, embedder, embedder_name, memo)
+
+
+def _build_index(
+    docs_dir: Path,
+    index_dir: Path,
+    cache_dir: Path,
+    chunk_chars: int,
+    embedder: Embedder | None,
+    embedder_name: str,
+    memo: dict[str, dict] | None,
+) -> KnowledgeIndex:
+
+    files = sorted(
+        p for p in docs_dir.rglob("*") if p.is_file() and p.suffix.lower() in KNOWLEDGE_SUFFIXES
+    ) if docs_dir.is_dir() else []
+
+    manifest_path = index_dir / "manifest.json"
+    previous: dict = {}
+    if manifest_path.is_file():
+        previous = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    previous_hashes: dict[str, str] = previous.get("files", {})
+    previous_stats: dict[str, list[int]] = previous.get("stats", {})
+    file_hashes: dict[str, str] = {}
+    file_stats: dict[str, list[int]] = {}
+    for path in files:
+        source = path.relative_to(docs_dir).as_posix()
+        stat = path.stat()
+        file_stats[source] = [stat.st_mtime_ns, stat.st_size]
+        if previous_stats.get(source) == file_stats[source] and source in previous_hashes:
+            file_hashes[source] = previous_hashes[source]
+        else:
+            file_hashes[source] = _file_hash(path)
+    settings_key = f"{INDEX_FORMAT}:{chunk_chars}:{embedder_name if embedder else ''}"
+    content_hash = hashlib.sha256(
+        json.dumps([settings_key, sorted(file_hashes.items())]).encode("utf-8")
+    ).hexdigest()
+
+    if previous.get("content_hash") == content_hash:
+        return KnowledgeIndex(index_dir, embedder)
+
+    chunks: list[dict] = []
+    embeddings = array("f")
+    dim = 0
+    live_cache: set[str] = set()
+    analysed_by_key: dict[str, dict] = {}
+    for path in files:
+        source = path.relative_to(docs_dir).as_posix()
+        digest = file_hashes[source]
+        # The source is part of the key because chunks record where they came from.
+        key = hashlib.sha256(f"{settings_key}:{source}:{digest}".encode("utf-8")).hexdigest()[:32]
+        cache_path = cache_dir / f"{key}.json"
+        live_cache.add(cache_path.name)
+        analysed = memo.get(key) if memo is not None else None
+        if analysed is None:
+            if cache_path.is_file():
+                analysed = json.loads(cache_path.read_text(encoding="utf-8"))
+            else:
+                analysed = _analyse_file(path, source, chunk_chars)
+                cache_path.write_text(json.dumps(analysed), encoding="utf-8")
+        analysed_by_key[key] = analysed
+        chunks.extend(analysed["chunks"])
+
+        if embedder is not None and analysed["chunks"]:
+            vectors_path = cache_dir / f"{key}.f32"
+            live_cache.add(vectors_path.name)
+            vectors = array("f")
+            if vectors_path.is_file():
+                with vectors_path.open("rb") as fh:
+                    vectors.frombytes(fh.read())
+            else:
+                for row in embedder([c["text"] for c in analysed["chunks"]]):
+                    vectors.extend(float(x) for x in row)
+                _write_array(vectors_path, vectors)
+            dim = len(vectors) // len(analysed["chunks"])
+            embeddings.extend(vectors)
+
+    # Drop cache entries for files that changed or disappeared.
+    for stale in cache_dir.iterdir():
+        if stale.name not in live_cache:
+            stale.unlink()
+
+    postings: dict[str, list[tuple[int, int]]] = {}
+    doc_lens = array("i")
+    for doc, chunk in enumerate(chunks):
+        terms = chunk["terms"]
+        doc_lens.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append((doc, tf))
+
+    doc_ids, doc_tfs = array("i"), array("i")
+    vocab: dict[str, list[int]] = {}
+    for term in sorted(postings):
+        vocab[term] = [len(doc_ids), len(postings[term])]
+        for doc, tf in postings[term]:
+            doc_ids.append(doc)
+            doc_tfs.append(tf)
+
+    _write_array(index_dir / "postings_ids.i32", doc_ids)
+    _write_array(index_dir / "postings_tf.i32", doc_tfs)
+    _write_array(index_dir / "doc_lens.i32", doc_lens)
+    _write_array(index_dir / "embeddings.f32", embeddings)
+
+    manifest = {
+        "format": INDEX_FORMAT,
+        "content_hash": content_hash,
+        "version": previous.get("version", 0) + 1,
+        "files": file_hashes,
+        "stats": file_stats,
+        "chunks": [{"source": c["source"], "text": c["text"]} for c in chunks],
+        "vocab": vocab,
+        "avg_len": max(sum(doc_lens) / len(doc_lens), 1.0) if doc_lens else 1.0,
+        "dim": dim,
+    }
+    tmp = manifest_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, manifest_path)
+    if memo is not None:
+        memo.clear()
+        memo.update(analysed_by_key)
+    return KnowledgeIndex(index_dir, embedder)
+
+
+@lru_cache(maxsize=None)
+def load_embedder(model_name: str) -> Embedder | None:
+    """Load a local sentence-transformers model, if one is configured and installed.
+
+    Cached, so every knowledge base using the same model shares one copy.
+    """
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print(f"sentence-transformers is not installed; ignoring embeddings model {model_name!r}")
+        return None
+
+    model = SentenceTransformer(model_name)
+
+    def embed(texts: Sequence[str]) -> Sequence[Sequence[float]]:
+        return model.encode(list(texts), normalize_embeddings=True).tolist()
+
+    return embed
@@ -0,0 +1,208 @@
+"""Pre-forking server: load the app once, then fork workers that share it.
+
+    python -m app.serve --workers 4
+
+The parent imports the app and builds the knowledge index, chat models and
+compiled graphs (``app.main.preload``), freezes them out of the garbage
+collector, binds the listening socket and forks the workers, each running
+uvicorn on that socket. Pages the workers only read stay shared with the
+parent, so an extra worker costs its own heap rather than a copy of the
+app. A worker that dies is replaced; SIGINT or SIGTERM stops them all.
+
+Each worker has its own event loop, LLM connections, metrics, rate limits,
+session locks and in-flight idempotency runs. Sessions must live in a store
+every worker reaches, so more than one worker requires
+``SESSION_BACKEND=sqlite`` or ``log``; turns of one session sent
+concurrently may still land on different workers. Idempotency records are
+kept in that store too, so a retried key replays on any worker.
+
+``/metrics`` on the shared port answers from whichever worker took the
+connection. Every sample carries a ``worker`` label with the worker's
+index, and with ``--metrics-port`` (``METRICS_PORT``) worker N also serves
+``/metrics``, and nothing else, on that port + N, so each can be scraped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from typing import Any
+
+# A worker exiting sooner than this after its start is restarted only
+# after the same delay, so a broken deploy does not fork in a tight loop.
+RESTART_BACKOFF_SECONDS = 1.0
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _metrics_only(app: Any, port: int) -> Any:
+    """Wrap ``app`` so connections to ``port`` reach only ``/metrics``."""
+    from starlette.responses import PlainTextResponse
+    from starlette.websockets import WebSocketClose
+
+    async def wrapped(scope: dict[str, Any], receive: Any, send: Any) -> None:
+        server = scope.get("server")
+        if scope["type"] != "lifespan" and server and server[1] == port and scope["path"] != "/metrics":
+            if scope["type"] == "websocket":
+                await WebSocketClose()(scope, receive, send)
+            else:
+                await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+            return
+        await app(scope, receive, send)
+
+    return wrapped
+
+
+def _run_worker(sock: socket.socket, index: int, host: str, metrics_port: int, log_level: str) -> None:
+    # Parent-only handlers; uvicorn installs its own while it serves.
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    gc.enable()
+    import uvicorn
+
+    from app.main import app
+    from app.metrics import REGISTRY
+
+    REGISTRY.label_all(worker=str(index))
+    sockets = [sock]
+    if metrics_port:
+        sockets.append(_listen(host, metrics_port + index))
+        app = _metrics_only(app, metrics_port + index)
+    uvicorn.Server(uvicorn.Config(app, lifespan="on", log_level=log_level)).run(sockets=sockets)
+
+
+def _fork_worker(sock: socket.socket, index: int, host: str, metrics_port: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        _run_worker(sock, index, host, metrics_port, log_level)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(
+    host: str,
+    port: int,
+    workers: int,
+    *,
+    metrics_port: int = 0,
+    freeze: bool = True,
+    log_level: str = "info",
+) -> int:
+    """Preload the app, fork ``workers`` uvicorn workers and supervise them."""
+    # Objects built from here on are long-lived; collecting while building
+    # would only leave freed holes in pages the workers are meant to share.
+    gc.disable()
+    from app.config import settings
+    from app.main import preload
+    from app.sessions import SHARED_SESSION_BACKENDS
+
+    if workers > 1 and settings.session_backend not in SHARED_SESSION_BACKENDS:
+        print(
+            f"{workers} workers need a shared session store; set SESSION_BACKEND to one of "
+            f"{sorted(SHARED_SESSION_BACKENDS)} (got {settings.session_backend!r}).",
+            file=sys.stderr,
+        )
+        return 2
+
+    start = time.perf_counter()
+    preload()
+    if freeze:
+        # Collections in the workers then never write to these objects' GC
+        # headers, which would copy their pages.
+        gc.collect()
+        gc.freeze()
+    print(f"Preloaded the app in {time.perf_counter() - start:.2f}s; forking {workers} workers")
+    if threading.active_count() > 1:
+        print("Warning: threads are running before fork; workers only get the main thread.", file=sys.stderr)
+
+    sock = _listen(host, port)
+    # pid -> (worker index, start time); a restarted worker keeps its index.
+    started: dict[int, tuple[int, float]] = {}
+    stopping = False
+
+    def stop(signum: int, _frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in started:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        started[_fork_worker(sock, index, host, metrics_port, log_level)] = (index, time.monotonic())
+
+    while started:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        if pid not in started:
+            continue
+        index, born = started.pop(pid)
+        lived = time.monotonic() - born
+        if stopping:
+            continue
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting", file=sys.stderr)
+        if lived < RESTART_BACKOFF_SECONDS:
+            time.sleep(RESTART_BACKOFF_SECONDS)
+        if not stopping:
+            started[_fork_worker(sock, index, host, metrics_port, log_level)] = (index, time.monotonic())
+    sock.close()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    from app.config import settings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.workers, help="default: WORKERS")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=settings.metrics_port,
+        help="worker N serves /metrics on this port + N (default: METRICS_PORT; 0 disables)",
+    )
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument(
+        "--no-gc-freeze", dest="freeze", action="store_false", help="skip gc.freeze (for comparison)"
+    )
+    args = parser.parse_args(argv)
+    return serve(
+        args.host,
+        args.port,
+        max(args.workers, 1),
+        metrics_port=args.metrics_port,
+        freeze=args.freeze,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
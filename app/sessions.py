@@ -0,0 +1,592 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterable, Iterator
+
+import msgpack
+from langchain_core.messages import messages_from_dict
+
+from app.config import settings
+from app.history import History, Message
+from app.metrics import SESSION_LOCK_WAIT, SESSION_WRITE_BYTES
+from app.state import ChatState
+
+
+def dump_state(state: ChatState) -> bytes:
+    """Serialize a session state to msgpack; messages become [type, content] pairs."""
+    payload: dict[str, Any] = dict(state)
+    payload["messages"] = [(m.type, m.content) for m in state.get("messages") or ()]
+    return msgpack.packb(payload, default=str)
+
+
+def load_state(data: bytes) -> ChatState:
+    """Inverse of :func:`dump_state`; also reads states stored as JSON."""
+    if data[:1] == b"{":
+        payload = json.loads(data)
+        payload["messages"] = History(messages_from_dict(payload.get("messages") or []))
+        return payload
+    payload = msgpack.unpackb(data)
+    payload["messages"] = History(Message(type, content) for type, content in payload.get("messages") or ())
+    return payload
+
+
+@dataclass
+class SessionStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class SessionStore(ABC):
+    """Where conversation state lives between ``/chat`` turns.
+
+    Implementations evict idle sessions after ``ttl_seconds`` and keep at
+    most ``max_entries`` sessions; a ``get`` for an evicted session is a
+    miss and the conversation starts over.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = SessionStats()
+
+    @abstractmethod
+    async def get(self, session_id: str) -> ChatState | None: ...
+
+    @abstractmethod
+    async def set(self, session_id: str, state: ChatState) -> None: ...
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None: ...
+
+    def stats_snapshot(self) -> dict[str, int]:
+        return asdict(self.stats)
+
+    def _record(self, state: ChatState | None) -> ChatState | None:
+        if state is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return state
+
+
+# Rough msgpack framing of one [type, content] history entry.
+MESSAGE_OVERHEAD_BYTES = 8
+
+
+def _message_bytes(messages: Iterable[Message]) -> int:
+    return sum(len(m.content) + len(m.type) + MESSAGE_OVERHEAD_BYTES for m in messages)
+
+
+@dataclass
+class _Entry:
+    state: ChatState
+    size: int
+    touched: float
+    # Length and weight of the history counted in ``size``.
+    messages: int = 0
+    message_bytes: int = 0
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU with an idle TTL, an entry cap and a byte-size cap.
+
+    Sizes approximate the serialized length of each state, which tracks the
+    real footprint closely enough to bound memory without walking object
+    graphs. History only grows, so a write weighs just the messages added
+    since the session's previous write, plus the other fields; a turn costs
+    the same however long the conversation.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_entries: int, max_bytes: int) -> None:
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, session_id: str) -> ChatState | None:
+        entry = self._entries.get(session_id)
+        if entry is not None and time.monotonic() - entry.touched > self.ttl_seconds:
+            self._drop(session_id)
+            self.stats.evictions += 1
+            entry = None
+        if entry is None:
+            return self._record(None)
+        entry.touched = time.monotonic()
+        self._entries.move_to_end(session_id)
+        return self._record(entry.state)
+
+    async def set(self, session_id: str, state: ChatState) -> None:
+        previous = self._entries.get(session_id)
+        self._drop(session_id)
+        messages = state.get("messages") or History()
+        if previous is not None and previous.messages <= len(messages):
+            message_bytes = previous.message_bytes + _message_bytes(messages[previous.messages :])
+        else:
+            message_bytes = _message_bytes(messages)
+        fields = len(dump_state({**state, "messages": History()}))
+        entry = _Entry(
+            state=state,
+            size=fields + message_bytes,
+            touched=time.monotonic(),
+            messages=len(messages),
+            message_bytes=message_bytes,
+        )
+        self._entries[session_id] = entry
+        self.total_bytes += entry.size
+        self._evict()
+
+    async def delete(self, session_id: str) -> None:
+        self._drop(session_id)
+
+    def _drop(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        # Entries are kept in touch order, so expired ones sit at the front.
+        while self._entries:
+            oldest_id, oldest = next(iter(self._entries.items()))
+            over_budget = (
+                len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+            )
+            if oldest.touched >= cutoff and not over_budget:
+                break
+            # Never evict the session that was just written.
+            if len(self._entries) == 1:
+                break
+            self._drop(oldest_id)
+            self.stats.evictions += 1
+
+
+class SQLiteSessionStore(SessionStore):
+    """File-backed store that several worker processes can share.
+
+    SQLite runs in WAL mode so readers do not block the writer; calls are
+    pushed to a thread so the event loop never waits on disk. Each process
+    connects on its first call. Counters are per process.
+    """
+
+    # Expired and surplus rows are swept every this many writes.
+    SWEEP_EVERY = 100
+    SCHEMA: tuple[str, ...] = (
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        " session_id TEXT PRIMARY KEY,"
+        " data BLOB NOT NULL,"
+        " touched REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)",
+    )
+
+    def __init__(self, path: str, *, ttl_seconds: float, max_entries: int) -> None:
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use, so a pre-forking parent that imports the app
+        # never hands its workers a shared connection. Call with _lock held.
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    async def get(self, session_id: str) -> ChatState | None:
+        return self._record(await asyncio.to_thread(self._get, session_id))
+
+    async def set(self, session_id: str, state: ChatState) -> None:
+        await asyncio.to_thread(self._set, session_id, dump_state(state))
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _execute(self, sql: str, params: tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db().execute(sql, params)
+
+    def _get(self, session_id: str) -> ChatState | None:
+        now = time.time()
+        with self._lock:
+            row = self._db().execute(
+                "SELECT data, touched FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._db().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self.stats.evictions += 1
+                return None
+            self._db().execute(
+                "UPDATE sessions SET touched = ? WHERE session_id = ?", (now, session_id)
+            )
+        return load_state(row[0])
+
+    def _set(self, session_id: str, data: bytes) -> None:
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, touched) VALUES (?, ?, ?)",
+                (session_id, data, time.time()),
+            )
+            SESSION_WRITE_BYTES.inc(len(data), kind="state")
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                self._sweep()
+
+    def _sweep(self) -> None:
+        expired = self._db().execute(
+            "DELETE FROM sessions WHERE touched < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+        surplus = self._db().execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            " SELECT session_id FROM sessions ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self.stats.evictions += max(expired, 0) + max(surplus, 0)
+
+
+def pack_fields(state: ChatState) -> dict[str, bytes]:
+    """Every state field except the messages, each serialized on its own."""
+    return {key: msgpack.packb(value, default=str) for key, value in state.items() if key != "messages"}
+
+
+def replay_log(snapshot: bytes | None, records: Iterable[bytes]) -> ChatState:
+    """Rebuild a session state from its snapshot and the turn records after it."""
+    state: ChatState = load_state(snapshot) if snapshot is not None else {}
+    added: list[tuple[str, str]] = []
+    for data in records:
+        record = msgpack.unpackb(data)
+        added.extend(record.get("m") or ())
+        state.update(record.get("f") or {})
+        for key in record.get("x") or ():
+            state.pop(key, None)
+    messages = state.get("messages") or History()
+    state["messages"] = messages.appended(Message(type, content) for type, content in added) if added else messages
+    return state
+
+
+@dataclass
+class _Base:
+    """A session as this process last read or wrote it; turn records are diffed against it."""
+
+    seq: int
+    messages: int
+    fields: dict[str, bytes]
+
+
+class TurnLogSessionStore(SQLiteSessionStore):
+    """SQLite store that appends each turn's changes instead of rewriting the session.
+
+    A write appends one record holding the messages the turn added and the
+    fields it changed or removed, diffed against the state this process
+    last read or wrote for the session. When the log since a session's
+    snapshot grows past the snapshot itself (and ``compact_bytes``), that
+    write stores a new snapshot and drops the log instead, so bytes written
+    per turn stay flat however long the conversation, and a read is one
+    snapshot plus a log no larger than it. Each write is one transaction:
+    after a crash a session reads back as of its last completed turn.
+
+    A session written by another process since this one read it, or not
+    read here at all, gets a fresh snapshot rather than a record.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS session_heads ("
+        " session_id TEXT PRIMARY KEY,"
+        " seq INTEGER NOT NULL,"
+        " snapshot_bytes INTEGER NOT NULL,"
+        " log_bytes INTEGER NOT NULL,"
+        " touched REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS session_heads_touched ON session_heads (touched)",
+        "CREATE TABLE IF NOT EXISTS session_snapshots ("
+        " session_id TEXT PRIMARY KEY,"
+        " seq INTEGER NOT NULL,"
+        " data BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS session_log ("
+        " session_id TEXT NOT NULL,"
+        " seq INTEGER NOT NULL,"
+        " data BLOB NOT NULL,"
+        " PRIMARY KEY (session_id, seq))",
+    )
+
+    def __init__(self, path: str, *, ttl_seconds: float, max_entries: int, compact_bytes: int) -> None:
+        super().__init__(path, ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.compact_bytes = compact_bytes
+        self._bases: OrderedDict[str, _Base] = OrderedDict()
+
+    async def set(self, session_id: str, state: ChatState) -> None:
+        await asyncio.to_thread(self._append, session_id, state)
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._forget, session_id)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Call with _lock held.
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _get(self, session_id: str) -> ChatState | None:
+        now = time.time()
+        with self._lock, self._transaction() as db:
+            head = db.execute(
+                "SELECT seq, touched FROM session_heads WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if head is None:
+                self._bases.pop(session_id, None)
+                return None
+            if now - head[1] > self.ttl_seconds:
+                self._delete(db, session_id)
+                self.stats.evictions += 1
+                return None
+            db.execute("UPDATE session_heads SET touched = ? WHERE session_id = ?", (now, session_id))
+            snapshot = db.execute(
+                "SELECT seq, data FROM session_snapshots WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            records = db.execute(
+                "SELECT data FROM session_log WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, snapshot[0] if snapshot else 0),
+            ).fetchall()
+        state = replay_log(snapshot[1] if snapshot else None, (data for (data,) in records))
+        base = _Base(head[0], len(state["messages"]), pack_fields(state))
+        with self._lock:
+            self._remember(session_id, base)
+        return state
+
+    def _append(self, session_id: str, state: ChatState) -> None:
+        messages = state.get("messages") or History()
+        fields = pack_fields(state)
+        with self._lock:
+            base = self._bases.pop(session_id, None)
+            with self._transaction() as db:
+                head = db.execute(
+                    "SELECT seq, snapshot_bytes, log_bytes FROM session_heads WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                seq = (head[0] if head else 0) + 1
+                if base is None or head is None or head[0] != base.seq or len(messages) < base.messages:
+                    self._snapshot(db, session_id, seq, state)
+                else:
+                    record = msgpack.packb(
+                        {
+                            "m": [(m.type, m.content) for m in messages[base.messages :]],
+                            "f": {key: state[key] for key, value in fields.items() if base.fields.get(key) != value},
+                            "x": [key for key in base.fields if key not in fields],
+                        },
+                        default=str,
+                    )
+                    log_bytes = head[2] + len(record)
+                    if log_bytes > max(head[1], self.compact_bytes):
+                        self._snapshot(db, session_id, seq, state)
+                    else:
+                        db.execute(
+                            "INSERT INTO session_log (session_id, seq, data) VALUES (?, ?, ?)",
+                            (session_id, seq, record),
+                        )
+                        db.execute(
+                            "UPDATE session_heads SET seq = ?, log_bytes = ?, touched = ? WHERE session_id = ?",
+                            (seq, log_bytes, time.time(), session_id),
+                        )
+                        SESSION_WRITE_BYTES.inc(len(record), kind="log")
+            self._remember(session_id, _Base(seq, len(messages), fields))
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                self._sweep()
+
+    def _snapshot(self, db: sqlite3.Connection, session_id: str, seq: int, state: ChatState) -> None:
+        data = dump_state(state)
+        db.execute(
+            "INSERT OR REPLACE INTO session_snapshots (session_id, seq, data) VALUES (?, ?, ?)",
+            (session_id, seq, data),
+        )
+        db.execute("DELETE FROM session_log WHERE session_id = ?", (session_id,))
+        db.execute(
+            "INSERT OR REPLACE INTO session_heads (session_id, seq, snapshot_bytes, log_bytes, touched)"
+            " VALUES (?, ?, ?, 0, ?)",
+            (session_id, seq, len(data), time.time()),
+        )
+        SESSION_WRITE_BYTES.inc(len(data), kind="snapshot")
+
+    def _remember(self, session_id: str, base: _Base) -> None:
+        self._bases[session_id] = base
+        self._bases.move_to_end(session_id)
+        while len(self._bases) > self.max_entries:
+            self._bases.popitem(last=False)
+
+    def _delete(self, db: sqlite3.Connection, session_id: str) -> None:
+        self._bases.pop(session_id, None)
+        for table in ("session_heads", "session_snapshots", "session_log"):
+            db.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+    def _forget(self, session_id: str) -> None:
+        with self._lock, self._transaction() as db:
+            self._delete(db, session_id)
+
+    def _sweep(self) -> None:
+        with self._transaction() as db:
+            stale = db.execute(
+                "SELECT session_id FROM session_heads WHERE touched < ? UNION"
+                " SELECT session_id FROM ("
+                "  SELECT session_id FROM session_heads ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+                (time.time() - self.ttl_seconds, self.max_entries),
+            ).fetchall()
+            for (session_id,) in stale:
+                self._delete(db, session_id)
+        self.stats.evictions += len(stale)
+
+
+class CheckpointerSessionStore(SessionStore):
+    """Adapter that keeps sessions in a LangGraph checkpointer.
+
+    Each session is a checkpointer thread holding exactly one checkpoint:
+    writes replace the thread, so backends that keep history do not grow
+    per turn. The state is stored as :func:`dump_state` bytes, which every
+    checkpoint serializer passes through as is.
+
+    Unlike the other backends, the TTL counts from the last write, not the
+    last read: it is checked against the checkpoint timestamp, and reading
+    a session does not refresh it. The entry cap is enforced over the
+    threads this process has written.
+    """
+
+    CHANNEL = "session"
+
+    def __init__(self, checkpointer: Any, *, ttl_seconds: float, max_entries: int) -> None:
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.checkpointer = checkpointer
+        self._known: OrderedDict[str, None] = OrderedDict()
+
+    @staticmethod
+    def _config(session_id: str) -> dict[str, Any]:
+        return {"configurable": {"thread_id": session_id, "checkpoint_ns": ""}}
+
+    async def get(self, session_id: str) -> ChatState | None:
+        saved = await self.checkpointer.aget_tuple(self._config(session_id))
+        if saved is None:
+            return self._record(None)
+        written = datetime.fromisoformat(saved.checkpoint["ts"]).timestamp()
+        if time.time() - written > self.ttl_seconds:
+            await self.delete(session_id)
+            self.stats.evictions += 1
+            return self._record(None)
+        self._known[session_id] = None
+        self._known.move_to_end(session_id)
+        data = saved.checkpoint["channel_values"].get(self.CHANNEL)
+        return self._record(load_state(data) if data is not None else None)
+
+    async def set(self, session_id: str, state: ChatState) -> None:
+        from langgraph.checkpoint.base import empty_checkpoint
+
+        checkpoint = empty_checkpoint()
+        version = self.checkpointer.get_next_version(None, None)
+        checkpoint["channel_values"] = {self.CHANNEL: dump_state(state)}
+        checkpoint["channel_versions"] = {self.CHANNEL: version}
+
+        await self.checkpointer.adelete_thread(session_id)
+        await self.checkpointer.aput(
+            self._config(session_id),
+            checkpoint,
+            {"source": "update", "step": -1, "parents": {}},
+            {self.CHANNEL: version},
+        )
+
+        self._known[session_id] = None
+        self._known.move_to_end(session_id)
+        while len(self._known) > self.max_entries:
+            oldest, _ = self._known.popitem(last=False)
+            await self.checkpointer.adelete_thread(oldest)
+            self.stats.evictions += 1
+
+    async def delete(self, session_id: str) -> None:
+        self._known.pop(session_id, None)
+        await self.checkpointer.adelete_thread(session_id)
+
+
+class _LockSlot:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+
+class SessionLocks:
+    """Per-session locks so turns of one session run one at a time.
+
+    ``asyncio.Lock`` wakes waiters first-in first-out, so turns apply in
+    arrival order. A slot lives only while some turn holds or waits on
+    it. Locks are per process; workers sharing a session store still need
+    sticky routing for strict ordering.
+    """
+
+    def __init__(self) -> None:
+        self._slots: dict[str, _LockSlot] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @asynccontextmanager
+    async def hold(self, session_id: str) -> AsyncIterator[None]:
+        slot = self._slots.get(session_id)
+        if slot is None:
+            slot = self._slots[session_id] = _LockSlot()
+        slot.holders += 1
+        try:
+            start = time.perf_counter()
+            async with slot.lock:
+                SESSION_LOCK_WAIT.observe(time.perf_counter() - start)
+                yield
+        finally:
+            slot.holders -= 1
+            if not slot.holders:
+                del self._slots[session_id]
+
+
+# Backends whose sessions every worker process on the host can read.
+SHARED_SESSION_BACKENDS = frozenset({"sqlite", "log"})
+
+
+def build_session_store() -> SessionStore:
+    """Create the session store selected by ``SESSION_BACKEND``."""
+    backend = settings.session_backend
+    limits = {
+        "ttl_seconds": settings.session_ttl_seconds,
+        "max_entries": settings.session_max_entries,
+    }
+    if backend == "sqlite":
+        return SQLiteSessionStore(settings.session_db_path, **limits)
+    if backend == "log":
+        return TurnLogSessionStore(
+            settings.session_db_path, compact_bytes=settings.session_log_compact_bytes, **limits
+        )
+    if backend == "checkpointer":
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        return CheckpointerSessionStore(InMemorySaver(), **limits)
+    if backend == "memory":
+        return MemorySessionStore(max_bytes=settings.session_max_bytes, **limits)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
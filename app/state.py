@@ -3,10 +3,9 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Literal, Optional
 
-from langchain_core.messages import BaseMessage
 from typing_extensions import Annotated, TypedDict
 
-from langgraph.graph.message import add_messages
+from app.history import History, append_messages
 
 
 LeadStatus = Literal["none", "collecting", "sent", "failed"]
@@ -32,7 +31,7 @@ class Lead(TypedDict):
 class ChatState(TypedDict, total=False):
     """Global conversation state stored in LangGraph."""
 
-    messages: Annotated[list[BaseMessage], add_messages]
+    messages: Annotated[History, append_messages]
     user_profile: UserProfile
     lead_status: LeadStatus
     lead_step: Literal[
@@ -53,6 +52,10 @@ class ChatState(TypedDict, total=False):
     lead: Lead
     lead_attempts: dict[str, int]
     lead_message: str
+    # Rolling summary of turns that no longer fit the prompt window, and the
+    # number of leading messages it already covers.
+    summary: str
+    summarized_upto: int
 
 
 def new_lead(
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.config import get_config
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import MODEL_TIERS, settings
+from app.knowledge import KnowledgeManager, get_knowledge
+from app.llm import with_model
+from app.metrics import TENANT_LOAD_SECONDS, TENANT_LOADS
+
+DEFAULT_TENANT_ID = "default"
+# Tenant ids end up in URLs, folder names and session keys.
+TENANT_ID_RE = re.compile(r"[a-z0-9][a-z0-9_-]{0,62}")
+# Session ids come from clients. Control characters are kept out of them so
+# the keys the server derives (batch replays, idempotency keys) can use
+# them as separators no client id can reach.
+SESSION_ID_PATTERN = r"^[^\x00-\x1f\x7f]{1,256}$"
+SESSION_ID_RE = re.compile(SESSION_ID_PATTERN)
+
+
+@dataclass(frozen=True, eq=False)
+class Tenant:
+    """One site served by this process."""
+
+    id: str
+    knowledge_dir: Path
+    index_dir: Path
+    # Model per tier (see MODEL_TIERS); tiers not listed use the process default.
+    models: dict[str, str] = field(default_factory=dict)
+    # Discord webhook for this site's leads; None uses DISCORD_WEBHOOK_URL.
+    lead_webhook_url: str | None = None
+    # Added to answering prompts right after the static instructions.
+    instructions: str = ""
+
+    @property
+    def is_default(self) -> bool:
+        return self.id == DEFAULT_TENANT_ID
+
+    def session_key(self, session_id: str) -> str:
+        """Where ``session_id`` is stored; tenants never see each other's sessions.
+
+        Every tenant, the default one included, prefixes its id. Tenant ids
+        have no ``:``, so ``acme:abc`` sent to the default tenant stays
+        ``default:acme:abc`` and never reaches tenant acme's ``abc``.
+        """
+        return f"{self.id}:{session_id}"
+
+
+@lru_cache(maxsize=1)
+def default_tenant() -> Tenant:
+    """The site configured by the process settings."""
+    return Tenant(DEFAULT_TENANT_ID, Path(settings.knowledge_dir), Path(settings.knowledge_index_dir))
+
+
+def read_tenant(root: Path, tenant_id: str) -> Tenant | None:
+    """The tenant in ``root/tenant_id``, or None if there is no such folder.
+
+    ``tenant.json`` is optional and may set ``models`` (tier to model name),
+    ``lead_webhook_url`` and ``instructions``. Raises ValueError if it is
+    malformed and OSError if it cannot be read.
+    """
+    folder = root / tenant_id
+    if not TENANT_ID_RE.fullmatch(tenant_id) or not folder.is_dir():
+        return None
+    config_path = folder / "tenant.json"
+    config: Any = json.loads(config_path.read_text(encoding="utf-8")) if config_path.is_file() else {}
+    if not isinstance(config, dict) or not isinstance(config.get("models") or {}, dict):
+        raise ValueError(f"tenant {tenant_id}: tenant.json must be an object, with models as an object")
+    models = dict(config.get("models") or {})
+    unknown = set(models) - set(MODEL_TIERS)
+    if unknown:
+        raise ValueError(f"tenant {tenant_id}: unknown model tiers {sorted(unknown)}")
+    return Tenant(
+        tenant_id,
+        folder / "knowledge",
+        Path(settings.knowledge_index_dir) / "tenants" / tenant_id,
+        models=models,
+        lead_webhook_url=config.get("lead_webhook_url") or None,
+        instructions=str(config.get("instructions") or ""),
+    )
+
+
+class TenantRegistry:
+    """Tenant configs and an LRU of their loaded knowledge bases.
+
+    A tenant's config is read on its first request. Its knowledge is opened
+    from the persisted index (or built) in a worker thread the first time a
+    turn needs it, and watched for edits while loaded. Past ``max_loaded``
+    tenants the least recently used one is dropped; a turn already holding
+    its index keeps using it. The default tenant's knowledge is the process
+    one and is never evicted.
+    """
+
+    def __init__(self, root: Path | None, *, max_loaded: int, poll_seconds: float = 0.0) -> None:
+        self.root = root
+        self.max_loaded = max(max_loaded, 1)
+        self.poll_seconds = poll_seconds
+        self._tenants: dict[str, Tenant] = {}
+        self._loaded: OrderedDict[str, KnowledgeManager] = OrderedDict()
+        self._loading: dict[str, asyncio.Task[KnowledgeManager]] = {}
+
+    @property
+    def loaded(self) -> int:
+        return len(self._loaded)
+
+    def get(self, tenant_id: str | None) -> Tenant:
+        """The tenant called ``tenant_id``, the default one if None.
+
+        Raises KeyError if it is unknown, and ValueError or OSError if its
+        ``tenant.json`` is broken; a broken config is read again next time.
+        """
+        if not tenant_id or tenant_id == DEFAULT_TENANT_ID:
+            return default_tenant()
+        tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            tenant = read_tenant(self.root, tenant_id) if self.root is not None else None
+            if tenant is None:
+                raise KeyError(tenant_id)
+            self._tenants[tenant_id] = tenant
+        return tenant
+
+    async def knowledge(self, tenant: Tenant) -> KnowledgeManager:
+        if tenant.is_default:
+            return get_knowledge()
+        manager = self._loaded.get(tenant.id)
+        if manager is not None:
+            self._loaded.move_to_end(tenant.id)
+            return manager
+        task = self._loading.get(tenant.id)
+        if task is None:
+            task = self._loading[tenant.id] = asyncio.create_task(self._load(tenant))
+            task.add_done_callback(lambda _: self._loading.pop(tenant.id, None))
+        # A caller that gives up must not cancel the load for everyone waiting on it.
+        return await asyncio.shield(task)
+
+    async def _load(self, tenant: Tenant) -> KnowledgeManager:
+        start = time.perf_counter()
+        try:
+            manager = await asyncio.to_thread(
+                KnowledgeManager,
+                tenant.knowledge_dir,
+                tenant.index_dir,
+                chunk_chars=settings.knowledge_chunk_chars,
+                embedder_name=settings.knowledge_embeddings_model,
+                poll_seconds=self.poll_seconds,
+            )
+        except Exception:
+            TENANT_LOADS.inc(outcome="error")
+            raise
+        TENANT_LOAD_SECONDS.observe(time.perf_counter() - start)
+        TENANT_LOADS.inc(outcome="loaded")
+        self._loaded[tenant.id] = manager
+        manager.start()
+        while len(self._loaded) > self.max_loaded:
+            _, evicted = self._loaded.popitem(last=False)
+            TENANT_LOADS.inc(outcome="evicted")
+            await evicted.stop()
+        return manager
+
+    async def close(self) -> None:
+        while self._loaded:
+            _, manager = self._loaded.popitem()
+            await manager.stop()
+
+
+@lru_cache(maxsize=1)
+def get_tenants() -> TenantRegistry:
+    return TenantRegistry(
+        Path(settings.tenants_dir) if settings.tenants_dir else None,
+        max_loaded=settings.tenant_max_loaded,
+        poll_seconds=settings.knowledge_poll_seconds,
+    )
+
+
+def run_config(tenant: Tenant, knowledge: KnowledgeManager) -> RunnableConfig:
+    """Graph run config carrying the tenant, so one compiled graph serves them all."""
+    return {"configurable": {"tenant": tenant, "knowledge": knowledge}}
+
+
+def _configurable() -> dict[str, Any]:
+    try:
+        return get_config().get("configurable") or {}
+    except RuntimeError:
+        # Outside a graph run, e.g. a node called directly.
+        return {}
+
+
+def current_tenant() -> Tenant:
+    """The tenant of the graph run in progress."""
+    return _configurable().get("tenant") or default_tenant()
+
+
+def current_knowledge() -> KnowledgeManager:
+    """The knowledge base of the graph run's tenant."""
+    return _configurable().get("knowledge") or get_knowledge()
+
+
+def tenant_model(
+    model: Runnable[Any, BaseMessage], tier: str, tenant: Tenant | None = None
+) -> Runnable[Any, BaseMessage]:
+    """``model``, re-targeted at the tenant's model for ``tier`` if it sets one.
+
+    ``tenant`` defaults to the tenant of the graph run in progress.
+    """
+    name = (tenant or current_tenant()).models.get(tier)
+    return with_model(model, name) if name else model
+
+
+def tenant_instructions() -> list[SystemMessage]:
+    """The current tenant's prompt instructions, if it has any."""
+    instructions = current_tenant().instructions
+    return [SystemMessage(content=instructions)] if instructions else []
+
+
+# /t/<tenant>/<path> serves the same routes as /<path>, for that tenant.
+_TENANT_PATH_RE = re.compile(r"/t/([^/]+)(/.*)?")
+
+
+class TenantPathMiddleware:
+    """ASGI middleware serving ``/t/<tenant>/<path>`` as ``/<path>`` with an ``X-Tenant-ID`` header."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        match = _TENANT_PATH_RE.fullmatch(scope["path"]) if scope["type"] in ("http", "websocket") else None
+        if match is not None:
+            path = match.group(2) or "/"
+            headers = [(name, value) for name, value in scope["headers"] if name != b"x-tenant-id"]
+            headers.append((b"x-tenant-id", match.group(1).encode("latin-1")))
+            scope = {**scope, "path": path, "raw_path": path.encode("utf-8"), "headers": headers}
+        await self.app(scope, receive, send)
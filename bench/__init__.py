@@ -0,0 +1,18 @@
+"""Offline benchmarks and checks that never talk to OpenAI or Discord.
+
+Run a benchmark as a module from the repository root, e.g.
+``python -m bench.concurrency``.
+"""
+
+import os
+
+# The app builds its clients at import time; give them harmless defaults so
+# benchmarks run without real credentials or LangSmith uploads.
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("LANGCHAIN_TRACING_V2", "false")
+os.environ.pop("DISCORD_WEBHOOK_URL", None)
+# Bench traffic comes from one client; rate limits would throttle it.
+os.environ.setdefault("RATE_LIMIT_SESSION_PER_MINUTE", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_MINUTE", "0")
+# Nothing to pre-connect to offline.
+os.environ.setdefault("LLM_WARMUP_CONNECTIONS", "0")
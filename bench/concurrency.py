@@ -0,0 +1,63 @@
+"""Check that parallel chat sessions overlap instead of queueing.
+
+Every LLM call is replaced by a fake that sleeps ``--latency`` seconds, so a
+single turn (router + QA) costs about two latencies. If the graph is truly
+non-blocking, ``--sessions`` turns in parallel finish in roughly the same
+wall time as one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.fakes import install_fake_llms
+
+
+async def _run(sessions: int, latency: float) -> tuple[float, float]:
+    install_fake_llms(latency=latency)
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def turn(i: int) -> None:
+            response = await client.post(
+                "/chat", json={"session_id": f"s{i}", "message": "What do you sell?"}
+            )
+            response.raise_for_status()
+
+        start = time.perf_counter()
+        await turn(-1)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(turn(i) for i in range(sessions)))
+        parallel = time.perf_counter() - start
+    return single, parallel
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    single, parallel = asyncio.run(_run(args.sessions, args.latency))
+    print(f"1 session: {single:.3f}s  {args.sessions} sessions: {parallel:.3f}s")
+    if parallel > single * args.tolerance:
+        print("FAIL: parallel sessions are being serialized", file=sys.stderr)
+        return 1
+    print("OK: sessions run concurrently")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
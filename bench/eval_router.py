@@ -0,0 +1,94 @@
+"""Offline evaluation of the local pre-router against a reference router.
+
+Each input line is a transcript ``{"messages": [{"role", "content"}, ...],
+"label": "qa" | "lead_capture" | "off_topic"}``. The reference intent is the
+``label`` field, or with ``--reference llm`` the live LLM router (this needs
+a real ``OPENAI_API_KEY`` and costs one call per transcript).
+
+Reports how often the pre-router is confident enough to skip the LLM call
+and how often those confident guesses agree with the reference, and fails
+when that agreement is below ``--min-agreement``: a confident wrong guess
+skips the router, so a product question routed to lead capture stays there.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from app.config import settings
+from app.intent import classify_intent
+
+DEFAULT_DATA = Path(__file__).parent / "data" / "router_transcripts.jsonl"
+
+
+def _to_messages(raw: list[dict]) -> list[BaseMessage]:
+    return [
+        HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+        for m in raw
+    ]
+
+
+async def _llm_reference(messages: list[BaseMessage]) -> str:
+    from app.nodes import router
+
+    # Force the LLM path so the reference is independent of the pre-router.
+    threshold, settings.prerouter_threshold = settings.prerouter_threshold, 2.0
+    try:
+        return await router.route({"messages": messages, "lead_status": "none"})
+    finally:
+        settings.prerouter_threshold = threshold
+
+
+async def _evaluate(path: Path, reference: str, threshold: float) -> dict:
+    total = skipped = agreed = 0
+    confusion: Counter[tuple[str, str]] = Counter()
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        messages = _to_messages(record["messages"])
+        expected = record["label"] if reference == "label" else await _llm_reference(messages)
+        guess = classify_intent(str(messages[-1].content))
+        total += 1
+        if guess.confidence >= threshold:
+            skipped += 1
+            agreed += guess.intent == expected
+            confusion[(expected, guess.intent)] += 1
+    return {
+        "transcripts": total,
+        "threshold": threshold,
+        "skip_rate": skipped / total if total else 0.0,
+        "agreement_when_skipped": agreed / skipped if skipped else 1.0,
+        "confusion": {f"{e}->{g}": n for (e, g), n in sorted(confusion.items())},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("transcripts", nargs="?", type=Path, default=DEFAULT_DATA)
+    parser.add_argument("--reference", choices=("label", "llm"), default="label")
+    parser.add_argument("--threshold", type=float, default=settings.prerouter_threshold)
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="required agreement when skipped")
+    args = parser.parse_args()
+
+    report = asyncio.run(_evaluate(args.transcripts, args.reference, args.threshold))
+    print(json.dumps(report, indent=2))
+    if report["agreement_when_skipped"] < args.min_agreement:
+        wrong = {pair: n for pair, n in report["confusion"].items() if pair.split("->")[0] != pair.split("->")[1]}
+        print(f"FAIL: confident pre-router guesses disagree with the reference: {wrong}", file=sys.stderr)
+        return 1
+    print("OK: every guess confident enough to skip the router agrees with the reference")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
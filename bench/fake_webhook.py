@@ -0,0 +1,76 @@
+"""Local stand-in for a Discord webhook.
+
+Records every message it receives and can answer the first
+``rate_limit_first`` requests with 429 and ``fail_first`` more with 500.
+Like Discord, it rejects content over 2000 characters with 400.
+Use it in-process through ``httpx.ASGITransport(app=build_app(...))`` or
+run it as a real server: ``python -m bench.fake_webhook --port 9999``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class WebhookRecorder:
+    rate_limit_first: int = 0
+    fail_first: int = 0
+    retry_after: float = 0.05
+    latency: float = 0.0
+    requests: int = 0
+    messages: list[str] = field(default_factory=list)
+
+
+def build_app(recorder: WebhookRecorder) -> FastAPI:
+    app = FastAPI(title="Fake Discord webhook")
+
+    @app.post("/webhook")
+    async def webhook(request: Request) -> Any:
+        recorder.requests += 1
+        if recorder.latency:
+            await asyncio.sleep(recorder.latency)
+        if recorder.rate_limit_first > 0:
+            recorder.rate_limit_first -= 1
+            return JSONResponse(
+                {"message": "You are being rate limited.", "retry_after": recorder.retry_after},
+                status_code=429,
+                headers={"Retry-After": str(recorder.retry_after)},
+            )
+        if recorder.fail_first > 0:
+            recorder.fail_first -= 1
+            return JSONResponse({"message": "boom"}, status_code=500)
+        payload = await request.json()
+        if len(payload.get("content", "")) > 2000:
+            return JSONResponse({"content": ["Must be 2000 or fewer in length."]}, status_code=400)
+        recorder.messages.append(payload.get("content", ""))
+        return JSONResponse(None, status_code=204)
+
+    @app.get("/messages")
+    async def messages() -> list[str]:
+        return recorder.messages
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--rate-limit-first", type=int, default=0)
+    parser.add_argument("--fail-first", type=int, default=0)
+    args = parser.parse_args()
+
+    recorder = WebhookRecorder(rate_limit_first=args.rate_limit_first, fail_first=args.fail_first)
+    uvicorn.run(build_app(recorder), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+DEFAULT_TOOL_ARGS: dict[str, dict[str, Any]] = {
+    "route_intent": {"intent": "qa", "reason": "fake"},
+    "lead_flow": {
+        "reply": "Happy to help. What's the best email to reach you?",
+        "intent": "gather",
+    },
+    "respond": {"intent": "qa", "reason": "fake", "answer": "This is a canned answer from the fake model."},
+}
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ``ChatOpenAI`` with configurable latency.
+
+    Plain calls answer with ``reply``, or ``reply(messages)`` when it is
+    callable. When bound to a tool with
+    ``tool_choice``, the model answers with a tool call whose arguments come
+    from ``tool_responder(messages, tool_name)`` if set, else from
+    ``tool_args``, so router and lead capture flows can be exercised.
+    ``latency_jitter`` spreads each call's latency deterministically by up
+    to that fraction either side of ``latency``; with ``slow_every`` set,
+    every that many calls takes ``slow_factor`` times longer. Calls to a
+    model named in ``fail_models`` raise, to exercise fallbacks.
+
+    Usage metadata imitates OpenAI's prompt caching: once a prompt reaches
+    ``cache_min_chars``, prefixes seen before (in ``cache_step_chars``
+    steps) are reported as ``cache_read`` tokens.
+    """
+
+    model_name: str = "fake"
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    slow_every: int = 0
+    slow_factor: float = 10.0
+    fail_models: set[str] = set()
+    tool_responder: Callable[[list[BaseMessage], str], dict[str, Any]] | None = None
+    reply: str | Callable[[list[BaseMessage]], str] = "This is a canned answer from the fake model."
+    tool_args: dict[str, dict[str, Any]] = DEFAULT_TOOL_ARGS
+    calls: int = 0
+    # Prompt size of every call, in characters, for prompt-growth checks.
+    prompt_chars: list[int] = []
+    # With record_prompts, every call's (tool_choice, messages).
+    record_prompts: bool = False
+    prompts: list[tuple[str | None, list[BaseMessage]]] = []
+    # About 1024 and 128 tokens, like the provider's cache granularity.
+    cache_min_chars: int = 4096
+    cache_step_chars: int = 512
+    prefix_cache: set[int] = set()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: str | None = None, **kwargs: Any):
+        return self.bind(tool_choice=tool_choice, **kwargs)
+
+    def _delay(self) -> float:
+        # Low-discrepancy spread in [-1, 1) keeps runs reproducible.
+        spread = ((self.calls * 0.618034) % 1.0) * 2 - 1
+        delay = max(self.latency * (1 + self.latency_jitter * spread), 0.0)
+        self.calls += 1
+        if self.slow_every and self.calls % self.slow_every == 0:
+            delay *= self.slow_factor
+        return delay
+
+    def _cached_chars(self, messages: list[BaseMessage], tool_choice: str | None) -> int:
+        text = f"{tool_choice}\x1d" + "\x1e".join(f"{m.type}:{m.content}" for m in messages)
+        cached = 0
+        for end in range(self.cache_min_chars, len(text) + 1, self.cache_step_chars):
+            key = hash(text[:end])
+            if key in self.prefix_cache:
+                cached = end
+            else:
+                self.prefix_cache.add(key)
+        return cached
+
+    def _respond(self, messages: list[BaseMessage], tool_choice: str | None) -> AIMessage:
+        if self.model_name in self.fail_models:
+            raise RuntimeError(f"{self.model_name} is unavailable")
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        self.prompt_chars.append(prompt_chars)
+        if self.record_prompts:
+            self.prompts.append((tool_choice, list(messages)))
+        cached_chars = min(self._cached_chars(messages, tool_choice), prompt_chars)
+        if tool_choice:
+            if self.tool_responder is not None:
+                args = self.tool_responder(messages, tool_choice)
+            else:
+                args = dict(self.tool_args.get(tool_choice, {}))
+            content = ""
+            tool_calls = [{"name": tool_choice, "args": args, "id": f"call_{self.calls}"}]
+            completion_chars = len(json.dumps(args))
+        else:
+            content = self.reply(messages) if callable(self.reply) else self.reply
+            tool_calls = []
+            completion_chars = len(content)
+        # Roughly 4 characters per token, like the real tokenizer on English.
+        usage = {
+            "input_tokens": prompt_chars // 4 + 1,
+            "output_tokens": completion_chars // 4 + 1,
+            "total_tokens": (prompt_chars + completion_chars) // 4 + 2,
+            "input_token_details": {"cache_read": cached_chars // 4},
+        }
+        return AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._delay())
+        message = self._respond(messages, kwargs.get("tool_choice"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        message = self._respond(messages, kwargs.get("tool_choice"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._delay())
+        for chunk in self._chunks(messages, kwargs.get("tool_choice")):
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._delay())
+        for chunk in self._chunks(messages, kwargs.get("tool_choice")):
+            if run_manager and isinstance(chunk.message.content, str):
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    def _chunks(
+        self, messages: list[BaseMessage], tool_choice: str | None
+    ) -> Iterator[ChatGenerationChunk]:
+        message = self._respond(messages, tool_choice)
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {
+                            "name": call["name"],
+                            "args": json.dumps(call["args"]),
+                            "id": call["id"],
+                            "index": 0,
+                        }
+                    ],
+                )
+            )
+            return
+        words = str(message.content).split(" ")
+        for i, word in enumerate(words):
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content=word if i == 0 else " " + word)
+            )
+
+
+def install_fake_llms(latency: float = 0.0, **overrides: Any) -> FakeChatModel:
+    """Swap every node's chat model for one shared ``FakeChatModel``."""
+    from app.nodes import fused, lead_capture, memory, qa, router
+
+    model = FakeChatModel(latency=latency, **overrides)
+    router.router_llm = model.bind_tools(router.ROUTER_TOOL, tool_choice="route_intent")
+    qa.llm = model
+    memory.summary_llm = model
+    lead_capture.reply_llm = model.bind_tools(
+        lead_capture.LEAD_FLOW_TOOL, tool_choice="lead_flow"
+    )
+    fused.fused_llm = model.bind_tools(fused.FUSED_TOOL, tool_choice="respond")
+    return model
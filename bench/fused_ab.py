@@ -0,0 +1,171 @@
+"""A/B replay of the routed graph against the fused single-call graph.
+
+Replays the same recorded sessions (``app.batch.parse_batch`` format)
+through ``run_turn`` twice, once with ``FUSED_ROUTING_SHARE=0`` and once
+with ``1``, and compares per-turn latency, LLM calls and tokens per turn,
+and how often both arms routed a turn the same way. ``--no-prerouter``
+sends every turn to the LLM, which isolates the calls fusing replaces.
+
+With ``--fake`` the offline fake model answers; its tool responses pick
+the intent from the user's last message with one keyword rule for both
+arms, so disagreements come from the graphs, not the model. Without it a
+real ``OPENAI_API_KEY`` is needed and every turn costs real calls.
+
+    python -m bench.fused_ab --fake --no-prerouter
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import re
+import statistics
+import sys
+from pathlib import Path
+from typing import Any
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from langchain_core.messages import BaseMessage
+
+from bench.fakes import install_fake_llms
+from bench.loadtest import percentile, scenario_responder
+
+DATA = Path(__file__).parent / "data"
+DEFAULT_INPUTS = [DATA / "router_transcripts.jsonl", DATA / "replay_sessions.jsonl"]
+
+_LEAD_RE = re.compile(r"demo|contact|sales|reach out|price|pricing|cost|quote|buy|@", re.I)
+_OFF_TOPIC_RE = re.compile(r"weather|joke|poem|football|^hi$", re.I)
+
+
+def _intent_of(messages: list[BaseMessage]) -> str:
+    text = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+    if _LEAD_RE.search(text):
+        return "lead_capture"
+    if _OFF_TOPIC_RE.search(text.strip()):
+        return "off_topic"
+    return "qa"
+
+
+def ab_responder(messages: list[BaseMessage], tool: str) -> dict[str, Any]:
+    if tool == "route_intent":
+        return {"intent": _intent_of(messages), "reason": "scripted"}
+    if tool == "respond":
+        intent = _intent_of(messages)
+        if intent == "lead_capture":
+            return {
+                "intent": intent,
+                "reason": "scripted",
+                "reply": "Happy to set that up. What's your name and email?",
+                "lead_intent": "gather",
+            }
+        return {"intent": intent, "reason": "scripted", "answer": "This is a canned answer from the fake model."}
+    return scenario_responder(messages, tool)
+
+
+async def _run_arm(sessions: list, share: float, concurrency: int) -> dict[str, Any]:
+    from app.batch import replay
+    from app.config import settings
+    from app.main import SESSIONS, run_turn
+    from app.tenants import default_tenant
+    from app.metrics import LLM_LATENCY, LLM_TOKENS
+
+    settings.fused_routing_share = share
+    calls = LLM_LATENCY.count()
+    prompt = LLM_TOKENS.total(kind="prompt")
+    completion = LLM_TOKENS.total(kind="completion")
+    async def forget(session_id: str) -> None:
+        await SESSIONS.delete(default_tenant().session_key(session_id))
+
+    results = [
+        result
+        async for result in replay(
+            sessions, run_turn, concurrency=concurrency, namespace=f"ab{share}:", forget=forget
+        )
+    ]
+    return {
+        "results": {(r["session_id"], r["turn"]): r for r in results},
+        "calls": LLM_LATENCY.count() - calls,
+        "prompt_tokens": LLM_TOKENS.total(kind="prompt") - prompt,
+        "completion_tokens": LLM_TOKENS.total(kind="completion") - completion,
+    }
+
+
+def _report(name: str, arm: dict[str, Any]) -> None:
+    results = arm["results"].values()
+    turns = len(results)
+    latencies = [r["latency_ms"] for r in results]
+    errors = sum(1 for r in results if "error" in r)
+    print(
+        f"{name:>7}: {turns} turns  p50={statistics.median(latencies):6.0f}ms  "
+        f"p95={percentile(latencies, 95):6.0f}ms  mean={statistics.fmean(latencies):6.0f}ms  "
+        f"calls/turn={arm['calls'] / turns:.2f}  "
+        f"tokens/turn={arm['prompt_tokens'] / turns:.0f} in + {arm['completion_tokens'] / turns:.0f} out  "
+        f"errors={errors}"
+    )
+
+
+async def _run(args: argparse.Namespace) -> list[str]:
+    from app.batch import parse_batch
+    from app.config import settings
+
+    if args.fake:
+        install_fake_llms(latency=args.latency, tool_responder=ab_responder)
+    if args.no_prerouter:
+        settings.prerouter_threshold = 2.0
+    text = "\n".join(path.read_text(encoding="utf-8") for path in args.inputs)
+    sessions = parse_batch(text, max_turns=settings.batch_max_turns)
+
+    routed = await _run_arm(sessions, 0.0, args.concurrency)
+    fused = await _run_arm(sessions, 1.0, args.concurrency)
+    _report("routed", routed)
+    _report("fused", fused)
+
+    agree = 0
+    disagreements: list[str] = []
+    for key, before in routed["results"].items():
+        after = fused["results"][key]
+        if before["route"] == after["route"]:
+            agree += 1
+        else:
+            disagreements.append(f"{key[0]} turn {key[1]}: routed={before['route']} fused={after['route']}")
+    total = len(routed["results"])
+    print(f"routing agreement: {agree}/{total} ({agree / total:.0%})")
+    for line in disagreements[:10]:
+        print(f"  {line}")
+
+    failures = []
+    for name, arm in (("routed", routed), ("fused", fused)):
+        failures.extend(
+            f"{name}: {r['session_id']} turn {r['turn']}: {r['error']}"
+            for r in arm["results"].values()
+            if "error" in r
+        )
+    if agree / total < args.min_agreement:
+        failures.append(f"routing agreement {agree / total:.0%} is below {args.min_agreement:.0%}")
+    if fused["calls"] >= routed["calls"]:
+        failures.append(f"fused made {fused['calls']} LLM calls, routed {routed['calls']}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", type=Path, nargs="*", default=DEFAULT_INPUTS, help="JSONL sessions")
+    parser.add_argument("--fake", action="store_true", help="answer with the offline fake model")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--no-prerouter", action="store_true", help="send every turn to the LLM")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions replayed at once")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="share of turns routed the same way")
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: the fused graph makes fewer LLM calls and routes like the routed graph")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+"""Compare memory per session: LangChain message lists vs compact history.
+
+Builds ``--sessions`` conversations of ``--turns`` turns twice: once as
+the lists of ``HumanMessage``/``AIMessage`` objects sessions used to hold
+(with the ids and response metadata a real model call attaches), once as
+``History`` entries. Reports traced bytes per session, serialized bytes
+per session, and the cost of appending one turn to a long conversation.
+
+    python -m bench.history_memory --sessions 2000 --turns 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, messages_to_dict
+
+from app.history import History, Message
+from app.sessions import dump_state
+
+
+def _question(i: int, t: int) -> str:
+    return f"Session {i} question {t}: how does pricing work for a team of {t + 5} people?"
+
+
+def _answer(i: int, t: int) -> str:
+    return f"Answer {t}: pricing depends on seats and usage tier; teams of {t + 5} start on Growth."
+
+
+def _legacy(i: int, turns: int) -> list[BaseMessage]:
+    messages: list[BaseMessage] = []
+    for t in range(turns):
+        # add_messages gave every message an id; model replies carry metadata.
+        messages.append(HumanMessage(content=_question(i, t), id=str(uuid.uuid4())))
+        messages.append(
+            AIMessage(
+                content=_answer(i, t),
+                id=f"run-{uuid.uuid4()}-0",
+                response_metadata={
+                    "token_usage": {"completion_tokens": 24, "prompt_tokens": 900, "total_tokens": 924},
+                    "model_name": "gpt-4o-mini-2024-07-18",
+                    "system_fingerprint": "fp_0123456789",
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                },
+                usage_metadata={"input_tokens": 900, "output_tokens": 24, "total_tokens": 924},
+            )
+        )
+    return messages
+
+
+def _compact(i: int, turns: int) -> History:
+    messages: list[Message] = []
+    for t in range(turns):
+        messages.append(Message("human", _question(i, t)))
+        messages.append(Message("ai", _answer(i, t)))
+    return History(messages)
+
+
+def _traced_bytes(build: Callable[[int], Any], sessions: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    kept = [build(i) for i in range(sessions)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current / sessions
+
+
+def _append_seconds(turns: int, rounds: int) -> tuple[float, float]:
+    legacy: list[BaseMessage] = _legacy(0, turns)
+    compact = _compact(0, turns)
+    start = time.perf_counter()
+    for r in range(rounds):
+        legacy = legacy + [HumanMessage(content=f"follow-up {r}")]
+    legacy_seconds = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for r in range(rounds):
+        compact = compact.appended([Message("human", f"follow-up {r}")])
+    return legacy_seconds, (time.perf_counter() - start) / rounds
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--max-ratio", type=float, default=0.5, help="compact/legacy bytes must stay below this")
+    args = parser.parse_args()
+
+    legacy_bytes = _traced_bytes(lambda i: _legacy(i, args.turns), args.sessions)
+    compact_bytes = _traced_bytes(lambda i: _compact(i, args.turns), args.sessions)
+    legacy_wire = len(
+        json.dumps(messages_to_dict(_legacy(0, args.turns)), separators=(",", ":")).encode("utf-8")
+    )
+    compact_wire = len(dump_state({"messages": _compact(0, args.turns)}))
+    legacy_append, compact_append = _append_seconds(turns=500, rounds=200)
+
+    print(f"in memory:  legacy {legacy_bytes:9.0f} B/session  compact {compact_bytes:9.0f} B/session")
+    print(f"serialized: legacy {legacy_wire:9d} B/session  compact {compact_wire:9d} B/session")
+    print(f"append at 1000 messages: legacy {legacy_append * 1e6:.1f}us  compact {compact_append * 1e6:.1f}us")
+
+    ratio = compact_bytes / legacy_bytes
+    if ratio > args.max_ratio:
+        print(f"FAIL: compact history uses {ratio:.0%} of the legacy footprint", file=sys.stderr)
+        return 1
+    if compact_append > legacy_append:
+        print("FAIL: appending to compact history is slower than copying the list", file=sys.stderr)
+        return 1
+    print(f"OK: compact history uses {ratio:.0%} of the legacy footprint per session")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
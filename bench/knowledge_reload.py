@@ -0,0 +1,115 @@
+"""Check knowledge hot reload: cost, atomic swap and the version endpoint.
+
+Generates ``--files`` knowledge documents in a temporary folder and checks:
+
+* after editing one file, a reload costs a fraction of a cold build;
+* a request holding the old index keeps searching the old content while
+  new requests see the edit;
+* the background watcher picks up an edit within a few polls, and
+  ``GET /knowledge`` reports the new version and content hash.
+
+    python -m bench.knowledge_reload --files 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+POLL_SECONDS = 0.05
+
+
+def _document(i: int, revision: int) -> str:
+    sections = "\n\n".join(
+        f"## Topic {i}-{s}\n\n" + f"Feature {i} section {s} explains setup, billing and limits. " * 12
+        for s in range(6)
+    )
+    return f"# Document {i}\n\nRevision {revision} marker rev{i}x{revision}.\n\n{sections}\n"
+
+
+def _write_docs(folder: Path, files: int) -> None:
+    for i in range(files):
+        (folder / f"doc{i:04d}.md").write_text(_document(i, 0), encoding="utf-8")
+
+
+async def _run(args: argparse.Namespace, root: Path) -> list[str]:
+    docs = root / "knowledge"
+    docs.mkdir()
+    _write_docs(docs, args.files)
+    os.environ["KNOWLEDGE_DIR"] = str(docs)
+    os.environ["KNOWLEDGE_INDEX_DIR"] = str(root / "index")
+    os.environ["KNOWLEDGE_POLL_SECONDS"] = str(POLL_SECONDS)
+
+    from app.knowledge import get_knowledge, retrieve_knowledge
+    from app.main import app
+    from app.retrieval import build_index
+
+    knowledge = get_knowledge()
+
+    start = time.perf_counter()
+    build_index(docs, root / "cold", chunk_chars=knowledge.chunk_chars)
+    cold = time.perf_counter() - start
+
+    failures: list[str] = []
+    old_index = knowledge.index
+    (docs / "doc0007.md").write_text(_document(7, 1), encoding="utf-8")
+    start = time.perf_counter()
+    changed = await knowledge.refresh()
+    reload = time.perf_counter() - start
+    print(f"{args.files} files: cold build {cold * 1000:.0f}ms, reload after one edit {reload * 1000:.0f}ms")
+    if not changed:
+        failures.append("editing a file did not change the index")
+    if reload > cold * args.max_ratio:
+        failures.append(f"reload took {reload / cold:.0%} of a cold build (limit {args.max_ratio:.0%})")
+
+    old_hits = [c.text for c in retrieve_knowledge("rev7x0", k=1, index=old_index)]
+    new_hits = [c.text for c in retrieve_knowledge("rev7x1", k=1)]
+    if not old_hits or "rev7x0" not in old_hits[0]:
+        failures.append("the old index lost its content after the swap")
+    if not new_hits or "rev7x1" not in new_hits[0]:
+        failures.append("the new index does not contain the edit")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        before = (await client.get("/knowledge")).json()
+        knowledge.start()
+        (docs / "doc0042.md").write_text(_document(42, 1), encoding="utf-8")
+        deadline = time.monotonic() + 50 * POLL_SECONDS + cold * 2
+        after = before
+        while time.monotonic() < deadline and after["version"] == before["version"]:
+            await asyncio.sleep(POLL_SECONDS)
+            after = (await client.get("/knowledge")).json()
+        await knowledge.stop()
+    print(f"watcher: version {before['version']} -> {after['version']}, hash {after['content_hash'][:12]}")
+    if after["version"] <= before["version"] or after["content_hash"] == before["content_hash"]:
+        failures.append("the watcher did not pick up an edit")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--max-ratio", type=float, default=0.5, help="reload/cold build time must stay below this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        failures = asyncio.run(_run(args, Path(root)))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: knowledge reloads incrementally and swaps atomically")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,190 @@
+"""Check cross-session lead deduplication and time index lookups at scale.
+
+First, one visitor submits the same lead from three sessions through two
+outbox connections (as two workers would), with different email case and
+phone formatting, plus an unrelated lead and the same visitor on another
+tenant's webhook. The outbox is drained through the fake webhook, then the
+visitor submits once more unchanged and once with a new company. Last, a
+new visitor's first post fails, and they resubmit with a phone number
+while the lead waits to retry. Expected: one enriched post per visitor and
+webhook, no post for the unchanged repeat, one update post for the new
+company, a single post for the retried lead carrying the phone number, and
+matching ``chatbot_lead_dedup_total`` counts.
+
+Then the lead index is filled with ``--history`` past leads and enqueue
+latency is timed for new leads and for repeats of past ones; it should not
+grow with the size of the index.
+
+    python -m bench.lead_dedup --history 10000,1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from app.config import settings
+from app.integrations.outbox import LeadOutbox, OutboxWorker, lead_keys
+from app.metrics import LEAD_DEDUP
+from app.state import new_lead
+from bench.fake_webhook import WebhookRecorder, build_app
+from bench.loadtest import percentile
+
+WINDOW_SECONDS = 3600.0
+WEBHOOK = "http://webhook/webhook"
+OTHER_TENANT_WEBHOOK = "http://webhook/webhook?tenant=other"
+
+
+async def _drain(outbox: LeadOutbox, worker: OutboxWorker) -> None:
+    while await worker.deliver_once() is not None:
+        pass
+
+
+async def _dedup(tmp: str) -> list[str]:
+    settings.discord_webhook_url = WEBHOOK
+    path = os.path.join(tmp, "dedup.sqlite3")
+    # Two connections to one file, like two worker processes.
+    first = LeadOutbox(path, dedup_window_seconds=WINDOW_SECONDS)
+    second = LeadOutbox(path, dedup_window_seconds=WINDOW_SECONDS)
+    before = {outcome: LEAD_DEDUP.value(outcome=outcome) for outcome in ("merged", "update", "suppressed")}
+
+    sam = {"name": "Sam", "email": "Sam@Example.com"}
+    await first.enqueue(new_lead(sam, message="I'd like a demo."))
+    await second.enqueue(new_lead({"email": " sam@example.com", "phone": "+1 (555) 010-2030"}, "Pricing?"))
+    await first.enqueue(new_lead({"name": "Sam Lee", "email": "sam@example.com", "phone": "555 010 2030"}, "demo"))
+    await second.enqueue(new_lead({"name": "Dana", "email": "dana@example.com"}, message="Call me."))
+    await first.enqueue(new_lead(sam, message="I'd like a demo."), webhook_url=OTHER_TENANT_WEBHOOK)
+
+    recorder = WebhookRecorder()
+    transport = httpx.ASGITransport(app=build_app(recorder))
+    async with httpx.AsyncClient(transport=transport) as client:
+        worker = OutboxWorker(first, client=client, batch_size=1)
+        await _drain(first, worker)
+        delivered = list(recorder.messages)
+
+        await second.enqueue(new_lead({"name": "Sam Lee", "email": "SAM@example.com"}, message="demo"))
+        await first.enqueue(new_lead({"email": "sam@example.com", "company": "Acme"}, message=""))
+        await _drain(first, worker)
+        updates = recorder.messages[len(delivered) :]
+
+        recorder.fail_first = 1
+        row_id = await first.enqueue(new_lead({"name": "Kim", "email": "kim@example.com"}, message="Quote?"))
+        await _drain(first, worker)
+        await second.enqueue(new_lead({"email": "kim@example.com", "phone": "555 010 9999"}, message=""))
+        # Skip the rest of the backoff.
+        first._conn.execute("UPDATE outbox SET next_attempt = 0 WHERE id = ?", (row_id,))
+        await _drain(first, worker)
+        retried = recorder.messages[len(delivered) + len(updates) :]
+
+    counts = {outcome: LEAD_DEDUP.value(outcome=outcome) - before[outcome] for outcome in before}
+    print(
+        f"first drain: {len(delivered)} posts; after two repeats: {len(updates)} more; "
+        f"after a retried lead and its repeat: {len(retried)} more; dedup={counts}"
+    )
+
+    failures = []
+    sams = [m for m in delivered if "sam@example.com" in m.lower()]
+    if len(delivered) != 3 or len(sams) != 2:
+        failures.append(f"expected one post per visitor and webhook, got {len(delivered)}: {delivered}")
+    elif not any("Sam Lee" in m and "010-2030" in m and "Pricing?" in m for m in sams):
+        failures.append(f"the merged lead lost details: {sams}")
+    if len(updates) != 1 or "**Webchat lead update**" not in updates[0] or "Acme" not in updates[0]:
+        failures.append(f"expected one update post with the new company, got {updates}")
+    if len(retried) != 1 or "010 9999" not in retried[0] or "**Webchat lead update**" in retried[0]:
+        failures.append(f"expected the retried lead posted once with the phone number, got {retried}")
+    if counts != {"merged": 3, "update": 1, "suppressed": 1}:
+        failures.append(f"unexpected dedup counts {counts}")
+    return failures
+
+
+def _fill(outbox: LeadOutbox, history: int) -> None:
+    """Add ``history`` delivered past leads and their index entries directly."""
+    now = time.time()
+    conn = outbox._conn
+    conn.execute("BEGIN")
+    start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM outbox").fetchone()[0]
+    outbox_rows, index_rows = [], []
+    for i in range(start, start + history):
+        lead = {"name": f"Lead {i}", "email": f"lead{i}@example.com", "phone": f"555{i:07d}", "message": "hi"}
+        outbox_rows.append((i + 1, json.dumps(lead), now, now))
+        index_rows.extend((key, i + 1, now) for key in lead_keys(lead))
+    conn.executemany(
+        "INSERT INTO outbox (id, payload, status, next_attempt, created) VALUES (?, ?, 'delivered', ?, ?)",
+        outbox_rows,
+    )
+    conn.executemany("INSERT OR REPLACE INTO lead_index (key, outbox_id, seen) VALUES (?, ?, ?)", index_rows)
+    conn.execute("COMMIT")
+    # Checkpoint the bulk insert now rather than inside the timed enqueues.
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def _timed(outbox: LeadOutbox, leads: list[dict[str, str]]) -> list[float]:
+    timings = []
+    for lead in leads:
+        start = time.perf_counter()
+        await outbox.enqueue(lead)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def _scale(tmp: str, sizes: list[int], samples: int) -> dict[int, tuple[list[float], list[float]]]:
+    outbox = LeadOutbox(os.path.join(tmp, "scale.sqlite3"), dedup_window_seconds=WINDOW_SECONDS)
+    results = {}
+    filled = 0
+    for size in sizes:
+        start = time.perf_counter()
+        _fill(outbox, size - filled)
+        filled = size
+        fresh = [new_lead({"name": "New", "email": f"new-{size}-{i}@example.com"}, "hi") for i in range(samples)]
+        step = max(size // samples, 1)
+        repeats = [
+            {"name": f"Lead {i}", "email": f"LEAD{i}@example.com", "phone": f"555{i:07d}", "message": "hi"}
+            for i in range(0, size, step)
+        ][:samples]
+        results[size] = (await _timed(outbox, fresh), await _timed(outbox, repeats))
+        new, repeat = results[size]
+        print(
+            f"{size:>9} past leads (filled in {time.perf_counter() - start:.1f}s): "
+            f"new lead p50={statistics.median(new):.3f}ms p99={percentile(new, 99):.3f}ms, "
+            f"repeat p50={statistics.median(repeat):.3f}ms p99={percentile(repeat, 99):.3f}ms"
+        )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", default="10000,250000", help="comma-separated index sizes")
+    parser.add_argument("--samples", type=int, default=500, help="timed enqueues per kind and size")
+    parser.add_argument("--max-slowdown", type=float, default=2.0, help="allowed p50 ratio, largest/smallest")
+    args = parser.parse_args()
+    sizes = sorted({int(n) for n in args.history.split(",")})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = asyncio.run(_dedup(tmp))
+        results = asyncio.run(_scale(tmp, sizes, args.samples))
+    small, large = results[sizes[0]], results[sizes[-1]]
+    for kind, index in (("new lead", 0), ("repeat", 1)):
+        ratio = statistics.median(large[index]) / statistics.median(small[index])
+        if ratio > args.max_slowdown:
+            failures.append(f"{kind} enqueue p50 is x{ratio:.2f} slower with {sizes[-1]} past leads")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: repeat leads are coalesced across sessions and lookups stay flat as the index grows")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
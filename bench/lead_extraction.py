@@ -0,0 +1,81 @@
+"""Check the local contact extraction used by lead capture.
+
+Each case is a user message and the fields the extractor should fill
+confidently, or ``None`` when the turn is ambiguous and must go to the
+LLM. Reports the share of turns handled without the LLM and fails on any
+confident extraction that disagrees with the expected fields.
+
+    python -m bench.lead_extraction
+"""
+
+from __future__ import annotations
+
+import sys
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from app.extraction import extract_contact
+
+CONFIRM = {"confirmed": "yes"}
+
+CASES: list[tuple[str, dict[str, str] | None]] = [
+    ("sam@example.com", {"email": "sam@example.com"}),
+    ("Sure, I'm Sam, sam@example.com", {"name": "Sam", "email": "sam@example.com"}),
+    ("my name is jane doe", {"name": "Jane Doe"}),
+    ("Jane.Doe@Acme.io", {"email": "jane.doe@acme.io"}),
+    ("you can reach me at +1 (415) 555-0100", {"phone": "+14155550100"}),
+    ("It's 555-123-4567", {"phone": "5551234567"}),
+    ("email: ops@acme.co.uk, phone 0044 20 7946 0958", {"email": "ops@acme.co.uk", "phone": "+442079460958"}),
+    ("This is Priya Patel, priya@example.org", None),
+    ("call me Alex", {"name": "Alex"}),
+    ("Yes, send it", CONFIRM),
+    ("yes please", CONFIRM),
+    ("go ahead", CONFIRM),
+    ("Sure, please do. Thanks!", CONFIRM),
+    ("Looks good, thanks!", None),
+    ("thanks", None),
+    ("thank you", None),
+    ("ok", None),
+    ("okay!", None),
+    ("correct", None),
+    ("that's right", None),
+    ("I'm interested in pricing", None),
+    ("my email is jane@acme.io but what's your pricing?", None),
+    ("this is great", None),
+    ("no, wait, use my work email", None),
+    ("I'm Sam and I work at Acme", None),
+    ("Can I book a demo?", None),
+    ("Actually send it to my colleague instead", None),
+    ("Jane", None),
+    ("we have 120 seats, is that enough?", None),
+    ("call me tomorrow", None),
+    ("you can call me anytime", None),
+    ("call me back please", None),
+    ("Call me later", None),
+    ("This is Acme Corp", None),
+    ("I am Sales", None),
+]
+
+
+def main() -> None:
+    local = wrong = 0
+    for text, expected in CASES:
+        extraction = extract_contact(text)
+        got: dict[str, str] | None = None
+        if extraction.confident:
+            local += 1
+            got = CONFIRM if extraction.confirmed else extraction.fields
+        if got is not None and got != expected:
+            wrong += 1
+            print(f"WRONG  {text!r}: got {got}, expected {expected}")
+        elif got is None and expected is not None:
+            print(f"MISSED {text!r}: expected {expected}")
+
+    print(f"cases: {len(CASES)}  llm-free: {local} ({local / len(CASES):.0%})  wrong: {wrong}")
+    if wrong:
+        sys.exit(1)
+    print("OK: no incorrect confident extractions")
+
+
+if __name__ == "__main__":
+    main()
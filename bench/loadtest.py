@@ -0,0 +1,288 @@
+"""In-process load test of ``/chat`` with a fake LLM and a fake webhook.
+
+Every ``ChatOpenAI`` instance is swapped for ``FakeChatModel`` with the
+configured latency, and Discord for the local fake webhook. Virtual users
+then drive ``/chat`` through multi-turn scripts:
+
+* ``qa``: three product questions;
+* ``lead``: a full lead capture ending in a delivered lead;
+* ``mixed``: 70% ``qa`` and 30% ``lead`` users.
+
+For each concurrency level it reports p50/p95/p99 latency, requests/s,
+event-loop lag and RSS, and writes the results as JSON. Pass
+``--compare`` with an earlier results file to print the deltas.
+
+    python -m bench.loadtest --scenario mixed --users 10,50,200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+from langchain_core.messages import BaseMessage
+
+from bench.fakes import install_fake_llms
+
+QA_QUESTIONS = [
+    "What does the product do?",
+    "Which integrations do you support?",
+    "Is there an API?",
+    "Where is my data stored?",
+    "Do you support single sign-on?",
+    "Can I export reports?",
+    "Do you have a mobile app?",
+    "Which languages are supported?",
+    "How do I reset my password?",
+    "Is it GDPR compliant?",
+    "What are your support hours?",
+    "Can I invite my whole team?",
+]
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_USER_SAID_RE = re.compile(r"User said: (['\"])(.*?)\1", re.S)
+
+
+def scenario_responder(messages: list[BaseMessage], tool: str) -> dict[str, Any]:
+    """Tool-call answers that walk a lead capture script to completion."""
+    last = str(messages[-1].content) if messages else ""
+    if tool == "route_intent":
+        wants_lead = re.search(r"demo|contact|sales|@", last, re.I)
+        return {"intent": "lead_capture" if wants_lead else "qa", "reason": "scripted"}
+
+    said = _USER_SAID_RE.search(last)
+    text = said.group(2) if said else last
+    email = _EMAIL_RE.search(text)
+    if email:
+        return {
+            "reply": "Thanks! Shall I pass this along to the team?",
+            "intent": "review",
+            "fields": {"email": email.group(0), "name": "Load Tester"},
+            "advance_to_review": True,
+        }
+    if text.lower().startswith("yes"):
+        return {"reply": "Sending it now.", "intent": "send", "advance_to_send": True}
+    return {"reply": "Happy to set that up. What's your name and email?", "intent": "gather"}
+
+
+def script_for(scenario: str, user: int) -> list[str]:
+    qa = [QA_QUESTIONS[(user + turn) % len(QA_QUESTIONS)] for turn in range(3)]
+    lead = [
+        "Can I book a demo?",
+        f"Sure, I'm Sam, sam{user}@example.com",
+        "Yes, send it",
+    ]
+    if scenario == "qa":
+        return qa
+    if scenario == "lead":
+        return lead
+    return lead if user % 10 < 3 else qa
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a 10 ms sleeper."""
+
+    INTERVAL = 0.01
+
+    def __init__(self) -> None:
+        self.samples: list[float] = []
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.INTERVAL)
+            self.samples.append(max(time.perf_counter() - start - self.INTERVAL, 0.0))
+
+    def __enter__(self) -> "LoopLagMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+async def run_level(client: httpx.AsyncClient, scenario: str, users: int, level: int) -> dict[str, Any]:
+    latencies: list[float] = []
+    errors = 0
+
+    async def user(index: int) -> None:
+        nonlocal errors
+        session_id = f"{scenario}-{level}-{index}"
+        for message in script_for(scenario, index):
+            start = time.perf_counter()
+            try:
+                response = await client.post("/chat", json={"session_id": session_id, "message": message})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    rss_before = rss_bytes()
+    with LoopLagMonitor() as lag:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(users)))
+        elapsed = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    return {
+        "users": users,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "mean": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        },
+        "loop_lag_ms": {
+            "p99": round(percentile(lag.samples, 99) * 1000, 2),
+            "max": round(max(lag.samples, default=0.0) * 1000, 2),
+        },
+        "rss_mb": round(rss_after / 1e6, 1),
+        "rss_delta_per_session_kb": round((rss_after - rss_before) / users / 1e3, 2),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    model = install_fake_llms(
+        latency=args.latency,
+        latency_jitter=args.jitter,
+        tool_responder=scenario_responder,
+    )
+
+    from app.config import settings
+    from app.integrations.outbox import OutboxWorker, get_outbox
+
+    settings.qa_cache_enabled = not args.no_cache
+    settings.discord_webhook_url = "http://webhook/webhook"
+    from app.main import app
+    from bench.fake_webhook import WebhookRecorder, build_app
+
+    recorder = WebhookRecorder(latency=args.webhook_latency)
+    levels: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Point the lead outbox at a throwaway file.
+        settings.outbox_db_path = os.path.join(tmp, "outbox.sqlite3")
+        get_outbox.cache_clear()
+        outbox = get_outbox()
+
+        webhook = httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app(recorder)))
+        worker = OutboxWorker(outbox, client=webhook, batch_size=10, poll_seconds=0.05)
+        worker.start()
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            for level, users in enumerate(args.users):
+                result = await run_level(client, args.scenario, users, level)
+                levels.append(result)
+                print(
+                    f"users={users:>5}  rps={result['requests_per_s']:>8}  "
+                    f"p50={result['latency_ms']['p50']:>7}ms  p95={result['latency_ms']['p95']:>7}ms  "
+                    f"p99={result['latency_ms']['p99']:>7}ms  lag_max={result['loop_lag_ms']['max']:>6}ms  "
+                    f"rss={result['rss_mb']}MB  errors={result['errors']}"
+                )
+
+        # Let the worker drain whatever the lead scripts queued.
+        deadline = time.monotonic() + 10
+        while (await outbox.counts()).get("pending") and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await worker.stop()
+        await webhook.aclose()
+        counts = await outbox.counts()
+
+    return {
+        "scenario": args.scenario,
+        "fake_latency_s": args.latency,
+        "jitter": args.jitter,
+        "qa_cache": not args.no_cache,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "llm_calls": model.calls,
+        "leads": {"outbox": counts, "webhook_messages": len(recorder.messages)},
+        "levels": levels,
+    }
+
+
+def compare(current: dict[str, Any], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    previous = {level["users"]: level for level in baseline.get("levels", [])}
+    print(f"\nvs {baseline_path}:")
+    for level in current["levels"]:
+        old = previous.get(level["users"])
+        if old is None:
+            continue
+        print(
+            f"users={level['users']:>5}  "
+            f"rps {old['requests_per_s']} -> {level['requests_per_s']}  "
+            f"p95 {old['latency_ms']['p95']} -> {level['latency_ms']['p95']}ms  "
+            f"rss {old['rss_mb']} -> {level['rss_mb']}MB"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=("qa", "lead", "mixed"), default="mixed")
+    parser.add_argument(
+        "--users",
+        type=lambda v: [int(x) for x in v.split(",")],
+        default=[10, 50, 200],
+        help="comma-separated concurrency levels",
+    )
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--webhook-latency", type=float, default=0.05)
+    parser.add_argument("--no-cache", action="store_true", help="disable the QA answer cache")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = args.output or Path("bench_results") / f"loadtest-{args.scenario}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"leads: {results['leads']}")
+    print(f"results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Check lead outbox delivery against the fake webhook.
+
+Queues ``--leads`` leads, one of them far over Discord's 2000-character
+limit, lets the worker drain them through a webhook that rate-limits and
+errors first, and verifies every lead arrives exactly once. Then backdates
+the delivered rows past their retention and checks the next delivery
+sweeps them out of the outbox.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from app.config import settings
+from app.integrations import outbox as outbox_module
+from app.integrations.outbox import LeadOutbox, OutboxWorker
+from app.state import new_lead
+from bench.fake_webhook import WebhookRecorder, build_app
+
+
+async def _run(leads: int, batch_size: int) -> tuple[WebhookRecorder, dict[str, int], float, dict[str, int]]:
+    recorder = WebhookRecorder(rate_limit_first=2, fail_first=1)
+    settings.discord_webhook_url = "http://webhook/webhook"
+    # Keep retries fast so the check finishes quickly.
+    outbox_module.BACKOFF_BASE_SECONDS = 0.01
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = LeadOutbox(os.path.join(tmp, "outbox.sqlite3"), retention_seconds=3600)
+        transport = httpx.ASGITransport(app=build_app(recorder))
+        async with httpx.AsyncClient(transport=transport) as client:
+            worker = OutboxWorker(outbox, client=client, batch_size=batch_size, poll_seconds=0.05)
+            worker.start()
+            start = time.perf_counter()
+            for i in range(leads):
+                profile = {"name": f"Lead {i}", "email": f"lead{i}@example.com"}
+                if i == 0:
+                    profile["company"] = "Acme " * 100
+                await outbox.enqueue(new_lead(profile, message="hello " * (1000 if i == 0 else 1)))
+            while (await outbox.counts()).get("pending"):
+                await asyncio.sleep(0.02)
+            elapsed = time.perf_counter() - start
+            counts = await outbox.counts()
+
+            outbox._conn.execute("UPDATE outbox SET created = created - 7200")
+            outbox._swept = 0.0
+            await outbox.enqueue(new_lead({"name": "Late", "email": "late@example.com"}, message="hi"))
+            while (await outbox.counts()).get("pending"):
+                await asyncio.sleep(0.02)
+            await worker.stop()
+        return recorder, counts, elapsed, await outbox.counts()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leads", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=5)
+    args = parser.parse_args()
+
+    recorder, counts, elapsed, swept = asyncio.run(_run(args.leads, args.batch_size))
+    delivered = sum(message.count("**New webchat lead**") for message in recorder.messages[:-1])
+    print(
+        f"{delivered}/{args.leads} leads in {len(recorder.messages) - 1} messages "
+        f"({recorder.requests} requests, {elapsed:.2f}s) outbox={counts}; after the sweep outbox={swept}"
+    )
+    failures = []
+    if delivered != args.leads or counts.get("delivered") != args.leads:
+        failures.append("leads were lost or duplicated")
+    if swept != {"delivered": 1}:
+        failures.append(f"delivered rows past retention were not swept: {swept}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: every lead delivered exactly once and old deliveries swept")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,143 @@
+"""Spike the chat API past its LLM capacity and check that it sheds load.
+
+The fake LLM answers after ``--latency`` seconds. With a small concurrency
+cap and queue, a burst of ``--users`` first turns must:
+
+* finish within two queue timeouts plus one turn, not queue without limit;
+* answer the excess with degraded replies (cached or static) instead of errors;
+* with degraded mode off, fail fast with 503 and a Retry-After header.
+
+It also checks the per-session token bucket returns 429 with Retry-After,
+and that retries of one ``Idempotency-Key`` replay without spending tokens.
+
+    python -m bench.overload --users 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.fakes import install_fake_llms
+
+CACHED_QUESTION = "What does the product do?"
+
+
+async def _spike(client: httpx.AsyncClient, users: int, tag: str) -> tuple[Counter[str], float]:
+    outcomes: Counter[str] = Counter()
+    slowest = 0.0
+
+    async def user(i: int) -> None:
+        nonlocal slowest
+        # Every other user repeats a question whose answer is already cached.
+        message = CACHED_QUESTION if i % 2 else f"Tell me about feature {i}"
+        start = time.perf_counter()
+        response = await client.post("/chat", json={"session_id": f"{tag}-{i}", "message": message})
+        slowest = max(slowest, time.perf_counter() - start)
+        if response.status_code != 200:
+            retry = "with Retry-After" if "retry-after" in response.headers else "without Retry-After"
+            outcomes[f"HTTP {response.status_code} {retry}"] += 1
+        elif response.json().get("degraded"):
+            outcomes["degraded"] += 1
+        else:
+            outcomes["answered"] += 1
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    return outcomes, slowest
+
+
+async def _run(args: argparse.Namespace) -> list[str]:
+    install_fake_llms(latency=args.latency)
+
+    from app.admission import get_llm_limiter, get_rate_limiter
+    from app.config import settings
+
+    settings.llm_max_concurrency = args.concurrency
+    settings.llm_queue_size = args.queue
+    settings.llm_queue_timeout_seconds = args.queue_timeout
+    get_llm_limiter.cache_clear()
+    from app.main import app
+
+    failures: list[str] = []
+    # A turn makes two LLM calls (router + answer), each of which may wait
+    # out the queue timeout before being shed.
+    budget = 2 * (args.queue_timeout + args.latency) + 0.5
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        warm = await client.post("/chat", json={"session_id": "warm", "message": CACHED_QUESTION})
+        warm.raise_for_status()
+
+        outcomes, slowest = await _spike(client, args.users, "degraded")
+        print(f"degraded mode: {dict(outcomes)}  slowest={slowest:.2f}s")
+        if set(outcomes) - {"answered", "degraded"}:
+            failures.append(f"errors with degraded mode on: {dict(outcomes)}")
+        if not outcomes["degraded"]:
+            failures.append("no turns were shed; raise --users or lower --concurrency")
+        if slowest > budget:
+            failures.append(f"slowest turn took {slowest:.2f}s, budget {budget:.2f}s")
+
+        settings.degraded_mode = False
+        outcomes, slowest = await _spike(client, args.users, "strict")
+        settings.degraded_mode = True
+        print(f"strict mode:   {dict(outcomes)}  slowest={slowest:.2f}s")
+        if not outcomes["HTTP 503 with Retry-After"]:
+            failures.append(f"expected 503 with Retry-After when degraded mode is off: {dict(outcomes)}")
+        if slowest > budget:
+            failures.append(f"slowest turn took {slowest:.2f}s, budget {budget:.2f}s")
+
+        settings.rate_limit_session_per_minute = 60
+        settings.rate_limit_session_burst = 3
+        get_rate_limiter.cache_clear()
+        statuses = Counter()
+        for i in range(6):
+            response = await client.post("/chat", json={"session_id": "chatty", "message": CACHED_QUESTION})
+            statuses[response.status_code] += 1
+            if response.status_code == 429 and "retry-after" not in response.headers:
+                failures.append("429 without Retry-After")
+        print(f"rate limit (burst 3): {dict(statuses)}")
+        if statuses[200] != 3 or statuses[429] != 3:
+            failures.append(f"expected 3 answers and 3 rejections, got {dict(statuses)}")
+
+        # Retries of one Idempotency-Key replay the answer without a token.
+        retried = Counter()
+        for i in range(6):
+            response = await client.post(
+                "/chat",
+                json={"session_id": "patient", "message": CACHED_QUESTION},
+                headers={"Idempotency-Key": "once"},
+            )
+            retried[response.status_code] += 1
+        print(f"idempotent retries (burst 3): {dict(retried)}")
+        if retried[200] != 6:
+            failures.append(f"idempotent retries were rate limited: {dict(retried)}")
+
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--queue-timeout", type=float, default=0.5)
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: overload is shed quickly and rate limits apply")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+"""Throughput and memory of ``python -m app.serve`` as the worker count grows.
+
+For each ``--workers`` count, starts the pre-forking server on a local port
+with the offline fake model and a shared SQLite session store, sends
+``--sessions`` concurrent conversations of ``--turns`` turns over HTTP and
+reports turns per second, latency, and the memory of the parent plus its
+workers: summed RSS, which counts shared pages once per process, and summed
+PSS, which splits them between the processes sharing them. The largest
+count is also run without ``gc.freeze`` for comparison. Checks:
+
+* every turn succeeds and every session holds all of its turns, whichever
+  worker answered them;
+* each worker beyond the first adds at most ``--max-worker-mib`` of PSS;
+* on a machine with spare cores, throughput grows with the worker count;
+* a request retried with one ``Idempotency-Key`` on fresh connections,
+  one after another and all at once, runs once whichever worker takes it;
+* with ``--metrics-port``, each worker serves its own ``/metrics`` (and only
+  that) with its ``worker`` label.
+
+    python -m bench.prefork --workers 1,2,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.loadtest import percentile
+
+_SERVER = """
+import sys
+import bench
+from bench.fakes import install_fake_llms
+from bench.loadtest import scenario_responder
+
+install_fake_llms(latency=float(sys.argv[1]), tool_responder=scenario_responder)
+from app.serve import main
+
+raise SystemExit(main(sys.argv[2:]))
+"""
+
+QUESTIONS = ("What does the product do?", "How do I reset my password?", "Which plans include SSO?")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid: int) -> list[int]:
+    path = Path(f"/proc/{pid}/task/{pid}/children")
+    return [int(child) for child in path.read_text().split()] if path.exists() else []
+
+
+def _memory_kib(pid: int) -> tuple[int, int]:
+    """(RSS, PSS) of ``pid`` in KiB."""
+    rss = pss = 0
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name == "Rss":
+            rss = int(value.split()[0])
+        elif name == "Pss":
+            pss = int(value.split()[0])
+    return rss, pss
+
+
+async def _wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if (await client.get("/knowledge")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+async def _conversation(client: httpx.AsyncClient, session_id: str, turns: int, latencies: list[float]) -> int:
+    failed = 0
+    for turn in range(turns):
+        start = time.perf_counter()
+        response = await client.post(
+            "/chat", json={"session_id": session_id, "message": QUESTIONS[turn % len(QUESTIONS)]}
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        failed += response.status_code != 200
+    return failed
+
+
+def _session_lengths(db_path: Path, pattern: str = "default:load-%") -> list[int]:
+    from app.sessions import load_state
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT data FROM sessions WHERE session_id LIKE ?", (pattern,)).fetchall()
+    return [len(load_state(data).get("messages") or ()) for (data,) in rows]
+
+
+async def _retry(base_url: str, session_id: str, key: str) -> tuple[int, str]:
+    # A fresh connection per request, so the retries spread over workers.
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        response = await client.post(
+            "/chat",
+            json={"session_id": session_id, "message": QUESTIONS[0]},
+            headers={"Idempotency-Key": key},
+        )
+    return response.status_code, response.text
+
+
+async def _shared_state(args: argparse.Namespace, workers: int, root: Path) -> list[str]:
+    """Check idempotency keys across workers and the per-worker metrics ports."""
+    port, metrics_port = _free_port(), _free_port()
+    db_path = root / "shared.sqlite3"
+    env = {
+        **os.environ,
+        "SESSION_BACKEND": "sqlite",
+        "SESSION_DB_PATH": str(db_path),
+        "OUTBOX_DB_PATH": str(root / "outbox.sqlite3"),
+        "KNOWLEDGE_POLL_SECONDS": "0",
+    }
+    command = [sys.executable, "-c", _SERVER, str(max(args.latency, 0.2)), "--host", "127.0.0.1"]
+    command += ["--port", str(port), "--workers", str(workers), "--metrics-port", str(metrics_port)]
+    command += ["--log-level", "warning"]
+    proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    failures: list[str] = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await _wait_ready(client, proc, args.ready_timeout)
+        replies = [await _retry(base_url, "retry-serial", "k1") for _ in range(workers * 4)]
+        replies += await asyncio.gather(*(_retry(base_url, "retry-burst", "k2") for _ in range(workers * 4)))
+        for status, _ in replies:
+            if status != 200:
+                failures.append(f"an idempotent retry failed with {status}")
+                break
+        serial, burst = replies[: workers * 4], replies[workers * 4 :]
+        if len({text for _, text in serial}) != 1 or len({text for _, text in burst}) != 1:
+            failures.append("retries of one idempotency key got different replies")
+
+        replayed = {}
+        async with httpx.AsyncClient(timeout=10) as client:
+            for index in range(workers):
+                url = f"http://127.0.0.1:{metrics_port + index}"
+                text = (await client.get(f"{url}/metrics")).text
+                samples = [line for line in text.splitlines() if line.startswith("chatbot_")]
+                if not samples or any(f'worker="{index}"' not in line for line in samples):
+                    failures.append(f"worker {index}'s metrics port does not label its samples worker={index}")
+                replayed[index] = sum(
+                    float(line.rsplit(" ", 1)[1])
+                    for line in samples
+                    if line.startswith("chatbot_idempotent_replays_total")
+                )
+                if (await client.get(f"{url}/knowledge")).status_code != 404:
+                    failures.append(f"worker {index}'s metrics port serves more than /metrics")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    lengths = _session_lengths(db_path, "default:retry-%")
+    print(f"idempotent retries: sessions hold {sorted(lengths)} messages; replays per worker {replayed}")
+    if sorted(lengths) != [2, 2]:
+        failures.append(f"retried turns ran more than once: sessions hold {sorted(lengths)} messages")
+    return failures
+
+
+async def _run_server(args: argparse.Namespace, workers: int, freeze: bool, root: Path) -> dict[str, Any]:
+    port = _free_port()
+    db_path = root / f"sessions-{workers}-{int(freeze)}.sqlite3"
+    env = {
+        **os.environ,
+        "SESSION_BACKEND": "sqlite",
+        "SESSION_DB_PATH": str(db_path),
+        "OUTBOX_DB_PATH": str(root / "outbox.sqlite3"),
+        "KNOWLEDGE_POLL_SECONDS": "0",
+    }
+    command = [sys.executable, "-c", _SERVER, str(args.latency), "--host", "127.0.0.1", "--port", str(port)]
+    command += ["--workers", str(workers), "--log-level", "warning"]
+    if not freeze:
+        command.append("--no-gc-freeze")
+    proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+            await _wait_ready(client, proc, args.ready_timeout)
+            # Give every worker a first request before measuring.
+            await asyncio.gather(*(_conversation(client, f"warm-{i}", 1, []) for i in range(workers * 4)))
+
+            latencies: list[float] = []
+            start = time.perf_counter()
+            failed = await asyncio.gather(
+                *(_conversation(client, f"load-{i}", args.turns, latencies) for i in range(args.sessions))
+            )
+            elapsed = time.perf_counter() - start
+
+        pids = _children(proc.pid)
+        memory = [_memory_kib(pid) for pid in (proc.pid, *pids)]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    lengths = _session_lengths(db_path)
+    return {
+        "workers": workers,
+        "freeze": freeze,
+        "processes": len(memory),
+        "turns_per_second": len(latencies) / elapsed,
+        "latencies": latencies,
+        "failed": sum(failed),
+        "rss_kib": sum(rss for rss, _ in memory),
+        "pss_kib": sum(pss for _, pss in memory),
+        "complete_sessions": sum(1 for n in lengths if n == 2 * args.turns),
+    }
+
+
+def _report(run: dict[str, Any]) -> None:
+    latencies = run["latencies"]
+    label = f"{run['workers']} worker{'s' if run['workers'] > 1 else ''}{'' if run['freeze'] else ', no freeze'}"
+    print(
+        f"{label:>22}: {run['turns_per_second']:7.1f} turns/s  p50={statistics.median(latencies):5.0f}ms  "
+        f"p95={percentile(latencies, 95):5.0f}ms  RSS={run['rss_kib'] / 1024:6.1f} MiB  "
+        f"PSS={run['pss_kib'] / 1024:6.1f} MiB  ({run['processes']} processes)"
+    )
+
+
+async def _run(args: argparse.Namespace, root: Path) -> list[str]:
+    counts = sorted({int(n) for n in args.workers.split(",")})
+    runs = []
+    for workers in counts:
+        runs.append(await _run_server(args, workers, True, root))
+        _report(runs[-1])
+    unfrozen = await _run_server(args, counts[-1], False, root)
+    _report(unfrozen)
+
+    failures = await _shared_state(args, max(counts[-1], 2), root)
+    for run in (*runs, unfrozen):
+        if run["failed"]:
+            failures.append(f"{run['workers']} workers: {run['failed']} failed turns")
+        if run["complete_sessions"] != args.sessions:
+            failures.append(
+                f"{run['workers']} workers: {run['complete_sessions']}/{args.sessions} sessions kept every turn"
+            )
+        if run["processes"] != run["workers"] + 1:
+            failures.append(f"{run['workers']} workers: found {run['processes'] - 1} worker processes")
+
+    first, last = runs[0], runs[-1]
+    if len(runs) > 1:
+        per_worker = (last["pss_kib"] - first["pss_kib"]) / (last["workers"] - first["workers"])
+        print(
+            f"each extra worker: {per_worker / 1024:.1f} MiB PSS, "
+            f"{(last['rss_kib'] - first['rss_kib']) / (last['workers'] - first['workers']) / 1024:.1f} MiB RSS"
+        )
+        if per_worker > args.max_worker_mib * 1024:
+            failures.append(f"each extra worker adds {per_worker / 1024:.1f} MiB PSS (limit {args.max_worker_mib})")
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        usable = min(last["workers"], cores)
+        speedup = last["turns_per_second"] / first["turns_per_second"]
+        print(f"throughput x{speedup:.2f} with {last['workers']} workers on {cores} cores")
+        if usable > 1 and speedup < 0.5 * usable:
+            failures.append(f"throughput only x{speedup:.2f} with {usable} usable cores")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--sessions", type=int, default=64, help="concurrent conversations")
+    parser.add_argument("--turns", type=int, default=3, help="turns per conversation")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency in seconds")
+    parser.add_argument("--max-worker-mib", type=float, default=64, help="PSS budget per extra worker")
+    parser.add_argument("--ready-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        failures = asyncio.run(_run(args, Path(root)))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: workers share the preloaded app and one session store")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""Check that prompts start with a stable, cacheable prefix.
+
+Drives several sessions through QA and lead capture turns with a fake
+model that records every prompt and imitates provider prefix caching.
+Checks that every node's prompt opens with the same static instructions
+on every call, regardless of session state, and reports the share of
+prompt tokens each node would have read from the provider's cache.
+
+    python -m bench.prompt_prefix --sessions 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from collections import defaultdict
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.fakes import install_fake_llms
+from bench.loadtest import scenario_responder
+
+
+def _script(session: int) -> list[str]:
+    questions = [f"How does the API handle webhooks for project {session * 10 + i}?" for i in range(6)]
+    return questions + [
+        "Can someone from sales contact me about a partnership?",
+        "We have about 50 people on the team",
+        f"Sure, I'm Sam, sam{session}@example.com",
+        "Yes, send it",
+    ]
+
+
+def _node_of(tool_choice: str | None, first: str) -> str:
+    if tool_choice:
+        return {"route_intent": "router", "lead_flow": "lead_capture"}.get(tool_choice, tool_choice)
+    return "compact_memory" if first.startswith("You maintain") else "qa"
+
+
+async def _run(sessions: int) -> list[str]:
+    model = install_fake_llms(
+        reply="Here is a detailed answer about how the product handles that. " * 15,
+        tool_responder=scenario_responder,
+        record_prompts=True,
+    )
+    from app.config import settings
+    from app.metrics import LLM_TOKENS
+
+    settings.qa_cache_enabled = False
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for session in range(sessions):
+            for message in _script(session):
+                response = await client.post("/chat", json={"session_id": f"p{session}", "message": message})
+                response.raise_for_status()
+
+    failures: list[str] = []
+    prefixes: dict[str, set[str]] = defaultdict(set)
+    calls: dict[str, int] = defaultdict(int)
+    for tool_choice, messages in model.prompts:
+        first = str(messages[0].content)
+        node = _node_of(tool_choice, first)
+        prefixes[node].add(first)
+        calls[node] += 1
+
+    for node in sorted(calls):
+        prompt = LLM_TOKENS.value(node=node, model="fake", kind="prompt")
+        cached = LLM_TOKENS.value(node=node, model="fake", kind="cached_prompt")
+        share = cached / prompt if prompt else 0.0
+        print(
+            f"{node:>15}: {calls[node]:>3} calls, {len(prefixes[node])} distinct opening message(s), "
+            f"{share:.0%} of prompt tokens cached"
+        )
+        if len(prefixes[node]) != 1:
+            failures.append(f"{node} prompts open with {len(prefixes[node])} different messages")
+    # Prompts under the provider's minimum (e.g. the router's) are never
+    # cached, but the long QA prompts should be.
+    if not LLM_TOKENS.value(node="qa", model="fake", kind="cached_prompt"):
+        failures.append("QA prompts never reused a cached prefix")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args.sessions))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: prompts share a stable prefix")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
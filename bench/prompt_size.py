@@ -0,0 +1,83 @@
+"""Check that per-turn prompt size stays constant as a chat gets longer.
+
+Drives one session through ``--turns`` QA turns with a fake model that
+records the size of every prompt it receives. With token-budgeted history
+and rolling summaries, prompts late in the conversation must be no larger
+than prompts once the window first fills up.
+
+The summary model answers after ``--summary-latency`` seconds while the
+others answer at once. Summaries are folded in the background, so no turn
+may take that long, and the session must still end up with a summary.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.fakes import FakeChatModel, install_fake_llms
+
+
+async def _run(turns: int, summary_latency: float) -> tuple[list[int], list[float], str]:
+    model = install_fake_llms(reply="Here is a detailed answer about the product. " * 8)
+    from app.nodes import memory
+
+    memory.summary_llm = FakeChatModel(latency=summary_latency, reply="The user asked what the product does.")
+    from app.main import FOLDS, SESSIONS, app
+    from app.tenants import default_tenant
+
+    per_turn: list[int] = []
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(turns):
+            before = len(model.prompt_chars)
+            start = time.perf_counter()
+            response = await client.post(
+                "/chat",
+                json={"session_id": "long", "message": f"Question {i % 10}: what does it do?"},
+            )
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            per_turn.append(max(model.prompt_chars[before:]))
+    await asyncio.gather(*FOLDS.values())
+    state = await SESSIONS.get(default_tenant().session_key("long"))
+    return per_turn, latencies, (state or {}).get("summary", "")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--summary-latency", type=float, default=0.3, help="seconds per summary call")
+    args = parser.parse_args()
+
+    sizes, latencies, summary = asyncio.run(_run(args.turns, args.summary_latency))
+    half = len(sizes) // 2
+    early, late = max(sizes[:half]), max(sizes[half:])
+    for turn in range(0, len(sizes), max(len(sizes) // 10, 1)):
+        print(f"turn {turn + 1:>4}: largest prompt {sizes[turn]:>6} chars")
+    print(f"max first half: {early}  max second half: {late}")
+    print(f"slowest turn: {max(latencies) * 1000:.0f}ms with {args.summary_latency * 1000:.0f}ms summary calls")
+    failures = []
+    if late > early:
+        failures.append("prompt size keeps growing with conversation length")
+    if max(latencies) >= args.summary_latency:
+        failures.append("a turn waited for the summary call")
+    if not summary:
+        failures.append("no summary was written to the session")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: prompt size is bounded and summaries are folded off the request path")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
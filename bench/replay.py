@@ -0,0 +1,122 @@
+"""Replay recorded conversations through ``/chat/batch``.
+
+Input is JSONL in the format ``app.batch.parse_batch`` accepts, e.g.
+``bench/data/replay_sessions.jsonl`` or ``bench/data/router_transcripts.jsonl``.
+Results are written as JSONL, one line per turn, with the reply, route,
+lead status and latency, plus the recorded reply when the input had one.
+A summary goes to stderr.
+
+By default the app runs in-process; ``--fake`` swaps in the fake model so
+no provider calls are made, and ``--url`` targets a running server
+instead (it needs ``BATCH_ENABLED=true``).
+
+    python -m bench.replay bench/data/replay_sessions.jsonl --fake -o results.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, TextIO
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.fakes import install_fake_llms
+from bench.loadtest import scenario_responder
+
+
+async def _replay(args: argparse.Namespace, payload: bytes, out: TextIO) -> tuple[list[dict[str, Any]], float]:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        if args.fake:
+            install_fake_llms(latency=args.latency, tool_responder=scenario_responder)
+        from app.config import settings
+
+        settings.batch_enabled = True
+        settings.batch_max_concurrency = max(settings.batch_max_concurrency, args.concurrency)
+        from app.main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+    results: list[dict[str, Any]] = []
+    start = time.perf_counter()
+    async with client:
+        async with client.stream(
+            "POST",
+            "/chat/batch",
+            params={"concurrency": args.concurrency},
+            content=payload,
+            headers={"Content-Type": "application/x-ndjson"},
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise SystemExit(f"/chat/batch returned {response.status_code}: {response.text}")
+            async for line in response.aiter_lines():
+                if line:
+                    out.write(line + "\n")
+                    results.append(json.loads(line))
+    return results, time.perf_counter() - start
+
+
+def _summarize(results: list[dict[str, Any]], elapsed: float) -> list[str]:
+    failures: list[str] = []
+    last_turn: dict[str, int] = {}
+    for result in results:
+        previous = last_turn.get(result["session_id"], -1)
+        if result["turn"] != previous + 1:
+            failures.append(f"session {result['session_id']}: turn {result['turn']} arrived after {previous}")
+        last_turn[result["session_id"]] = result["turn"]
+
+    errors = [r for r in results if "error" in r]
+    latencies = sorted(r["latency_ms"] for r in results)
+    routes = Counter(f"{r['route']}/{r['route_source']}" for r in results)
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else 0.0
+    print(
+        f"{len(last_turn)} sessions, {len(results)} turns in {elapsed:.2f}s "
+        f"({len(results) / elapsed if elapsed else 0:.1f} turns/s)  "
+        f"p50={statistics.median(latencies) if latencies else 0:.0f}ms p95={p95:.0f}ms  "
+        f"errors={len(errors)} degraded={sum(1 for r in results if r.get('degraded'))}",
+        file=sys.stderr,
+    )
+    print(f"routes: {dict(routes)}", file=sys.stderr)
+    failures.extend(f"session {r['session_id']} turn {r['turn']}: {r['status']} {r['error']}" for r in errors)
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", type=Path, help="JSONL sessions, or - for stdin")
+    parser.add_argument("-o", "--output", type=Path, help="where to write per-turn JSONL (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=16, help="sessions replayed at once")
+    parser.add_argument("--url", help="base URL of a running server instead of the in-process app")
+    parser.add_argument("--fake", action="store_true", help="answer with the offline fake model")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    args = parser.parse_args()
+
+    payload = sys.stdin.buffer.read() if str(args.input) == "-" else args.input.read_bytes()
+    out = args.output.open("w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        results, elapsed = asyncio.run(_replay(args, payload, out))
+    finally:
+        if args.output:
+            out.close()
+    failures = _summarize(results, elapsed)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print(f"OK: replayed {len(results)} turns", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+"""Check tail-latency controls: hedged requests, model fallback and deadlines.
+
+Runs three scenarios against the chat API with fake LLMs:
+
+* hedging: every ``--slow-every``-th call is ``--slow-factor`` times slower.
+  With hedging on, the slowest turn must stay well below one slow call,
+  and the cancelled loser of each won hedge is recorded as ``cancelled``.
+* fallback: the primary model always fails. Turns must still be answered
+  by the fallback model, and the primary's circuit breaker must open.
+* deadline: every call is slower than the turn deadline. The turn must
+  fail with 504 shortly after the deadline instead of waiting it out.
+
+    python -m bench.resilience --turns 150
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+
+from bench.fakes import install_fake_llms
+
+
+def _reset() -> None:
+    from app.resilience import _breakers, get_hedger
+
+    get_hedger.cache_clear()
+    _breakers.clear()
+
+
+async def _turns(client: httpx.AsyncClient, turns: int, tag: str) -> tuple[list[float], list[int]]:
+    latencies: list[float] = []
+    statuses: list[int] = []
+    for i in range(turns):
+        start = time.perf_counter()
+        # A new session per turn keeps the prompt and the QA cache out of the way.
+        response = await client.post("/chat", json={"session_id": f"{tag}-{i}", "message": f"Question {i}?"})
+        latencies.append(time.perf_counter() - start)
+        statuses.append(response.status_code)
+    return latencies, statuses
+
+
+def _p99(values: list[float]) -> float:
+    return statistics.quantiles(values, n=100)[98]
+
+
+async def _run(args: argparse.Namespace) -> list[str]:
+    model = install_fake_llms(
+        latency=args.latency, latency_jitter=0.5, slow_every=args.slow_every, slow_factor=args.slow_factor
+    )
+
+    from app.config import settings
+    from app.metrics import LLM_HEDGES, LLM_LATENCY, LLM_MODEL_FALLBACKS
+    from app.resilience import breaker_states
+
+    settings.qa_cache_enabled = False
+    # Keep jitter on normal calls (up to 1.5x latency) from triggering hedges.
+    settings.hedge_min_delay_seconds = 3 * args.latency
+    # A slow call every N calls needs a hedge budget above 1/N.
+    settings.hedge_max_ratio = 2 / args.slow_every
+    from app.main import app
+
+    failures: list[str] = []
+    slow = args.latency * args.slow_factor
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for enabled in (False, True):
+            settings.hedge_enabled = enabled
+            _reset()
+            before = LLM_HEDGES.value(node="qa", model="fake", outcome="won")
+            cancelled_before = LLM_LATENCY.count(node="qa", outcome="cancelled")
+            latencies, statuses = await _turns(client, args.turns, f"hedge-{enabled}")
+            won = LLM_HEDGES.value(node="qa", model="fake", outcome="won") - before
+            cancelled = LLM_LATENCY.count(node="qa", outcome="cancelled") - cancelled_before
+            label = "on " if enabled else "off"
+            print(
+                f"hedging {label}: p50={statistics.median(latencies) * 1000:.0f}ms "
+                f"p99={_p99(latencies) * 1000:.0f}ms max={max(latencies) * 1000:.0f}ms  qa hedges won={won:.0f}"
+            )
+            if any(status != 200 for status in statuses):
+                failures.append(f"hedging {label.strip()}: non-200 responses")
+            if enabled and max(latencies) >= slow:
+                failures.append(f"hedged turns still took up to {max(latencies):.2f}s (slow call {slow:.2f}s)")
+            if enabled and not won:
+                failures.append("no hedge ever won")
+            if enabled and cancelled < won:
+                failures.append(f"{won:.0f} hedges won but only {cancelled} calls were recorded as cancelled")
+
+        model.slow_every = 0
+        settings.llm_fallback_models = ["fake-backup"]
+        model.fail_models = {"fake"}
+        _reset()
+        latencies, statuses = await _turns(client, 20, "fallback")
+        fallbacks = sum(
+            LLM_MODEL_FALLBACKS.value(node=node, model="fake", reason="error") for node in ("router", "qa")
+        )
+        states = breaker_states()
+        print(f"fallback: statuses={set(statuses)} fallbacks={fallbacks:.0f} breakers={states}")
+        if any(status != 200 for status in statuses):
+            failures.append("turns failed even though a fallback model was healthy")
+        if states.get("fake") != "open":
+            failures.append("the failing model's circuit breaker did not open")
+        if fallbacks > 2 * settings.breaker_failure_threshold:
+            failures.append(f"{fallbacks:.0f} calls went to the failing model after its breaker opened")
+        model.fail_models = set()
+        settings.llm_fallback_models = []
+
+        settings.turn_deadline_seconds = args.deadline
+        model.latency = args.deadline * 3
+        _reset()
+        start = time.perf_counter()
+        response = await client.post("/chat", json={"session_id": "deadline", "message": "Anything?"})
+        elapsed = time.perf_counter() - start
+        print(f"deadline {args.deadline:.2f}s: HTTP {response.status_code} after {elapsed:.2f}s")
+        if response.status_code != 504:
+            failures.append(f"expected 504 past the deadline, got {response.status_code}")
+        if elapsed > args.deadline + 0.2:
+            failures.append(f"turn ran {elapsed:.2f}s past a {args.deadline:.2f}s deadline")
+
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--slow-every", type=int, default=40)
+    parser.add_argument("--slow-factor", type=float, default=25.0)
+    parser.add_argument("--deadline", type=float, default=0.5)
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: slow calls are hedged, failing models fall back and deadlines hold")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,106 @@
+"""Round-trip a session through every ``SESSION_BACKEND``.
+
+For each backend ``build_session_store`` accepts, writes a session holding
+a ``History``, a profile, a lead and a summary, reads it back, writes the
+next turn on top of what was read and reads that back, then deletes it.
+Every read must equal what was written, and a deleted session must be a
+miss.
+
+    python -m bench.session_backends
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from app.config import settings
+from app.history import History, Message
+from app.sessions import build_session_store
+from app.state import ChatState, new_lead
+
+BACKENDS = ("memory", "sqlite", "log", "checkpointer")
+
+
+def _first_turn() -> ChatState:
+    profile = {"name": "Sam", "email": "sam@example.com"}
+    return {
+        "messages": History([Message("human", "I'd like a demo."), Message("ai", "Sure, what's your name?")]),
+        "user_profile": profile,
+        "lead_status": "collecting",
+        "lead_step": "review",
+        "lead": new_lead(profile, message="I'd like a demo."),
+        "lead_attempts": {"email": 1},
+        "lead_message": "I'd like a demo.",
+    }
+
+
+def _next_turn(state: ChatState) -> ChatState:
+    return {
+        **state,
+        "messages": state["messages"].appended([Message("human", "yes"), Message("ai", "Sent, thanks!")]),
+        "lead_status": "sent",
+        "lead_step": "done",
+        "summary": "Sam asked for a demo.",
+        "summarized_upto": 2,
+    }
+
+
+def _same(a: ChatState | None, b: ChatState) -> bool:
+    return a is not None and {**a, "messages": list(a["messages"])} == {**b, "messages": list(b["messages"])}
+
+
+async def _round_trip(backend: str, root: str) -> list[str]:
+    settings.session_backend = backend
+    settings.session_db_path = os.path.join(root, f"{backend}.sqlite3")
+    store = build_session_store()
+    failures = []
+    try:
+        first = _first_turn()
+        await store.set("s1", first)
+        stored = await store.get("s1")
+        if not _same(stored, first):
+            failures.append(f"{backend}: first turn read back as {stored!r}")
+        second = _next_turn(stored or first)
+        await store.set("s1", second)
+        stored = await store.get("s1")
+        if not _same(stored, second):
+            failures.append(f"{backend}: second turn read back as {stored!r}")
+        await store.delete("s1")
+        if await store.get("s1") is not None:
+            failures.append(f"{backend}: a deleted session was still read back")
+    except Exception as exc:
+        failures.append(f"{backend}: {type(exc).__name__}: {exc}")
+    print(f"{backend:>12}: {'ok' if not failures else 'FAILED'}")
+    return failures
+
+
+async def _run(backends: list[str]) -> list[str]:
+    failures: list[str] = []
+    with tempfile.TemporaryDirectory() as root:
+        for backend in backends:
+            failures += await _round_trip(backend, root)
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated SESSION_BACKEND values")
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args.backends.split(",")))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: every session backend reads back what it wrote")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
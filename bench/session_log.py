@@ -0,0 +1,254 @@
+"""Bytes written per turn by the whole-state and turn-log session stores.
+
+Plays ``--sessions`` interleaved conversations of ``--turns`` turns against
+``SESSION_BACKEND=sqlite`` (every turn rewrites the session) and ``log``
+(every turn appends its changes; compaction folds the log into snapshots)
+the way ``/chat`` does: read the session, add a user and an assistant
+message, now and then change the profile, lead step or summary, write it
+back. Reports session bytes written per turn
+(``chatbot_session_write_bytes_total``: whole states, log records and
+snapshots) and bytes passed to ``write()`` (``wchar``, page-granular) as
+conversations get longer, then checks:
+
+* the log records written per turn do not grow with conversation length,
+  and compaction costs at most twice the log it folds, so the amortized
+  bytes per turn stay flat too;
+* a fresh store (no diff bases, as after a restart) reads every session
+  back exactly as written, and how long that rehydration takes;
+* a writer killed with SIGKILL mid-run leaves every session readable and
+  holding a whole number of turns, none older than its last reported one.
+
+    python -m bench.session_log --turns 400
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from app.history import History, Message
+from app.metrics import SESSION_WRITE_BYTES
+from app.sessions import SessionStore, SQLiteSessionStore, TurnLogSessionStore
+from app.state import ChatState
+
+# Turns are grouped into this many equal stages for the report.
+STAGES = 4
+
+_WRITER = """
+import asyncio, sys
+import bench
+from bench.session_log import play, open_store
+
+async def main():
+    store = open_store("log", sys.argv[1])
+    await play(store, sessions=int(sys.argv[2]), turns=10**9, on_turn=lambda turn: print(turn, flush=True))
+
+asyncio.run(main())
+"""
+
+
+def open_store(backend: str, path: str, compact_bytes: int = 16384) -> SessionStore:
+    limits: dict[str, Any] = {"ttl_seconds": 86400, "max_entries": 100_000}
+    if backend == "log":
+        return TurnLogSessionStore(path, compact_bytes=compact_bytes, **limits)
+    return SQLiteSessionStore(path, **limits)
+
+
+def _initial_state() -> ChatState:
+    return {
+        "messages": History(),
+        "user_profile": {},
+        "lead_status": "none",
+        "lead_step": "intro",
+        "lead_attempts": {},
+        "lead_message": "",
+    }
+
+
+def next_state(state: ChatState, turn: int) -> ChatState:
+    """``state`` after one more turn: two messages, sometimes a field change."""
+    state = {
+        **state,
+        "messages": state["messages"].appended(
+            [
+                Message("human", f"u{turn} Could you tell me more about plan {turn % 7} and its limits?"),
+                Message("ai", f"a{turn} " + "Plan details, limits and billing terms are covered here. " * 4),
+            ]
+        ),
+    }
+    if turn % 5 == 0:
+        state["user_profile"] = {**state["user_profile"], "company": f"Company {turn}"}
+    if turn % 7 == 0:
+        state["lead_step"] = "gather" if state["lead_step"] != "gather" else "review"
+    if turn % 25 == 0:
+        state["summary"] = f"Summary up to turn {turn}: " + "the user asked about plans and limits. " * 8
+        state["summarized_upto"] = 2 * turn - 8
+    return state
+
+
+def _wchar() -> int:
+    try:
+        with open("/proc/self/io") as fh:
+            return next(int(line.split()[1]) for line in fh if line.startswith("wchar:"))
+    except (OSError, StopIteration):
+        return 0
+
+
+KINDS = ("state", "log", "snapshot")
+
+
+def _written() -> list[float]:
+    return [SESSION_WRITE_BYTES.total(kind=kind) for kind in KINDS]
+
+
+async def play(
+    store: SessionStore,
+    *,
+    sessions: int,
+    turns: int,
+    on_turn: Any = None,
+    expected: dict[str, ChatState] | None = None,
+) -> list[list[float]]:
+    """Run interleaved conversations; returns bytes of each of ``KINDS`` and ``wchar`` per session turn."""
+    per_turn: list[list[float]] = []
+    for turn in range(1, turns + 1):
+        written, wchar = _written(), _wchar()
+        for s in range(sessions):
+            session_id = f"s{s}"
+            state = next_state(await store.get(session_id) or _initial_state(), turn)
+            await store.set(session_id, state)
+            if expected is not None:
+                expected[session_id] = state
+        after = [*_written(), _wchar()]
+        per_turn.append([(b - a) / sessions for a, b in zip([*written, wchar], after)])
+        if on_turn is not None:
+            on_turn(turn)
+    return per_turn
+
+
+def _stages(per_turn: list[list[float]]) -> list[list[float]]:
+    size = max(len(per_turn) // STAGES, 1)
+    chunks = [per_turn[i : i + size] for i in range(0, size * STAGES, size)]
+    return [[statistics.fmean(column) for column in zip(*chunk)] for chunk in chunks if chunk]
+
+
+def _same(a: ChatState, b: ChatState) -> bool:
+    return {**a, "messages": list(a["messages"])} == {**b, "messages": list(b["messages"])}
+
+
+async def _compare(args: argparse.Namespace, root: Path) -> list[str]:
+    failures: list[str] = []
+    results: dict[str, list[list[float]]] = {}
+    for backend in ("sqlite", "log"):
+        expected: dict[str, ChatState] = {}
+        path = str(root / f"{backend}.sqlite3")
+        store = open_store(backend, path, args.compact_bytes)
+        results[backend] = _stages(await play(store, sessions=args.sessions, turns=args.turns, expected=expected))
+
+        fresh = open_store(backend, path, args.compact_bytes)
+        timings = []
+        for session_id, state in expected.items():
+            start = time.perf_counter()
+            stored = await fresh.get(session_id)
+            timings.append((time.perf_counter() - start) * 1000)
+            if stored is None or not _same(stored, state):
+                failures.append(f"{backend}: {session_id} read back differently after {args.turns} turns")
+        print(
+            f"{backend:>6}: cold read of a {args.turns}-turn session p50={statistics.median(timings):.2f}ms "
+            f"max={max(timings):.2f}ms; file {Path(path).stat().st_size / 1024:.0f} KiB"
+        )
+
+    size = max(args.turns // STAGES, 1)
+    print(f"\nbytes written per session turn, by turn range ({args.sessions} sessions):")
+    print(f"{'turns':>12} | {'sqlite state':>12} {'wchar':>8} | {'log records':>11} {'snapshots':>9} {'wchar':>8}")
+    for i, (full, log) in enumerate(zip(results["sqlite"], results["log"])):
+        print(
+            f"{i * size + 1:>5}-{(i + 1) * size:<6} | {full[0]:>12.0f} {full[3]:>8.0f} | "
+            f"{log[1]:>11.0f} {log[2]:>9.0f} {log[3]:>8.0f}"
+        )
+
+    log_stages = results["log"]
+    records = [stage[1] for stage in log_stages]
+    snapshots = statistics.fmean(stage[2] for stage in log_stages)
+    print(
+        f"log store over all {args.turns} turns: {statistics.fmean(records) + snapshots:.0f} bytes per turn "
+        f"({snapshots:.0f} of them snapshots); whole-state store by the end: {results['sqlite'][-1][0]:.0f}"
+    )
+    if records[-1] > records[0] * args.max_growth:
+        failures.append(f"log records per turn grew from {records[0]:.0f} to {records[-1]:.0f} bytes")
+    # Each snapshot replaces a log at least its own size, so snapshots cost
+    # at most twice the records, plus each session's first snapshot.
+    if snapshots * args.turns > 2 * statistics.fmean(records) * args.turns + args.compact_bytes:
+        failures.append(
+            f"snapshots cost {snapshots:.0f} bytes per turn against {statistics.fmean(records):.0f} of records"
+        )
+    return failures
+
+
+def _crash(args: argparse.Namespace, root: Path) -> list[str]:
+    path = str(root / "crash.sqlite3")
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _WRITER, path, str(args.sessions)], stdout=subprocess.PIPE, text=True
+    )
+    last_turn = 0
+    deadline = time.monotonic() + args.crash_after
+    assert proc.stdout is not None
+    while time.monotonic() < deadline:
+        line = proc.stdout.readline()
+        if not line:
+            break
+        last_turn = int(line)
+    proc.send_signal(signal.SIGKILL)
+    proc.wait()
+
+    async def check() -> list[str]:
+        failures = []
+        store = open_store("log", path, args.compact_bytes)
+        for s in range(args.sessions):
+            state = await store.get(f"s{s}")
+            messages = list(state["messages"]) if state else []
+            turns = len(messages) // 2
+            replayed = _initial_state()
+            for turn in range(1, turns + 1):
+                replayed = next_state(replayed, turn)
+            if len(messages) % 2 or turns < last_turn or state is None or not _same(state, replayed):
+                failures.append(f"s{s} after the crash: {len(messages)} messages, last reported turn {last_turn}")
+        return failures
+
+    failures = asyncio.run(check())
+    print(f"\nkilled the writer after turn {last_turn}; every session read back whole: {not failures}")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--compact-bytes", type=int, default=16384, help="SESSION_LOG_COMPACT_BYTES")
+    parser.add_argument("--max-growth", type=float, default=1.5, help="allowed late/early bytes per turn")
+    parser.add_argument("--crash-after", type=float, default=3.0, help="seconds before killing the writer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        failures = asyncio.run(_compare(args, Path(root)))
+        failures += _crash(args, Path(root))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: turn log writes stay flat as conversations grow and survive a crash")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
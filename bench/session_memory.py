@@ -0,0 +1,110 @@
+"""Show that the in-process session store keeps memory flat.
+
+Writes ``--sessions`` synthetic conversations into a ``MemorySessionStore``
+with a fixed entry and byte cap and samples traced memory along the way.
+Once the cap is reached, memory must stop growing.
+
+Then plays one ``--long-turns`` conversation turn by turn: a write must
+cost no more late in the conversation than early on, and the size the
+store counts must stay close to the serialized size.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+from app.history import History, Message
+from app.sessions import MemorySessionStore, dump_state
+from app.state import ChatState
+
+
+def _synthetic_state(i: int, turns: int) -> ChatState:
+    messages = []
+    for t in range(turns):
+        messages.append(Message("human", f"Session {i} question {t}: what does the product cost?"))
+        messages.append(Message("ai", f"Answer {t}: pricing depends on seats and usage tier."))
+    return {
+        "messages": History(messages),
+        "user_profile": {"name": f"Visitor {i}"},
+        "lead_status": "none",
+    }
+
+
+async def _run(sessions: int, turns: int, max_entries: int, max_bytes: int) -> list[int]:
+    store = MemorySessionStore(ttl_seconds=3600, max_entries=max_entries, max_bytes=max_bytes)
+    samples: list[int] = []
+    step = max(sessions // 10, 1)
+    tracemalloc.start()
+    for i in range(sessions):
+        await store.set(f"s{i}", _synthetic_state(i, turns))
+        if (i + 1) % step == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append(current)
+            print(
+                f"{i + 1:>7} sessions  traced={current / 1e6:8.1f} MB  "
+                f"entries={len(store)}  evictions={store.stats.evictions}"
+            )
+    tracemalloc.stop()
+    return samples
+
+
+async def _long_session(turns: int) -> tuple[float, float, int, int]:
+    """Mean write time over the first and last tenth of turns, counted and serialized size."""
+    store = MemorySessionStore(ttl_seconds=3600, max_entries=10, max_bytes=1 << 40)
+    state = _synthetic_state(0, 0)
+    timings: list[float] = []
+    for t in range(turns):
+        turn = [Message("human", f"Question {t}: what does the product cost?"), Message("ai", "It depends. " * 20)]
+        state = {**state, "messages": state["messages"].appended(turn)}
+        start = time.perf_counter()
+        await store.set("long", state)
+        timings.append(time.perf_counter() - start)
+    tenth = max(turns // 10, 1)
+    return (
+        sum(timings[:tenth]) / tenth,
+        sum(timings[-tenth:]) / tenth,
+        store.total_bytes,
+        len(dump_state(state)),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--max-entries", type=int, default=2_000)
+    parser.add_argument("--max-bytes", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--long-turns", type=int, default=2_000)
+    args = parser.parse_args()
+
+    samples = asyncio.run(_run(args.sessions, args.turns, args.max_entries, args.max_bytes))
+    early, late, counted, serialized = asyncio.run(_long_session(args.long_turns))
+    print(
+        f"{args.long_turns}-turn session: write {early * 1e6:.1f}us early, {late * 1e6:.1f}us late; "
+        f"counted {counted} bytes, serialized {serialized}"
+    )
+    failures = []
+    # Compare the tail against the first sample taken after the cap was hit.
+    baseline, final = samples[1], samples[-1]
+    if final > baseline * 1.10:
+        failures.append(f"memory grew from {baseline} to {final} bytes")
+    if late > early * 2:
+        failures.append("a session write gets slower as the conversation grows")
+    if abs(counted - serialized) > serialized * 0.1:
+        failures.append(f"counted {counted} bytes for a {serialized}-byte session")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: memory is flat once the store is full and writes cost the same in long sessions")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+"""Stress one session from many concurrent tasks.
+
+Checks that:
+
+* ``--tasks`` simultaneous turns for one session all land in its history,
+  each question directly followed by its own answer (no lost updates, no
+  interleaving);
+* the same number of simultaneous retries sharing an ``Idempotency-Key``
+  run the graph once and all get the same reply, and a later retry is
+  answered from the stored result;
+* reusing a key for a different message is rejected.
+
+The fake LLM echoes part of the question, and its latency jitter makes
+turns finish out of order if nothing serializes them.
+
+    python -m bench.session_ordering --tasks 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from typing import Any
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+from langchain_core.messages import BaseMessage
+
+from bench.fakes import install_fake_llms
+
+
+def _echo(messages: list[BaseMessage]) -> str:
+    """Reply quoting the ``#n`` tag of the question being answered."""
+    for message in reversed(messages):
+        text = str(message.content)
+        if "#" in text:
+            return "answer to " + text[text.rindex("#") :].split()[0].rstrip("?'\".")
+    return "answer"
+
+
+async def _post(client: httpx.AsyncClient, session_id: str, message: str, key: str | None = None) -> httpx.Response:
+    headers = {"Idempotency-Key": key} if key else {}
+    return await client.post("/chat", json={"session_id": session_id, "message": message}, headers=headers)
+
+
+async def _run(tasks: int, latency: float) -> list[str]:
+    model = install_fake_llms(latency=latency, latency_jitter=1.0, reply=_echo)
+
+    from app.config import settings
+
+    # Every turn must reach the model so call counts are meaningful.
+    settings.qa_cache_enabled = False
+    from app.main import SESSIONS, app
+    from app.tenants import default_tenant
+
+    failures: list[str] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Ordering: many turns for one session at once.
+        questions = [f"How does the API work? #{i}" for i in range(tasks)]
+        responses = await asyncio.gather(*(_post(client, "hammer", q) for q in questions))
+        failures += [f"turn failed: HTTP {r.status_code}" for r in responses if r.status_code != 200]
+
+        state: dict[str, Any] = await SESSIONS.get(default_tenant().session_key("hammer")) or {}
+        messages = state.get("messages") or []
+        if len(messages) != 2 * tasks:
+            failures.append(f"history has {len(messages)} messages, expected {2 * tasks}")
+        seen = set()
+        for question, answer in zip(messages[::2], messages[1::2]):
+            tag = str(question.content).rsplit("#", 1)[-1]
+            seen.add(tag)
+            if question.type != "human" or answer.type != "ai" or str(answer.content) != f"answer to #{tag}":
+                failures.append(f"turn #{tag} interleaved: {question.content!r} -> {answer.content!r}")
+                break
+        if len(seen) != tasks:
+            failures.append(f"{tasks - len(seen)} questions missing from history")
+        print(f"ordering: {tasks} concurrent turns -> {len(messages)} messages in history")
+
+        # Idempotency: simultaneous retries of one request.
+        calls = model.calls
+        await _post(client, "probe", "How does the API work? #probe")
+        per_turn = model.calls - calls
+
+        calls = model.calls
+        retries = await asyncio.gather(
+            *(_post(client, "retry", "How does the API work? #r", key="k1") for _ in range(tasks))
+        )
+        replies = {r.json()["reply"] for r in retries if r.status_code == 200}
+        in_flight_calls = model.calls - calls
+        if len(replies) != 1 or any(r.status_code != 200 for r in retries):
+            failures.append(f"retries disagreed: {sorted(replies)}")
+        if in_flight_calls != per_turn:
+            failures.append(f"{tasks} retries made {in_flight_calls} LLM calls, one turn makes {per_turn}")
+
+        calls = model.calls
+        late = await _post(client, "retry", "How does the API work? #r", key="k1")
+        if model.calls != calls or late.json().get("reply") not in replies:
+            failures.append("a retry after completion re-ran the turn")
+        stored: dict[str, Any] = await SESSIONS.get(default_tenant().session_key("retry")) or {}
+        if len(stored.get("messages") or []) != 2:
+            failures.append(f"retried session has {len(stored.get('messages') or [])} messages, expected 2")
+
+        mismatch = await _post(client, "retry", "Something else entirely", key="k1")
+        if mismatch.status_code != 422:
+            failures.append(f"key reuse with a new message returned HTTP {mismatch.status_code}")
+        print(f"idempotency: {tasks} retries -> {in_flight_calls} LLM calls (one turn = {per_turn})")
+
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    failures = asyncio.run(_run(args.tasks, args.latency))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: turns are serialized per session and retries are coalesced")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
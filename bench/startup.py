@@ -0,0 +1,101 @@
+"""Measure cold start: import time of ``app.main`` and warm-up time.
+
+Each run starts a fresh interpreter. Reports the median time to import
+``app.main`` and to finish ``warm_up()`` (knowledge index, chat models,
+compiled graph), and a ``-X importtime`` breakdown of the heaviest
+imports. Fails if importing the app is over ``--import-budget``, if
+import plus warm-up is over ``--ready-budget``, or if a module that should
+only load on first use is imported eagerly.
+
+    python -m bench.startup --runs 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Only needed once a model or client is built, never at import.
+DEFERRED_MODULES = ("langchain_openai", "openai")
+
+# Runs in a fresh interpreter; the last stdout line is the JSON result.
+_PROBE = """
+import asyncio, json, sys, time
+import bench
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+eager = [m for m in DEFERRED if m in sys.modules]
+asyncio.run(app.main.warm_up())
+ready = time.perf_counter() - start
+print(json.dumps({"imported": imported, "ready": ready, "eager": eager}))
+"""
+
+
+def _probe() -> dict:
+    code = f"DEFERRED = {DEFERRED_MODULES!r}\n{_PROBE}"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _importtime_breakdown(top: int) -> list[tuple[str, float]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bench, app.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Cumulative time per top-level package, counted at its outermost import.
+    totals: dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        package = module if module.startswith("app.") else module.split(".")[0]
+        if depth == 1 or (module.startswith("app.") and module != "app.main"):
+            totals[package] = max(totals[package], int(cumulative) / 1e6)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--import-budget", type=float, default=2.0, help="seconds to import app.main")
+    parser.add_argument("--ready-budget", type=float, default=4.0, help="seconds to import and warm up")
+    args = parser.parse_args()
+
+    probes = [_probe() for _ in range(args.runs)]
+    imported = statistics.median(p["imported"] for p in probes)
+    ready = statistics.median(p["ready"] for p in probes)
+    eager = sorted({m for p in probes for m in p["eager"]})
+
+    print("heaviest imports (cumulative, -X importtime):")
+    for module, seconds in _importtime_breakdown(args.top):
+        print(f"  {seconds * 1000:8.1f}ms  {module}")
+    print(f"import app.main: {imported:.2f}s (budget {args.import_budget:.2f}s)")
+    print(f"ready after warm-up: {ready:.2f}s (budget {args.ready_budget:.2f}s)")
+
+    failures = []
+    if eager:
+        failures.append(f"imported before first use: {', '.join(eager)}")
+    if imported > args.import_budget:
+        failures.append(f"import took {imported:.2f}s")
+    if ready > args.ready_budget:
+        failures.append(f"startup took {ready:.2f}s")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: startup is within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
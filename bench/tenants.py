@@ -0,0 +1,211 @@
+"""Serve hundreds of tenants from one worker and measure RSS per tenant.
+
+Generates ``--tenants`` tenant folders (``--files`` knowledge documents
+each, a ``tenant.json`` with instructions and a lead webhook) and sends one
+``/t/<tenant>/chat`` turn to every tenant with the fake model. Reports the
+RSS growth per loaded tenant and the cold first-turn latency, and checks:
+
+* replies only use the tenant's own knowledge and instructions;
+* the same session id under two tenants gives two separate sessions, and
+  a default-tenant session id shaped like ``<tenant>:<id>`` (or holding a
+  control character) never reaches that tenant's session;
+* a lead is queued for its tenant's webhook;
+* every tenant runs on the one compiled graph;
+* with ``TENANT_MAX_LOADED`` below the tenant count, old knowledge bases
+  are evicted and the loaded count stays bounded;
+* two tenants with the same knowledge and model but different
+  instructions never get each other's cached answers;
+* an unknown tenant gets 404, and one with a broken ``tenant.json`` 503.
+
+    python -m bench.tenants --tenants 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import bench  # noqa: F401  (sets offline environment defaults)
+
+import httpx
+from langchain_core.messages import BaseMessage
+
+from bench.fakes import install_fake_llms
+from bench.loadtest import percentile, rss_bytes, scenario_responder
+
+_MARKER_RE = re.compile(r"(?:company|marker)-t\d+")
+
+
+def _tenant_id(i: int) -> str:
+    return f"t{i:04d}"
+
+
+def _echo_markers(messages: list[BaseMessage]) -> str:
+    # Echo which tenant's instructions and knowledge the prompt carried.
+    found = _MARKER_RE.findall(" ".join(str(m.content) for m in messages if m.type == "system"))
+    return " ".join(sorted(set(found))) or "no markers"
+
+
+def _write_tenants(root: Path, tenants: int, files: int) -> None:
+    for i in range(tenants):
+        tenant_id = _tenant_id(i)
+        knowledge = root / tenant_id / "knowledge"
+        knowledge.mkdir(parents=True)
+        for f in range(files):
+            sections = "\n\n".join(
+                f"## Topic {s}\n\n" + f"Plan {s} of marker-{tenant_id} covers setup, billing and limits. " * 10
+                for s in range(4)
+            )
+            (knowledge / f"doc{f}.md").write_text(f"# Product {f}\n\n{sections}\n", encoding="utf-8")
+        config = {
+            "instructions": f"You represent company-{tenant_id}.",
+            "lead_webhook_url": f"http://hooks.invalid/{tenant_id}",
+        }
+        (root / tenant_id / "tenant.json").write_text(json.dumps(config), encoding="utf-8")
+
+
+async def _turn(client: httpx.AsyncClient, tenant_id: str, session_id: str, message: str) -> httpx.Response:
+    return await client.post(f"/t/{tenant_id}/chat", json={"session_id": session_id, "message": message})
+
+
+async def _run(args: argparse.Namespace, root: Path) -> list[str]:
+    tenants_dir = root / "tenants"
+    _write_tenants(tenants_dir, args.tenants + args.evict_extra, args.files)
+    (root / "knowledge").mkdir()
+    (root / "knowledge" / "about.md").write_text("# About\n\nThe default site.\n", encoding="utf-8")
+    os.environ.update(
+        TENANTS_DIR=str(tenants_dir),
+        TENANT_MAX_LOADED=str(args.tenants),
+        KNOWLEDGE_DIR=str(root / "knowledge"),
+        KNOWLEDGE_INDEX_DIR=str(root / "index"),
+        KNOWLEDGE_POLL_SECONDS="0",
+        OUTBOX_DB_PATH=str(root / "outbox.sqlite3"),
+    )
+    install_fake_llms(reply=_echo_markers, tool_responder=scenario_responder)
+
+    from app.graph import get_graph
+    from app.main import SESSIONS, app, warm_up
+    from app.tenants import get_tenants
+
+    failures: list[str] = []
+    await warm_up()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/chat", json={"session_id": "warm", "message": "What does the product do?"})
+        gc.collect()
+        before = rss_bytes()
+
+        cold: list[float] = []
+        for i in range(args.tenants):
+            tenant_id = _tenant_id(i)
+            start = time.perf_counter()
+            response = await _turn(client, tenant_id, "s1", "What does the plan cover?")
+            cold.append((time.perf_counter() - start) * 1000)
+            reply = response.json().get("reply", "")
+            if response.status_code != 200 or reply != f"company-{tenant_id} marker-{tenant_id}":
+                failures.append(f"{tenant_id}: unexpected reply {response.status_code} {reply!r}")
+        gc.collect()
+        per_tenant = (rss_bytes() - before) / args.tenants
+        print(
+            f"{args.tenants} tenants loaded: {per_tenant / 1024:.0f} KiB RSS per tenant, "
+            f"first turn p50={statistics.median(cold):.0f}ms p95={percentile(cold, 95):.0f}ms"
+        )
+        if per_tenant > args.max_kib_per_tenant * 1024:
+            failures.append(f"{per_tenant / 1024:.0f} KiB per tenant (limit {args.max_kib_per_tenant} KiB)")
+
+        # Same session id, header instead of path prefix: separate sessions.
+        response = await client.post(
+            "/chat", json={"session_id": "s1", "message": "And billing?"}, headers={"X-Tenant-ID": _tenant_id(1)}
+        )
+        ones = len((await SESSIONS.get(f"{_tenant_id(1)}:s1") or {}).get("messages") or [])
+        twos = len((await SESSIONS.get(f"{_tenant_id(2)}:s1") or {}).get("messages") or [])
+        if response.status_code != 200 or (ones, twos) != (4, 2):
+            failures.append(f"sessions are not isolated per tenant: {ones} and {twos} messages")
+        response = await client.post("/chat", json={"session_id": f"{_tenant_id(1)}:s1", "message": "Hi"})
+        ones = len((await SESSIONS.get(f"{_tenant_id(1)}:s1") or {}).get("messages") or [])
+        if response.status_code != 200 or ones != 4:
+            failures.append(f"a default-tenant session id reached {_tenant_id(1)}'s session")
+        response = await client.post("/chat", json={"session_id": "s1\x1fx", "message": "Hi"})
+        if response.status_code != 422:
+            failures.append(f"a session id with a control character got {response.status_code}")
+
+        lead_tenant = _tenant_id(3)
+        for message in ("Can I book a demo?", "I'm Sam, sam@example.com", "Yes, send it"):
+            response = await _turn(client, lead_tenant, "lead", message)
+        with sqlite3.connect(root / "outbox.sqlite3") as conn:
+            destinations = [row[0] for row in conn.execute("SELECT webhook_url FROM outbox")]
+        if destinations != [f"http://hooks.invalid/{lead_tenant}"]:
+            failures.append(f"lead went to {destinations}")
+
+        if get_graph.cache_info().currsize != 1:
+            failures.append(f"{get_graph.cache_info().currsize} compiled graphs")
+
+        registry = get_tenants()
+        registry.max_loaded = args.tenants // 4
+        for i in range(args.tenants, args.tenants + args.evict_extra):
+            await _turn(client, _tenant_id(i), "s1", "What does the plan cover?")
+        print(
+            f"after {args.evict_extra} more tenants with TENANT_MAX_LOADED={registry.max_loaded}: "
+            f"{registry.loaded} loaded"
+        )
+        if registry.loaded > registry.max_loaded:
+            failures.append(f"{registry.loaded} tenants loaded, limit {registry.max_loaded}")
+        evicted = await _turn(client, _tenant_id(0), "s1", "What does the plan cover?")
+        if evicted.json().get("reply") != f"company-{_tenant_id(0)} marker-{_tenant_id(0)}":
+            failures.append("an evicted tenant did not reload")
+
+        # Same knowledge and model, different instructions: separate cache entries.
+        twins = [_tenant_id(9998), _tenant_id(9999)]
+        for tenant_id in twins:
+            (tenants_dir / tenant_id / "knowledge").mkdir(parents=True)
+            (tenants_dir / tenant_id / "knowledge" / "plans.md").write_text("# Plans\n\nOne plan.\n", encoding="utf-8")
+            config = {"instructions": f"You represent company-{tenant_id}."}
+            (tenants_dir / tenant_id / "tenant.json").write_text(json.dumps(config), encoding="utf-8")
+        for tenant_id in twins:
+            reply = (await _turn(client, tenant_id, "twin", "What plans are there?")).json().get("reply")
+            if reply != f"company-{tenant_id}":
+                failures.append(f"{tenant_id} got another tenant's cached answer: {reply!r}")
+
+        unknown = await _turn(client, "nope", "s1", "hello")
+        if unknown.status_code != 404:
+            failures.append(f"unknown tenant got {unknown.status_code}")
+        broken = tenants_dir / "broken"
+        (broken / "knowledge").mkdir(parents=True)
+        (broken / "tenant.json").write_text("{not json", encoding="utf-8")
+        response = await _turn(client, "broken", "s1", "hello")
+        if response.status_code != 503:
+            failures.append(f"tenant with a broken tenant.json got {response.status_code}")
+        await registry.close()
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=300)
+    parser.add_argument("--files", type=int, default=4, help="knowledge documents per tenant")
+    parser.add_argument("--evict-extra", type=int, default=50, help="tenants served after lowering the LRU size")
+    parser.add_argument("--max-kib-per-tenant", type=float, default=512)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        failures = asyncio.run(_run(args, Path(root)))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    if failures:
+        return 1
+    print("OK: tenants share one graph, stay isolated and are loaded and evicted on demand")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())